@@ -0,0 +1,241 @@
+import crypto from "crypto";
+import type { Pool } from "pg";
+
+// アップロードされた録音の解析ジョブの順番待ち
+// - 同時に走らせる解析は ANALYSIS_CONCURRENCY 件まで（既定は解析ワーカーの数 ANALYZER_WORKERS と同じ）
+//   残りはここで待たせるので、ワーカーの待ち行列に解析が溜まらず、画面表示の読み込み（read_pickle など）が後回しにならない
+// - 待ち行列は団体ごとに分け、団体を順番に回して 1 件ずつ取り出す（1 団体が一斉にアップロードしても他の団体を待たせない）
+// - 待ちが ANALYSIS_QUEUE_MAX 件に達したら新しいジョブを受け付けない（アップロードは 503 を返す）
+// - ジョブの状態（queued → running → done / failed）は analysis_jobs テーブル（index.ts で作成）にも書く
+//   メモリからは終わってから ANALYSIS_JOB_TTL_MS 経ったら消し、その後はテーブルから読む（解析結果そのものは .cols）
+//   サーバーを再起動したら、queued / running のまま残っているジョブを順番待ちに入れ直す（restoreAnalysisJobs）
+
+export type AnalysisJobState = "queued" | "running" | "done" | "failed";
+
+export type AnalysisJob = {
+  id: string;
+  soundId: number;
+  organization: string;
+  userId: number | null;
+  state: AnalysisJobState;
+  engine: string;
+  // 解析の品質プリセット。null なら順番が来たときに選ぶ（run が選んだものを入れる）
+  preset: string | null;
+  createdAt: number;
+  startedAt: number | null;
+  finishedAt: number | null;
+  // done の結果（メモリにあるときだけ。テーブルから読んだジョブは null なので .cols から読む）
+  result: unknown;
+  error: string | null;
+};
+
+// 順番が来たジョブを解析する関数。戻り値がジョブの結果になる（例外なら failed）
+export type AnalysisJobRunner = (job: AnalysisJob) => Promise<unknown>;
+
+const CONCURRENCY = Math.max(
+  1,
+  parseInt(process.env.ANALYSIS_CONCURRENCY ?? process.env.ANALYZER_WORKERS ?? "2", 10) || 2
+);
+const QUEUE_MAX = Math.max(1, parseInt(process.env.ANALYSIS_QUEUE_MAX ?? "100", 10) || 100);
+const JOB_TTL_MS = parseInt(process.env.ANALYSIS_JOB_TTL_MS ?? "600000", 10) || 600000;
+
+const jobs = new Map<string, AnalysisJob>();
+// 団体ごとの待ち行列。Map は追加した順に回るので、取り出した団体は末尾に付け直す
+const queues = new Map<string, AnalysisJob[]>();
+let queued = 0;
+let running = 0;
+
+let store: Pool | null = null;
+let runner: AnalysisJobRunner | null = null;
+// ジョブごとの書き込み（前の書き込みが終わってから次を書く）
+const saving = new Map<string, Promise<void>>();
+
+// 保存先とジョブを解析する関数を登録する（recordings.ts が読み込み時に呼ぶ）
+export function setAnalysisJobStore(pool: Pool, run: AnalysisJobRunner) {
+  store = pool;
+  runner = run;
+}
+
+function save(job: AnalysisJob) {
+  if (!store) return;
+  const db = store;
+  const toDate = (ms: number | null) => (ms === null ? null : new Date(ms));
+  const next = (saving.get(job.id) ?? Promise.resolve())
+    .then(() => db.query(`
+      INSERT INTO analysis_jobs (id, soundId, organization, userId, state, engine, preset, error, createdAt, startedAt, finishedAt)
+      VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
+      ON CONFLICT (id) DO UPDATE SET state = EXCLUDED.state, preset = EXCLUDED.preset, error = EXCLUDED.error,
+        startedAt = EXCLUDED.startedAt, finishedAt = EXCLUDED.finishedAt
+    `, [job.id, job.soundId, job.organization, job.userId, job.state, job.engine, job.preset, job.error,
+        toDate(job.createdAt), toDate(job.startedAt), toDate(job.finishedAt)]))
+    .then(() => undefined, (err) => console.error(`[analysisJobs] ジョブ ${job.id} を保存できません:`, err));
+  saving.set(job.id, next);
+  next.then(() => {
+    if (saving.get(job.id) === next) saving.delete(job.id);
+  });
+}
+
+function fromRow(row: any): AnalysisJob {
+  const ms = (d: Date | null) => (d ? new Date(d).getTime() : null);
+  return {
+    id: row.id,
+    soundId: row.soundid,
+    organization: row.organization,
+    userId: row.userid,
+    state: row.state,
+    engine: row.engine,
+    preset: row.preset,
+    createdAt: ms(row.createdat)!,
+    startedAt: ms(row.startedat),
+    finishedAt: ms(row.finishedat),
+    result: null,
+    error: row.error,
+  };
+}
+
+function enqueue(job: AnalysisJob) {
+  jobs.set(job.id, job);
+  const entries = queues.get(job.organization);
+  if (entries) {
+    entries.push(job);
+  } else {
+    queues.set(job.organization, [job]);
+  }
+  queued++;
+}
+
+function dispatch() {
+  while (running < CONCURRENCY) {
+    const next = queues.entries().next();
+    if (next.done) return;
+    const [organization, entries] = next.value;
+    const job = entries.shift()!;
+    queues.delete(organization);
+    if (entries.length > 0) queues.set(organization, entries);
+    queued--;
+    running++;
+    start(job);
+  }
+}
+
+function start(job: AnalysisJob) {
+  job.state = "running";
+  job.startedAt = Date.now();
+  save(job);
+  Promise.resolve()
+    .then(() => {
+      if (!runner) throw new Error("analysis job runner is not set");
+      return runner(job);
+    })
+    .then((result) => {
+      job.state = "done";
+      job.result = result;
+    })
+    .catch((err) => {
+      job.state = "failed";
+      job.error = err instanceof Error ? err.message : String(err);
+    })
+    .finally(() => {
+      job.finishedAt = Date.now();
+      save(job);
+      running--;
+      setTimeout(() => jobs.delete(job.id), JOB_TTL_MS).unref();
+      dispatch();
+    });
+}
+
+// 待ちが上限に達しているか（アップロードを受け付ける前に確認する）
+export function analysisQueueFull(): boolean {
+  return queued >= QUEUE_MAX;
+}
+
+// 録音 soundId の解析ジョブを待ち行列に入れる
+export function submitAnalysisJob(spec: {
+  soundId: number; organization: string; userId: number | null; engine: string; preset: string | null;
+}): AnalysisJob {
+  const job: AnalysisJob = {
+    id: crypto.randomUUID(),
+    ...spec,
+    state: "queued",
+    createdAt: Date.now(),
+    startedAt: null,
+    finishedAt: null,
+    result: null,
+    error: null,
+  };
+  enqueue(job);
+  save(job);
+  dispatch();
+  return job;
+}
+
+// サーバーの起動時に、queued / running のまま残っているジョブを作った順に順番待ちに入れ直す（入れ直した件数を返す）
+export async function restoreAnalysisJobs(): Promise<number> {
+  if (!store) return 0;
+  const { rows } = await store.query(
+    "SELECT * FROM analysis_jobs WHERE state IN ('queued', 'running') ORDER BY createdAt"
+  );
+  for (const row of rows) {
+    if (jobs.has(row.id)) continue;
+    const job = fromRow(row);
+    job.state = "queued";
+    job.startedAt = null;
+    enqueue(job);
+    save(job);
+  }
+  dispatch();
+  return rows.length;
+}
+
+// メモリにあるジョブ（終わってから ANALYSIS_JOB_TTL_MS 以内）
+export function getAnalysisJob(id: string): AnalysisJob | undefined {
+  return jobs.get(id);
+}
+
+// メモリに無ければテーブルから読む（done の結果は入っていない）
+export async function findAnalysisJob(id: string): Promise<AnalysisJob | undefined> {
+  const job = jobs.get(id);
+  if (job || !store) return job;
+  const { rows } = await store.query("SELECT * FROM analysis_jobs WHERE id = $1", [id]);
+  return rows[0] ? fromRow(rows[0]) : undefined;
+}
+
+// 録音 soundId の最後のジョブ
+// テーブルで queued / running のままでもメモリに無いもの（入れ直す前に失われた）は返さない
+export async function latestAnalysisJob(soundId: number): Promise<AnalysisJob | undefined> {
+  let latest: AnalysisJob | undefined;
+  for (const job of jobs.values()) {
+    if (job.soundId === soundId && (!latest || job.createdAt >= latest.createdAt)) latest = job;
+  }
+  if (latest || !store) return latest;
+  const { rows } = await store.query(
+    "SELECT * FROM analysis_jobs WHERE soundId = $1 ORDER BY createdAt DESC LIMIT 1", [soundId]
+  );
+  const job = rows[0] ? fromRow(rows[0]) : undefined;
+  return job && (job.state === "done" || job.state === "failed") ? job : undefined;
+}
+
+// 待っているジョブが何番目に始まるか（1 から。待っていなければ 0）
+// 団体を順番に回すので、同じ団体で前に i 件あれば、各団体から最大 i 件と、回る順で前にある団体の 1 件が先に始まる
+export function analysisQueuePosition(job: AnalysisJob): number {
+  if (job.state !== "queued") return 0;
+  const own = queues.get(job.organization) ?? [];
+  const i = own.findIndex((e) => e.id === job.id);
+  if (i < 0) return 0;
+  let ahead = 0;
+  let before = true;
+  for (const [organization, entries] of queues) {
+    if (organization === job.organization) {
+      before = false;
+      ahead += i;
+      continue;
+    }
+    ahead += Math.min(entries.length, i) + (before && entries.length > i ? 1 : 0);
+  }
+  return ahead + 1;
+}
+
+// 順番待ちの解析ジョブの数（混み具合に応じてプリセットを選ぶのに使う）
+export function queuedAnalysisJobs(): number {
+  return queued;
+}
@@ -1,21 +1,32 @@
 import os
 import sys
 import json
-import pickle
 import numpy as np
-import librosa
-import joblib
-from scipy.stats import skew, kurtosis
-from sklearn.preprocessing import StandardScaler
+from feature_engine import extract_framewise_features
+from window_stats import compute_window_stats
+from model_bundle import ModelBundle
+import model_bundle
+import feature_subset
+import pitch_engine
+import presets
+import metrics
+import result_cache
+from artifact import artifact_path, load_analysis, save_analysis
+from pitch_engine import DEFAULT_PITCH_ENGINE, instrument_from_path
+
+# librosa・soundfile・numba（tree_ensemble）と、それらを読み込む stream_analyzer・harmony_analize・audio_decode は
+# 使う関数の中で import する（存在しないファイルなどで失敗するときに、重い import を待たない）
 
 hop_length = 512  # フレーム長さ
+# これより長い録音は、録音全体を読み込まずにブロックごとに解析する（stream_analyzer.py。yin のときのみ）
+STREAM_MIN_SECONDS = float(os.environ.get("ANALYZER_STREAM_MIN_SECONDS", "600"))
 
 # --- スクリプトのあるフォルダを基準にパス解決 ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 def here(*names):
     return os.path.join(BASE_DIR, *names)
 
-# --- モデル読み込み ---
+# --- モデル（読み込みは最初に予測するとき。import しただけでは読み込まない） ---
 model_files = {
     "brightness": here("rf_model_brightness.pkl"),
     "smoothness": here("rf_model_smoothness.pkl"),
@@ -23,132 +34,123 @@ model_files = {
     "clarity": here("rf_model_clarity.pkl"),
     "sharpness": here("rf_model_sharpness.pkl")
 }
+# tree_ensemble.py compile で変換した 5 モデル分の木（pkl より新しければこちらで推論する。メモリマップで読む）
+compiled_model_file = here("rf_models_compiled.npz")
+# audio_10_distill_models.py で選んだモデルバンドル（あれば pkl・npz より優先する）
+bundle_file = os.environ.get("ANALYZER_MODEL_BUNDLE") or here(model_bundle.DEFAULT_FILE)
 
-# 事前チェック（見つからない時は場所を出力して落とす）
-missing = [p for p in model_files.values() if not os.path.exists(p)]
-if missing:
-    sys.stderr.write(
-        "[analyze_audio] Missing model files:\n  " + "\n  ".join(missing) + "\n"
-        f"BASE_DIR={BASE_DIR}\n"
-        "Dir listing:\n  " + "\n  ".join(os.listdir(BASE_DIR)) + "\n"
-    )
-    sys.exit(1)
-
-models = {k: joblib.load(f) for k, f in model_files.items()}
-
-def compute_spectral_flux(y, hop_length):
-    S = np.abs(librosa.stft(y, hop_length=hop_length))
-    flux = np.sqrt(np.sum(np.diff(S, axis=1) ** 2, axis=0))
-    flux = np.insert(flux, 0, 0)
-    return flux
-
-
-def compute_high_freq_energy(y, sr, hop_length, cutoff_freq=4000):
-    S = np.abs(librosa.stft(y, hop_length=hop_length))
-    freqs = librosa.fft_frequencies(sr=sr)
-    hf_idx = np.where(freqs >= cutoff_freq)[0]
-    hf_energy = np.sum(S[hf_idx, :], axis=0)
-    return hf_energy
-
-
-# === フレーム単位特徴量抽出 ===
-def extract_framewise_features(y, sr):
-    mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13, hop_length=hop_length)
-    delta_mfcc = librosa.feature.delta(mfcc)
-    zcr = librosa.feature.zero_crossing_rate(y, hop_length=hop_length)
-    rms = librosa.feature.rms(y=y, hop_length=hop_length)
-    centroid = librosa.feature.spectral_centroid(y=y, sr=sr, hop_length=hop_length)
-    bandwidth = librosa.feature.spectral_bandwidth(y=y, sr=sr, hop_length=hop_length)
-    rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr, hop_length=hop_length)
-    flatness = librosa.feature.spectral_flatness(y=y, hop_length=hop_length)
-    chroma = librosa.feature.chroma_stft(y=y, sr=sr, hop_length=hop_length)
-    onset_env = librosa.onset.onset_strength(y=y, sr=sr, hop_length=hop_length).reshape(1, -1)
-
-    features_list = [mfcc, delta_mfcc, zcr, rms, centroid, bandwidth, rolloff, flatness, chroma, onset_env]
-    min_len = min(x.shape[1] for x in features_list)
-    features_trimmed = [x[:, :min_len] for x in features_list]
-    feats_time = np.vstack(features_trimmed)
-
-    delta_rms = np.gradient(rms[0, :min_len])
-    delta_bandwidth = np.gradient(bandwidth[0, :min_len])
-    delta2_rms = np.gradient(delta_rms)
-    delta2_bandwidth = np.gradient(delta_bandwidth)
-
-    spectral_flux = compute_spectral_flux(y, hop_length)[:min_len]
-    delta2_flux = np.gradient(spectral_flux)
-    hf_energy = compute_high_freq_energy(y, sr, hop_length)[:min_len]
-
-    # --- すべて結合 ---
-    final_features = np.column_stack([
-        feats_time.T,
-        delta_rms,
-        delta_bandwidth,
-        delta2_rms,
-        delta2_bandwidth,
-        spectral_flux,
-        delta2_flux,
-        hf_energy
-    ])
-
-    return final_features  # shape: (T, D)
+_loaded = None
 
 
-# === 統計量計算（フレーム指定） ===
-def compute_window_stats_frames(features, window_frames=43, step_frames=10, include_last='short'):
-    T, D = features.shape
-    w = int(window_frames)
-    s = int(step_frames)
-    if w <= 0 or s <= 0:
-        raise ValueError("window_frames と step_frames は正の整数にしてください")
-
-    stats_list, times_frames = [], []
-    start = 0
-    while start < T:
-        end = start + w
-        if end <= T:
-            window = features[start:end, :]
-        else:
-            if include_last == 'drop':
-                break
-            elif include_last == 'pad':
-                pad_len = end - T
-                window = np.pad(features[start:T, :],
-                                ((0, pad_len), (0, 0)),
-                                mode='constant', constant_values=0.0)
-            else:  # 'short'
-                window = features[start:T, :]
+def compiled_is_fresh():
+    if not os.path.exists(compiled_model_file):
+        return False
+    mtime = os.path.getmtime(compiled_model_file)
+    return all(os.path.getmtime(f) <= mtime for f in model_files.values())
 
-        # 統計量
-        means = np.mean(window, axis=0)
-        vars_  = np.var(window, axis=0)
-        skews  = skew(window, axis=0, bias=False, nan_policy='omit')
-        kurts  = kurtosis(window, axis=0, bias=False, nan_policy='omit')
 
-        stats_list.append(np.concatenate([means, vars_, skews, kurts]))
+def load_models():
+    """
+    モデルを読み込む（2 回目以降は読み込んだものを返す）
+    戻り値: {"predictor": 全モデルを 1 回で予測するもの（ModelBundle / CompiledForest。どちらも無ければ None）,
+            "models": predictor が無いときの {名前: pkl のモデル},
+            "names": 予測する指標の名前（.cols の列の順）,
+            "columns": 推論に使う窓統計量の列（プルーニングしたモデルなら一部の列だけ計算する。feature_subset.py）,
+            "positions": models の各モデルの列が columns の何番目か,
+            "version": 読み込んだときのモデル・解析コードの版（model_version）}
+    """
+    global _loaded
+    if _loaded is not None:
+        return _loaded
+
+    version = model_version()
+    bundle = ModelBundle.load(bundle_file, mmap_mode="r") if os.path.exists(bundle_file) else None
+
+    # 事前チェック（見つからない時は場所を出力して落とす）
+    missing = [p for p in model_files.values() if not os.path.exists(p)]
+    if missing and bundle is None:
+        sys.stderr.write(
+            "[analyze_audio] Missing model files:\n  " + "\n  ".join(missing) + "\n"
+            f"BASE_DIR={BASE_DIR}\n"
+            "Dir listing:\n  " + "\n  ".join(os.listdir(BASE_DIR)) + "\n"
+        )
+        sys.exit(1)
+
+    if bundle is not None:
+        predictor = bundle
+    elif compiled_is_fresh():
+        from tree_ensemble import CompiledForest
+        predictor = CompiledForest.load(compiled_model_file, mmap=True)
+        if predictor.names != list(model_files):
+            sys.stderr.write(f"[analyze_audio] {compiled_model_file} のモデル名が一致しないため pkl を使います\n")
+            predictor = None
+    else:
+        predictor = None
+
+    if predictor is not None:
+        _loaded = {"predictor": predictor, "models": {}, "names": predictor.names,
+                   "columns": predictor.columns, "positions": None, "version": version}
+    else:
+        import joblib
+        from tree_ensemble import input_columns
+        models = {k: joblib.load(f) for k, f in model_files.items()}
+        columns, positions = input_columns(models)
+        _loaded = {"predictor": None, "models": models, "names": list(model_files),
+                   "columns": columns, "positions": positions, "version": version}
+    return _loaded
+
+
+def refresh_models(version=None):
+    """
+    モデルファイル・解析コードが読み込んだときから変わっていれば（model_version が違えば）、
+    次の load_models で読み込み直す（常駐ワーカーでモデルを置き換えたとき。analyze の最初に呼び、解析の途中では替えない）
+    """
+    global _loaded
+    if _loaded is not None and _loaded["version"] != (version or model_version()):
+        sys.stderr.write("[analyze_audio] モデルが更新されたため読み込み直します\n")
+        _loaded = None
+
 
-        # 中心フレーム（短窓のときも実際の長さに合わせる）
-        center = start + window.shape[0] / 2
-        times_frames.append(center)
+def model_version():
+    """モデルファイル・解析コードの版（result_cache のキーに入れる。モデルを置き換えると変わる）"""
+    return result_cache.version([*model_files.values(), compiled_model_file, bundle_file])
 
-        start += s
 
-    return np.asarray(stats_list), np.asarray(times_frames)
+def model_names():
+    """予測する指標の名前（.cols の列の順）"""
+    return load_models()["names"]
+
+
+def predict_windows(X_scaled):
+    """
+    5 モデルの窓ごとの予測 {名前: (Nwin,)}
+    X_scaled: 窓統計量の load_models()["columns"] の列、または全列 (Nwin, 208)
+    """
+    loaded = load_models()
+    if X_scaled.shape[1] != len(loaded["columns"]):
+        X_scaled = X_scaled[:, loaded["columns"]]
+    if loaded["predictor"] is not None:
+        return loaded["predictor"].predict_dict(X_scaled)
+    positions = loaded["positions"]
+    return {k: m.predict(X_scaled if len(positions[k]) == X_scaled.shape[1]
+                         else X_scaled[:, positions[k]]).astype(float)
+            for k, m in loaded["models"].items()}
+
+# === 統計量計算（フレーム指定） ===
+def compute_window_stats_frames(features, window_frames=43, step_frames=10, include_last='short'):
+    # 1〜4 乗の累積和から全窓の統計量を一括計算（window_stats.py）
+    return compute_window_stats(features, window_frames, step_frames, include_last=include_last)
 
 
 # === pitch / volume 抽出 ===
-def extract_pitch(y, sr):
-    f0, _, _ = librosa.pyin(
-        y,
-        fmin=librosa.note_to_hz('C2'),
-        fmax=librosa.note_to_hz('C7'),
-        sr=sr,
-        hop_length=hop_length
-    )
-    return np.nan_to_num(f0, nan=0.0)
-
-
-def extract_volume(y):
-    rms = librosa.feature.rms(y=y, hop_length=hop_length).flatten()
+def extract_pitch(y, sr, engine=DEFAULT_PITCH_ENGINE, instrument=None, hop=hop_length):
+    # engine: 'pyin'（C2〜C7, 従来どおり） / 'pyin_narrow'（楽器の音域に限定） / 'yin'（高速）
+    return pitch_engine.extract_pitch(y, sr, engine=engine, instrument=instrument, hop_length=hop)
+
+
+def extract_volume(y, hop=hop_length, frame_length=2048):
+    import librosa
+    rms = librosa.feature.rms(y=y, frame_length=frame_length, hop_length=hop).flatten()
     return rms
 
 
@@ -172,34 +174,168 @@ def upsample_series_to_frames(series, times_frames, n_frames):
     return np.interp(new_x, x, y, left=y[0], right=y[-1])
 
 
-# === メイン処理 ===
-def main(audio_path):
-    y, sr = librosa.load(audio_path, sr=None)
-    features = extract_framewise_features(y, sr)
+def frames_to_output(values, scale, n_frames, nearest=False):
+    """
+    プリセットのフレーム列を出力のフレーム列 (n_frames,) に並べ直す
+    scale: 出力の 1 フレームが解析の何フレームに当たるか（1 ならそのまま切り詰める）
+    nearest: 最も近いフレームの値を使う（pitch の無声 0 を補間で崩さないため）
+    """
+    values = np.asarray(values, dtype=float)
+    if scale == 1:
+        return values[:n_frames]
+    x = np.arange(n_frames) * scale
+    if nearest:
+        return values[np.minimum(np.rint(x).astype(int), len(values) - 1)]
+    return np.interp(x, np.arange(len(values)), values)
+
 
-    frames_per_sec = sr / hop_length
-    window_frames = max(1, int(round(frames_per_sec * 1.0)))   # ≈1.0秒窓
-    step_frames   = max(1, int(round(frames_per_sec * 0.1)))   # ≈0.1秒ステップ
+# === 解析本体（結果の dict を返し、.cols に保存する） ===
+def as_saved(values):
+    """.cols に保存される値（float32）に丸めた list"""
+    return np.asarray(values, dtype=np.float32).tolist()
 
-    # 窓統計（低レート）
-    X, times_frames = compute_window_stats_frames(features, window_frames, step_frames, include_last='short')
 
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+def window_params(sr, hop=hop_length, window_step=0.1):
+    frames_per_sec = sr / hop
+    window_frames = max(1, int(round(frames_per_sec * 1.0)))          # ≈1.0秒窓
+    step_frames   = max(1, int(round(frames_per_sec * window_step)))  # ≈0.1秒ステップ（プリセットで変わる）
+    return window_frames, step_frames
 
-    preds_window = {k: models[k].predict(X_scaled).astype(float) for k in models}
 
-    pitch  = extract_pitch(y, sr)
-    volume = extract_volume(y)
+def use_stream(audio_path, pitch_engine_name, stream=None, preset=None):
+    """
+    stream: True / False で指定、None なら録音の長さで決める
+    ブロック解析は yin・録音のままのフレームで解析するプリセット（presets.is_native）のときのみ
+    webm など soundfile で読めない形式は、デコードする前に ffprobe（無ければ ffmpeg の流し読み）で長さを求める
+    """
+    if stream is not None and not stream:
+        return False
+    if pitch_engine_name != "yin" or not presets.is_native(preset or presets.get_preset()):
+        if stream:
+            raise ValueError("ブロックごとの解析は pitch engine が yin・プリセットが full のときのみ使えます")
+        return False
+    if stream:
+        return True
+    import soundfile as sf
+    import audio_decode
+    try:
+        info = sf.info(audio_path)
+        seconds = info.frames / info.samplerate
+    except Exception:
+        seconds = audio_decode.duration(audio_path)
+    return seconds >= STREAM_MIN_SECONDS
+
+
+def analyze(audio_path, pitch_engine_name=None, stream=None, preset=None):
+    """
+    pitch_engine_name: None ならプリセットの pitch engine
+    preset: presets.PRESETS の名前（None は presets.DEFAULT_PRESET）
+    同じ録音（ファイルの中身）・設定・モデルの結果が result_cache にあれば、解析せずに .cols を複製して読み込む
+    """
+    preset = presets.get_preset(preset)
+    pitch_engine_name = pitch_engine_name or preset["pitch_engine"]
+    version = model_version()
+    refresh_models(version)
+    if not result_cache.enabled():
+        return _analyze(audio_path, pitch_engine_name, stream, preset)
+
+    # 楽器（パスのフォルダ名）で pitch の探索範囲が変わるのでキーに入れる
+    out_path = artifact_path(audio_path)
+    with metrics.span("analyze.cache") as sp:
+        params = {"audio": result_cache.file_digest(audio_path), "pitch_engine": pitch_engine_name,
+                  "preset": preset, "stream": stream, "instrument": instrument_from_path(audio_path)}
+        hit = result_cache.restore(result_cache.key(version, **params), out_path)
+        sp.set(hit=hit)
+    if hit:
+        with metrics.span("analyze.load_result"):
+            return load_analysis(out_path)
+
+    results = _analyze(audio_path, pitch_engine_name, stream, preset)
+    # 解析に使ったモデルの版で入れる（読み込んだ後にモデルが置き換わっていれば、新しい版では引かれない）
+    try:
+        result_cache.store(result_cache.key(load_models()["version"], **params), out_path)
+    except OSError as e:
+        sys.stderr.write(f"[analyze_audio] 解析結果をキャッシュに保存できません: {e}\n")
+    return results
+
+
+def _analyze(audio_path, pitch_engine_name, stream, preset):
+    if use_stream(audio_path, pitch_engine_name, stream, preset):
+        return analyze_stream(audio_path, preset=preset)
+    import librosa
+    import audio_decode
+    import harmony_analize
+
+    # webm は wav に変換せず ffmpeg のパイプから読む（audio_decode.py）
+    with metrics.span("analyze.decode", file=os.path.basename(audio_path)) as sp:
+        y, native_sr = audio_decode.load_audio(audio_path)
+        sp.set(sr=native_sr, seconds=len(y) / native_sr)
+        sp.size(y=y)
+
+    # プリセットのサンプリング周波数・フレームで解析し、最後に出力のフレーム（録音のまま・hop 512）に揃える
+    sr = preset["sr"] or native_sr
+    if sr == native_sr:
+        y_an = y
+    else:
+        with metrics.span("analyze.resample", sr=sr):
+            y_an = librosa.resample(y, orig_sr=native_sr, target_sr=sr)
+    hop, n_fft = preset["hop_length"], preset["n_fft"]
+    scale = (hop_length * sr) / (hop * native_sr)
+
+    window_frames, step_frames = window_params(sr, hop, preset["window_step"])
+
+    # 窓統計（低レート）。プルーニングしたモデルはモデルが使う列に要る特徴量・統計量だけを計算する
+    with metrics.span("analyze.load_models"):
+        feature_columns = load_models()["columns"]
+    full = feature_subset.is_full(feature_columns)
+    with metrics.span("analyze.features", columns=len(feature_columns)) as sp:
+        if full:
+            features = extract_framewise_features(y_an, sr, hop_length=hop, n_fft=n_fft)
+        else:
+            features = feature_subset.extract_features(y_an, sr, feature_columns, hop_length=hop, n_fft=n_fft)
+        sp.size(features=features)
+    with metrics.span("analyze.window_stats") as sp:
+        if full:
+            X, times_frames = compute_window_stats_frames(features, window_frames, step_frames, include_last='short')
+        else:
+            X, times_frames = feature_subset.compute_window_stats(features, feature_columns, window_frames,
+                                                                  step_frames, include_last='short')
+        sp.size(X=X)
+
+    with metrics.span("analyze.standardize"):
+        from sklearn.preprocessing import StandardScaler  # import に 1 秒ほどかかるので使うときに読み込む
+        scaler = StandardScaler()
+        X_scaled = scaler.fit_transform(X)
+
+    # 標準化は全窓で行い、予測は predict_stride 窓ごと（最後の窓は必ず含める）
+    stride = preset["predict_stride"]
+    if stride > 1 and len(X_scaled) > 1:
+        keep = np.unique(np.append(np.arange(0, len(X_scaled), stride), len(X_scaled) - 1))
+        X_scaled, times_frames = X_scaled[keep], times_frames[keep]
+
+    with metrics.span("analyze.predict") as sp:
+        preds_window = predict_windows(X_scaled)
+        sp.size(X=X_scaled)
+
+    instrument = instrument_from_path(audio_path)
+    with metrics.span("analyze.pitch", engine=pitch_engine_name) as sp:
+        pitch  = extract_pitch(y_an, sr, engine=pitch_engine_name, instrument=instrument, hop=hop)
+        sp.size(pitch=pitch)
+    with metrics.span("analyze.volume"):
+        volume = extract_volume(y_an, hop, n_fft)
     T = min(features.shape[0], len(pitch), len(volume))
+    if scale != 1:
+        T = 1 + len(y) // hop_length  # full と同じフレーム数（末尾は解析の最後のフレームの値）
 
-    predictions = {
-        k: upsample_series_to_frames(v, times_frames, T).tolist()
-        for k, v in preds_window.items()
-    }
+    # 返す値は保存する値（float32）に丸める（キャッシュから読み戻した結果・ブロック解析の結果と同じ値にする）
+    with metrics.span("analyze.upsample", frames=T):
+        predictions = {
+            k: as_saved(upsample_series_to_frames(v, np.asarray(times_frames) / scale, T))
+            for k, v in preds_window.items()
+        }
 
-    pitch  = pitch[:T].tolist()
-    volume = volume[:T].tolist()
+        pitch  = as_saved(frames_to_output(pitch, scale, T, nearest=True))
+        volume = as_saved(frames_to_output(volume, scale, T))
 
     results = {
         "pitch": pitch,
@@ -207,12 +343,60 @@ def main(audio_path):
         **predictions
     }
 
-    print(json.dumps(results, ensure_ascii=False))
-    sys.stdout.flush()
+    # 列指向ファイル（artifact.py）に保存する
+    # 協和度計算（harmony_analize.py）用の f0 も一緒に保存しておき、表示のたびの再計算を省く
+    # 協和度用の f0 はプリセットによらず元の信号から計算する（harmony_analize.py の設定で比べるため）
+    # どのプリセットで解析したかも meta に記録しておく
+    with metrics.span("analyze.harmony_f0"):
+        harmony_f0 = harmony_analize.harmony_f0_entry(y, native_sr)
+    with metrics.span("analyze.save", frames=T):
+        save_analysis(artifact_path(audio_path), results, harmony_f0,
+                      presets.describe(preset, native_sr, pitch_engine_name))
+
+    return results
+
 
-    pkl_path = audio_path.replace('.wav', '.pkl', 1)
-    with open(pkl_path, "wb") as f:
-        pickle.dump(results, f)
+def analyze_stream(audio_path, block_frames=None, source=None, preset=None):
+    """
+    analyze と同じ .cols をブロックごとに書き込む（録音の長さによらずメモリ使用量がほぼ一定）
+    block_frames: 1 ブロックのフレーム数（None は stream_analyzer.BLOCK_FRAMES）
+    source: audio_path を開いた stream_analyzer.AudioSource（省略時はここで開く）
+    preset: presets.get_preset の戻り値（presets.is_native のもの。None は既定のプリセット）
+    戻り値は保存した値（float32）を読み戻したもの
+    """
+    import stream_analyzer
+    preset = preset or presets.get_preset()
+    block_frames = block_frames or stream_analyzer.BLOCK_FRAMES
+    source = source or stream_analyzer.open_source(audio_path)
+    try:
+        window_frames, step_frames = window_params(source.sr, hop_length, preset["window_step"])
+        with metrics.span("analyze.stream", block_frames=block_frames) as sp:
+            out_path = stream_analyzer.analyze_stream(
+                source, artifact_path(audio_path), predict_windows, model_names(),
+                window_frames, step_frames, instrument=instrument_from_path(audio_path), block_frames=block_frames,
+                analysis=presets.describe(preset, source.sr, "yin"))
+            sp.set(sr=source.sr)
+    finally:
+        source.close()
+    with metrics.span("analyze.load_result"):
+        return load_analysis(out_path)
+
+
+# === メイン処理 ===
+def main(audio_path, pitch_engine_name=None, stream=None, preset=None):
+    with metrics.span("analyze", file=os.path.basename(audio_path), pitch_engine=pitch_engine_name,
+                      stream=stream, preset=preset):
+        results = analyze(audio_path, pitch_engine_name, stream, preset)
+        with metrics.span("analyze.json") as sp:
+            out = json.dumps(results, ensure_ascii=False)
+            sp.set(chars=len(out))
+    print(out)
+    sys.stdout.flush()
 
 if __name__ == "__main__":
-    main(sys.argv[1])
+    # 使い方: python3 analyze_audio.py <audio.webm|audio.wav> [pyin|pyin_narrow|yin] [--stream|--no-stream]
+    #                                  [--preset=full|balanced|fast]
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    stream = True if "--stream" in sys.argv else False if "--no-stream" in sys.argv else None
+    preset = next((a.split("=", 1)[1] for a in sys.argv[1:] if a.startswith("--preset=")), None)
+    main(args[0], *args[1:2], stream=stream, preset=preset)
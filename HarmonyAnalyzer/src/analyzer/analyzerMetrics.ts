@@ -0,0 +1,101 @@
+// 解析ワーカー（metrics.py）が stderr に 1 行ずつ出す区間（span）の記録の集計
+// ANALYZER_METRICS=stderr で起動したときだけ記録が届く（未設定なら何もしない）
+
+export type SpanRecord = {
+  span: string;
+  trace: string;
+  parent: string | null;
+  wall_ms: number;
+  cpu_ms: number;
+  rss_mib: number | null;
+  peak_rss_mib: number | null;
+  peak_rss_grew_mib: number | null;
+  attrs: Record<string, unknown>;
+  error?: string;
+};
+
+type SpanStats = {
+  count: number;
+  errors: number;
+  totalWallMs: number;
+  totalCpuMs: number;
+  maxWallMs: number;
+  maxPeakRssGrewMib: number;
+  // attrs.hit を持つ区間（analyze.cache など）のヒット・ミスの回数
+  hits: number;
+  misses: number;
+};
+
+// この時間以上かかったジョブは区間ごとの内訳をログに出す
+const SLOW_JOB_MS = parseInt(process.env.ANALYZER_SLOW_JOB_MS ?? "1000", 10) || 0;
+
+const stats = new Map<string, SpanStats>();
+
+// stderr の 1 行が区間の記録ならそれを返す（それ以外の行は null）
+export function parseSpanLine(line: string): SpanRecord | null {
+  if (!line.startsWith('{"span"')) return null;
+  try {
+    const rec = JSON.parse(line);
+    return typeof rec.span === "string" ? (rec as SpanRecord) : null;
+  } catch {
+    return null;
+  }
+}
+
+export function recordSpan(rec: SpanRecord) {
+  let s = stats.get(rec.span);
+  if (!s) {
+    s = { count: 0, errors: 0, totalWallMs: 0, totalCpuMs: 0, maxWallMs: 0, maxPeakRssGrewMib: 0, hits: 0, misses: 0 };
+    stats.set(rec.span, s);
+  }
+  s.count++;
+  if (rec.error) s.errors++;
+  s.totalWallMs += rec.wall_ms;
+  s.totalCpuMs += rec.cpu_ms;
+  s.maxWallMs = Math.max(s.maxWallMs, rec.wall_ms);
+  s.maxPeakRssGrewMib = Math.max(s.maxPeakRssGrewMib, rec.peak_rss_grew_mib ?? 0);
+  if (rec.attrs.hit === true) s.hits++;
+  if (rec.attrs.hit === false) s.misses++;
+}
+
+function ms(value: number): string {
+  return value >= 1000 ? `${(value / 1000).toFixed(2)}s` : `${value.toFixed(0)}ms`;
+}
+
+// 1 ジョブ分の区間（root はジョブ全体、children はその中の区間）を 1 行にまとめてログに出す
+// 同じ名前の区間（read_pickle_batch のファイルごとの読み込みなど）は回数と合計にまとめる
+export function logJobSpans(root: SpanRecord, children: SpanRecord[]) {
+  if (root.wall_ms < SLOW_JOB_MS) return;
+  const byName = new Map<string, { n: number; wallMs: number }>();
+  for (const c of children) {
+    const v = byName.get(c.span) ?? { n: 0, wallMs: 0 };
+    v.n++;
+    v.wallMs += c.wall_ms;
+    byName.set(c.span, v);
+  }
+  const parts = [...byName].map(([name, v]) => `${name}${v.n > 1 ? ` x${v.n}` : ""} ${ms(v.wallMs)}`);
+  console.log(
+    `[analyzer] ${root.span} id=${root.attrs.id} ${ms(root.wall_ms)} (cpu ${ms(root.cpu_ms)}, ` +
+      `rss ${root.rss_mib?.toFixed(0)} MiB, +${root.peak_rss_grew_mib ?? 0} MiB peak)` +
+      (root.error ? ` error=${root.error}` : "") +
+      `: ${parts.join(", ")}`
+  );
+}
+
+// 区間の名前ごとの集計（起動からの累計）
+export function analyzerMetricsSnapshot() {
+  const out: Record<string, object> = {};
+  for (const [name, s] of stats) {
+    out[name] = {
+      count: s.count,
+      errors: s.errors,
+      avgWallMs: s.totalWallMs / s.count,
+      maxWallMs: s.maxWallMs,
+      avgCpuMs: s.totalCpuMs / s.count,
+      totalWallMs: s.totalWallMs,
+      maxPeakRssGrewMib: s.maxPeakRssGrewMib,
+      ...(s.hits + s.misses > 0 ? { hits: s.hits, misses: s.misses, hitRate: s.hits / (s.hits + s.misses) } : {}),
+    };
+  }
+  return out;
+}
@@ -0,0 +1,213 @@
+import path from "path";
+import readline from "readline";
+import { spawn, ChildProcessWithoutNullStreams } from "child_process";
+import { SpanRecord, parseSpanLine, recordSpan, logJobSpans } from "./analyzerMetrics";
+
+// 常駐 Python ワーカー（analyzer_server.py）のプール
+// リクエストごとに python3 を起動せず、モデル読み込み済みのプロセスにジョブを渡す
+// ANALYZER_METRICS=stderr で起動すると、ワーカーが出す処理ごとの時間・メモリを集計する（analyzerMetrics.ts）
+
+export type AnalyzerJobType = "analyze" | "read_pickle" | "read_pickle_batch" | "harmony" | "lod";
+
+export type AnalyzerOptions = {
+  pitch_engine?: "pyin" | "pyin_narrow" | "yin";
+  // ブロックごとに解析するか（省略時は長い録音のみ。yin のときだけ使える）
+  stream?: boolean;
+  // 解析の品質プリセット（presets.py。省略時は full）
+  preset?: "full" | "balanced" | "fast";
+  // lod: 表示する時間範囲（秒）・横幅（ピクセル）・系列（省略時は全体・1000 px・全系列）
+  start?: number;
+  end?: number;
+  width?: number;
+  series?: string[];
+};
+
+type Job = {
+  id: number;
+  type: AnalyzerJobType;
+  args: string[];
+  options: AnalyzerOptions;
+  resolve: (output: string) => void;
+  reject: (err: Error) => void;
+  // 途中の結果（read_pickle_batch のファイルごとの結果）を受け取る関数。無ければ NDJSON にまとめて output で返す
+  onPartial?: (part: any) => void;
+  partials: string[];
+};
+
+type Worker = {
+  proc: ChildProcessWithoutNullStreams;
+  ready: boolean;
+  current: Job | null;
+  stderr: string;
+  // stderr の行の途中まで届いた分
+  stderrPartial: string;
+  // ジョブ全体の区間がまだ届いていない、ジョブの中の区間（ANALYZER_METRICS=stderr のとき。metrics.py）
+  spans: SpanRecord[];
+  // 終了・エラーの後始末を済ませたか（exit と error の両方が届いても 1 回だけ行う）
+  gone: boolean;
+};
+
+const pythonPath = "/usr/bin/python3";
+const serverScriptPath = path.join(__dirname, "analyzer_server.py");
+const POOL_SIZE = Math.max(1, parseInt(process.env.ANALYZER_WORKERS ?? "2", 10) || 2);
+// stderr は直近分だけ保持（エラー時のログ用）
+const STDERR_KEEP = 20000;
+
+const workers: Worker[] = [];
+const queue: Job[] = [];
+let nextJobId = 1;
+
+function startWorker(): Worker {
+  const proc = spawn(pythonPath, [serverScriptPath]);
+  const worker: Worker = { proc, ready: false, current: null, stderr: "", stderrPartial: "", spans: [], gone: false };
+
+  readline.createInterface({ input: proc.stdout }).on("line", (line) => {
+    let msg: any;
+    try {
+      msg = JSON.parse(line);
+    } catch {
+      console.error("[analyzer] 不正な応答:", line.slice(0, 200));
+      return;
+    }
+    if (msg.ready) {
+      worker.ready = true;
+      console.log(`[analyzer] worker pid=${proc.pid} 準備完了`);
+      dispatch();
+      return;
+    }
+    const job = worker.current;
+    if (!job || msg.id !== job.id) return;
+    if ("partial" in msg) {
+      if (job.onPartial) {
+        try {
+          job.onPartial(msg.partial);
+        } catch (err) {
+          console.error("[analyzer] 途中の結果の処理でエラー:", err);
+        }
+      } else {
+        job.partials.push(JSON.stringify(msg.partial));
+      }
+      return;
+    }
+    worker.current = null;
+    if (msg.ok) {
+      job.resolve(job.partials.length > 0 ? job.partials.join("\n") : msg.output);
+    } else {
+      console.error(worker.stderr);
+      job.reject(new Error(msg.error));
+    }
+    worker.stderr = "";
+    dispatch();
+  });
+
+  proc.stderr.on("data", (chunk) => {
+    // 区間の記録の行は集計に回し、それ以外（警告・エラー）はエラー時のログ用に残す
+    const lines = (worker.stderrPartial + chunk.toString()).split("\n");
+    worker.stderrPartial = lines.pop() ?? "";
+    let text = "";
+    for (const line of lines) {
+      const span = parseSpanLine(line);
+      if (span) {
+        onSpan(worker, span);
+      } else {
+        text += line + "\n";
+      }
+    }
+    if (text) worker.stderr = (worker.stderr + text).slice(-STDERR_KEEP);
+  });
+
+  proc.on("exit", (code, signal) => {
+    retireWorker(worker, `exited with code ${code} signal ${signal}`, `code ${code}`);
+  });
+  // 起動できない（pythonPath が無いなど）・kill できないときの error。ハンドラが無いとサーバーごと落ちる
+  proc.on("error", (err) => {
+    retireWorker(worker, `error: ${err.message}`, err.message);
+  });
+  // 落ちた直後のワーカーに書き込んだとき（EPIPE など）。プロセスは止めて exit と同じく作り直す
+  proc.stdin.on("error", (err) => {
+    retireWorker(worker, `stdin error: ${err.message}`, err.message);
+    proc.kill();
+  });
+
+  return worker;
+}
+
+// 終了した・使えなくなったワーカーを外し、実行中のジョブを失敗にして作り直す
+function retireWorker(worker: Worker, what: string, reason: string) {
+  if (worker.gone) return;
+  worker.gone = true;
+  worker.stderr += worker.stderrPartial;
+  console.error(`[analyzer] worker pid=${worker.proc.pid} ${what}`);
+  if (worker.stderr) console.error(worker.stderr);
+  const idx = workers.indexOf(worker);
+  if (idx >= 0) workers.splice(idx, 1);
+  if (worker.current) {
+    worker.current.reject(new Error(`analyzer worker exited (${reason})`));
+    worker.current = null;
+  }
+  // 起動（モデル読み込み）に失敗した場合は、待っているジョブをすべて失敗にする
+  if (!worker.ready && !workers.some((w) => w.ready)) {
+    for (const job of queue.splice(0)) {
+      job.reject(new Error(`analyzer worker failed to start (${reason})`));
+    }
+  }
+  // 落ちたワーカーは作り直す（起動直後に落ちる場合の連続再起動を避けるため少し待つ）
+  setTimeout(() => {
+    ensureStarted();
+    dispatch();
+  }, 1000);
+}
+
+// ジョブの中の区間は先に終わるので、ジョブ全体の区間（job.<種類>）が届いたときにまとめてログ・集計する
+// （stdout の応答と stderr の記録はどちらが先に届くか決まらないので、worker.current ではなく trace で対応付ける）
+function onSpan(worker: Worker, span: SpanRecord) {
+  recordSpan(span);
+  if (span.parent !== null) {
+    worker.spans.push(span);
+    return;
+  }
+  const children = worker.spans.filter((s) => s.trace === span.trace);
+  worker.spans = worker.spans.filter((s) => s.trace !== span.trace);
+  logJobSpans(span, children);
+}
+
+function dispatch() {
+  for (const worker of workers) {
+    if (queue.length === 0) return;
+    if (!worker.ready || worker.current) continue;
+    const job = queue.shift()!;
+    worker.current = job;
+    worker.proc.stdin.write(JSON.stringify({ id: job.id, type: job.type, args: job.args, options: job.options }) + "\n");
+  }
+}
+
+function ensureStarted() {
+  while (workers.length < POOL_SIZE) {
+    workers.push(startWorker());
+  }
+}
+
+// ジョブを実行し、スクリプト単体実行時の標準出力と同じ JSON 文字列を返す
+// onPartial を渡すと、read_pickle_batch のファイルごとの結果を届いた順に渡す（そのときの戻り値は空文字列）
+export function runAnalyzer(
+  type: AnalyzerJobType,
+  args: string[],
+  options: AnalyzerOptions = {},
+  onPartial?: (part: any) => void
+): Promise<string> {
+  ensureStarted();
+  return new Promise<string>((resolve, reject) => {
+    queue.push({ id: nextJobId++, type, args, options, resolve, reject, onPartial, partials: [] });
+    dispatch();
+  });
+}
+
+// 実行を待っているジョブの数（混み具合に応じてプリセットを選ぶのに使う）
+export function pendingAnalyzerJobs(): number {
+  return queue.length;
+}
+
+// サーバー起動時に呼ぶと、最初のリクエストを待たずにモデル読み込みを始める
+export function startAnalyzerPool() {
+  ensureStarted();
+}
@@ -0,0 +1,144 @@
+"""
+常駐型の解析ワーカー
+
+起動時に librosa / sklearn の import と rf_model_*.pkl の読み込み、ウォームアップを 1 回だけ行い、
+以降は標準入力から 1 行 1 ジョブの JSON を受け取って、標準出力に 1 行 1 結果の JSON を返す。
+
+入力:  {"id": 1, "type": "analyze" | "read_pickle" | "read_pickle_batch" | "harmony" | "lod",
+        "args": ["/path/to/file", ...], "options": {"pitch_engine": "yin", "stream": true, "preset": "fast"}}
+        ※ options は省略可（stream: ブロックごとに解析するか。省略すると長い録音だけブロックごとに解析する
+          preset: 解析の品質プリセット presets.PRESETS。省略すると presets.DEFAULT_PRESET
+          lod は {"start": 秒, "end": 秒, "width": ピクセル, "series": ["pitch", ...]}。省略すると全体・1000 px・全系列）
+出力:  {"id": 1, "ok": true, "output": "<各スクリプトを単体実行したときの標準出力と同じ文字列>"}
+       {"id": 1, "ok": false, "error": "..."}
+       read_pickle_batch は 1 ファイル読み終わるごとに、最後の応答より前に途中の結果を 1 行ずつ返す
+       {"id": 1, "partial": {"index": 0, "path": "...", "ok": true, "data": {...}}}（読み終わった順。エラーも ok: false で入る）
+       最後の応答の output は空文字列
+起動完了時に {"ready": true} を 1 行出力する。
+環境変数 ANALYZER_METRICS=stderr のときは、ジョブの処理ごとの時間・メモリを stderr に 1 行 1 区間の JSON で出す（metrics.py）。
+"""
+import sys
+import json
+import types
+import contextlib
+import traceback
+import numpy as np
+
+import analyze_audio
+import read_pickle
+import metrics
+import harmony_analize
+
+
+def job_analyze(args, options):
+    return analyze_audio.analyze(args[0], options.get("pitch_engine"), options.get("stream"), options.get("preset"))
+
+
+def job_read_pickle(args, options):
+    return read_pickle.read_pickle(args[0])
+
+
+def job_read_pickle_batch(args, options):
+    # 読み終わった順に 1 件ずつ（handle が途中の結果として返す）
+    return read_pickle.read_many(args)
+
+
+def job_harmony(args, options):
+    return harmony_analize.compute_harmony(args)
+
+
+def job_lod(args, options):
+    return read_pickle.read_lod(args[0], options.get("start", 0), options.get("end"),
+                                options.get("width", 1000), options.get("series"))
+
+
+JOBS = {
+    "analyze": job_analyze,
+    "read_pickle": job_read_pickle,
+    "read_pickle_batch": job_read_pickle_batch,
+    "harmony": job_harmony,
+    "lod": job_lod,
+}
+
+
+def warm_up(sr=22050, duration=1.0):
+    """
+    librosa のフィルタバンク・窓関数のキャッシュや numba の JIT、モデルの読み込み・sklearn の import
+    （analyze_audio は最初に使うときに行う）を最初のジョブの前に済ませておく
+    """
+    import sklearn.preprocessing  # analyze_audio.analyze の標準化で使う
+    rng = np.random.default_rng(0)
+    y = (0.1 * rng.standard_normal(int(sr * duration))).astype(np.float32)
+    features = analyze_audio.extract_framewise_features(y, sr)
+    X, _ = analyze_audio.compute_window_stats_frames(features, 43, 10, include_last='short')
+    analyze_audio.predict_windows(X)
+    for engine in analyze_audio.pitch_engine.PITCH_ENGINES:
+        analyze_audio.extract_pitch(y, sr, engine=engine)
+    analyze_audio.extract_volume(y)
+    # サンプリング周波数・n_fft の違うプリセットのフィルタバンクも作っておく
+    for preset in analyze_audio.presets.PRESETS.values():
+        if preset["sr"] is not None:
+            analyze_audio.extract_framewise_features(y[:preset["sr"]], preset["sr"],
+                                                     hop_length=preset["hop_length"], n_fft=preset["n_fft"])
+
+
+def handle(line, partial=None):
+    """
+    partial: 途中の結果を 1 件ずつ返す関数（generator を返すジョブで使う）
+             None なら途中の結果は read_pickle.py --batch と同じ NDJSON にまとめて output で返す
+    """
+    job = json.loads(line)
+    job_id = job.get("id")
+    fn = JOBS.get(job.get("type"))
+    if fn is None:
+        return {"id": job_id, "ok": False, "error": f"unknown job type: {job.get('type')}"}
+    try:
+        # ANALYZER_METRICS が有効なら、ジョブとその中の処理の区間を stderr に 1 行ずつ出す（metrics.py）
+        with metrics.span(f"job.{job.get('type')}", id=job_id, files=len(job.get("args", []))):
+            # 解析中の print などが応答の行に混ざらないよう、ジョブ実行中の標準出力は stderr に逃がす
+            with contextlib.redirect_stdout(sys.stderr):
+                result = fn(job.get("args", []), job.get("options") or {})
+                if isinstance(result, types.GeneratorType):
+                    with metrics.span("job.partial") as sp:
+                        if partial is None:
+                            result = "\n".join(json.dumps(r, ensure_ascii=False) for r in result)
+                        else:
+                            n = 0
+                            for r in result:
+                                partial({"id": job_id, "partial": r})
+                                n += 1
+                            result = ""
+                            sp.set(parts=n)
+            # 文字列を返すジョブ（NDJSON など）はそのまま、それ以外は JSON にして返す
+            with metrics.span("job.json") as sp:
+                output = result if isinstance(result, str) else json.dumps(result, ensure_ascii=False)
+                sp.set(chars=len(output))
+        return {"id": job_id, "ok": True, "output": output}
+    except Exception as e:
+        traceback.print_exc(file=sys.stderr)
+        return {"id": job_id, "ok": False, "error": f"{type(e).__name__}: {e}"}
+
+
+def main():
+    out = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        warm_up()
+    out.write(json.dumps({"ready": True}) + "\n")
+    out.flush()
+
+    def write(message):
+        out.write(json.dumps(message, ensure_ascii=False) + "\n")
+        out.flush()
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            response = handle(line, partial=write)
+        except json.JSONDecodeError as e:
+            response = {"id": None, "ok": False, "error": f"invalid request: {e}"}
+        write(response)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+import os
+import json
+import struct
+import numpy as np
+import lod
+
+# 解析結果の列指向ファイル（録音と同じ場所に <録音名>.cols として保存）
+#
+#   [0:8)    MAGIC
+#   [8:12)   ヘッダ（JSON, UTF-8）のバイト数  uint32 little endian
+#   [12:..)  ヘッダ {"version": 1, "columns": {名前: {"dtype", "offset", "length"}}, "meta": {...}}
+#   以降     各列のデータ（先頭は ALIGN バイト境界に揃える）
+#
+# 列は np.memmap でそのまま参照できるので、必要な列だけを読み出せる
+
+MAGIC = b"HZACOLS\n"
+FORMAT_VERSION = 1
+ALIGN = 64
+ARTIFACT_EXT = ".cols"
+DEFAULT_DTYPE = "<f4"
+# 協和度用の f0（harmony_analize.py）の列名。設定値は meta に同じ名前で入れる
+HARMONY_F0_KEY = "harmony_f0"
+# 解析の設定（presets.describe の戻り値）を入れる meta のキー
+ANALYSIS_KEY = "analysis"
+# 縮約ピラミッド（lod.py）のレベル数を入れる meta のキー
+LOD_KEY = "lod"
+# 出力のフレームのサンプリング周波数が記録されていない（プリセット導入前の）ファイルで使う値
+DEFAULT_OUTPUT_SR = 48000
+
+
+def artifact_path(audio_path):
+    """録音（.webm / .wav / .pkl）のパスから列指向ファイルのパスを作る"""
+    return os.path.splitext(audio_path)[0] + ARTIFACT_EXT
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _layout(columns, meta):
+    """
+    columns: {名前: (dtype, 長さ)}
+    戻り値: schema, ヘッダのバイト列, ファイル全体のバイト数
+    """
+    # ヘッダの長さで列の位置が変わるので、位置を仮に決めてから長さが落ち着くまで繰り返す
+    data_start = 0
+    while True:
+        offset = end = data_start
+        schema = {}
+        for name, (dtype, length) in columns.items():
+            dtype = np.dtype(dtype)
+            schema[name] = {"dtype": dtype.str, "offset": offset, "length": int(length)}
+            end = offset + dtype.itemsize * int(length)
+            offset = _align(end)
+        header = json.dumps({"version": FORMAT_VERSION, "columns": schema, "meta": meta or {}},
+                            ensure_ascii=False).encode("utf-8")
+        needed = _align(len(MAGIC) + 4 + len(header))
+        if needed == data_start:
+            return schema, header, max(end, needed)
+        data_start = needed
+
+
+class ArtifactWriter:
+    """
+    列の長さを先に決めてファイルを確保し、列を少しずつ書き込む（書き込んだ順・範囲は自由）
+    close() で一時ファイルから置き換えるので、読み込み中のプロセスが書きかけのファイルを見ることはない
+    """
+
+    def __init__(self, path, lengths, meta=None, dtypes=None):
+        """lengths: {名前: 長さ}（この順が列の順になる）  dtypes: {名前: dtype}  指定のない列は float32"""
+        dtypes = dtypes or {}
+        columns = {name: (dtypes.get(name, DEFAULT_DTYPE), n) for name, n in lengths.items()}
+        self.schema, header, size = _layout(columns, meta)
+        self.path = path
+        self.tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(self.tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<I", len(header)))
+            f.write(header)
+            f.truncate(size)
+        self._raw = np.memmap(self.tmp_path, dtype=np.uint8, mode="r+") if size else None
+
+    def write(self, name, start, values):
+        spec = self.schema[name]
+        dtype = np.dtype(spec["dtype"])
+        values = np.asarray(values, dtype=dtype)
+        if values.ndim != 1 or start < 0 or start + len(values) > spec["length"]:
+            raise ValueError(f"{name}: 列の範囲外です (start={start}, n={len(values)}, length={spec['length']})")
+        begin = spec["offset"] + start * dtype.itemsize
+        self._raw[begin:begin + values.nbytes] = values.view(np.uint8)
+
+    def read(self, name, start=0, stop=None):
+        """書き込んだ列 name の [start:stop) を読み戻す（コピーせずに返す）"""
+        spec = self.schema[name]
+        dtype = np.dtype(spec["dtype"])
+        start, stop, _ = slice(start, stop).indices(spec["length"])
+        stop = max(start, stop)
+        begin = spec["offset"] + start * dtype.itemsize
+        return self._raw[begin:begin + (stop - start) * dtype.itemsize].view(dtype)
+
+    def close(self):
+        if self._raw is not None:
+            self._raw.flush()
+            self._raw = None
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self._raw = None
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def write_artifact(path, columns, meta=None, dtypes=None):
+    """
+    columns: {名前: 1 次元配列}（書き込む順が列の順になる）
+    meta: ヘッダに入れる JSON にできる値
+    dtypes: {名前: dtype}  指定のない列は float32
+    """
+    dtypes = dtypes or {}
+    arrays = {}
+    for name, values in columns.items():
+        arr = np.ascontiguousarray(values, dtype=np.dtype(dtypes.get(name, DEFAULT_DTYPE)))
+        if arr.ndim != 1:
+            raise ValueError(f"{name}: 1 次元の列のみ保存できます (shape={arr.shape})")
+        arrays[name] = arr
+
+    writer = ArtifactWriter(path, {name: len(arr) for name, arr in arrays.items()}, meta,
+                            {name: arr.dtype for name, arr in arrays.items()})
+    try:
+        for name, arr in arrays.items():
+            writer.write(name, 0, arr)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+
+
+class Artifact:
+    """列指向ファイルの読み込み（列は必要になったときにメモリマップから切り出す）"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path}: 解析結果ファイルではありません")
+            (header_len,) = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(header_len).decode("utf-8"))
+        if header.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path}: 未対応のバージョンです (version={header.get('version')})")
+        self.schema = header["columns"]
+        self.meta = header.get("meta", {})
+        self._raw = None
+
+    @property
+    def names(self):
+        return list(self.schema)
+
+    def __contains__(self, name):
+        return name in self.schema
+
+    def column(self, name, start=0, stop=None):
+        """列 name の [start:stop) をコピーせずに返す（読み取り専用）"""
+        spec = self.schema[name]
+        if self._raw is None:
+            self._raw = np.memmap(self.path, dtype=np.uint8, mode="r")
+        dtype = np.dtype(spec["dtype"])
+        start, stop, _ = slice(start, stop).indices(spec["length"])
+        stop = max(start, stop)
+        begin = spec["offset"] + start * dtype.itemsize
+        return self._raw[begin:begin + (stop - start) * dtype.itemsize].view(dtype)
+
+    def to_dict(self, names=None):
+        """{名前: list}（JSON にそのまま渡せる形）"""
+        return {name: self.column(name).tolist() for name in (names or self.names)}
+
+
+# === 解析結果（analyze_audio.py）の保存・読み込み ===
+class AnalysisWriter(ArtifactWriter):
+    """close() のときに各系列の縮約ピラミッド（lod.py）を書き込んでから閉じる"""
+
+    def __init__(self, path, lengths, meta, dtypes, series_names, n_frames):
+        super().__init__(path, lengths, meta, dtypes)
+        self.series_names = list(series_names)
+        self.n_frames = n_frames
+
+    def close(self):
+        if self._raw is not None:
+            self._write_lod()
+        super().close()
+
+    def _write_lod(self):
+        for name in self.series_names:
+            for k in range(1, lod.n_levels(self.n_frames) + 1):
+                for b0 in range(0, self.n_frames, lod.BLOCK_FRAMES):
+                    dec = lod.decimate(self.read(name, b0, b0 + lod.BLOCK_FRAMES), k, name in lod.SKIP_ZERO)
+                    for stat in lod.STATS:
+                        self.write(lod.column_name(name, k, stat), b0 >> k, dec[stat])
+
+
+def analysis_writer(path, series_names, n_frames, harmony_params=None, n_harmony=0, analysis=None):
+    """
+    save_analysis と同じ形のファイルを少しずつ書くための ArtifactWriter（stream_analyzer.py 用）
+    harmony_params: 協和度用 f0 の設定値（harmony_analize.HARMONY_F0_PARAMS）
+    analysis: 解析の設定（presets.describe の戻り値）
+    """
+    lengths = {name: n_frames for name in series_names}
+    meta = {"series": list(series_names)}
+    if analysis is not None:
+        meta[ANALYSIS_KEY] = dict(analysis)
+    dtypes = {}
+    if harmony_params is not None:
+        lengths[HARMONY_F0_KEY] = n_harmony
+        dtypes[HARMONY_F0_KEY] = "<f8"
+        meta[HARMONY_F0_KEY] = dict(harmony_params)
+    # 系列の縮約ピラミッド（列は系列 → レベル → min / max / mean の順）
+    levels = lod.n_levels(n_frames)
+    meta[LOD_KEY] = {"levels": levels}
+    for name in series_names:
+        for k in range(1, levels + 1):
+            for stat in lod.STATS:
+                lengths[lod.column_name(name, k, stat)] = lod.level_length(n_frames, k)
+    return AnalysisWriter(path, lengths, meta, dtypes, series_names, n_frames)
+
+
+def save_analysis(path, series, harmony_f0=None, analysis=None):
+    """
+    series: {"pitch": ..., "volume": ..., "brightness": ..., ...}  フレームごとの値（float32 で保存）
+    harmony_f0: harmony_analize.harmony_f0_entry の戻り値（f0 は誤差なく使えるよう float64 で保存）
+    analysis: 解析の設定（presets.describe の戻り値）
+    """
+    lengths = {name: len(v) for name, v in series.items()}
+    if len(set(lengths.values())) > 1:
+        raise ValueError(f"系列の長さが揃っていません: {lengths}")
+    params = None if harmony_f0 is None else {k: v for k, v in harmony_f0.items() if k != "f0"}
+    n_harmony = 0 if harmony_f0 is None else len(harmony_f0["f0"])
+    writer = analysis_writer(path, list(series), next(iter(lengths.values()), 0), params, n_harmony, analysis)
+    try:
+        for name, values in series.items():
+            writer.write(name, 0, values)
+        if harmony_f0 is not None:
+            writer.write(HARMONY_F0_KEY, 0, harmony_f0["f0"])
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+
+
+def series_names(art):
+    return art.meta.get("series") or [n for n in art.names if n != HARMONY_F0_KEY and "@" not in n]
+
+
+def load_analysis(path):
+    """{"pitch": list, "volume": list, ...}（read_pickle.py が返していたものと同じ形）"""
+    art = Artifact(path)
+    return art.to_dict(series_names(art))
+
+
+def frame_rate(meta):
+    """出力のフレームレート（フレーム / 秒）"""
+    analysis = meta.get(ANALYSIS_KEY) or {}
+    return analysis.get("output_sr", DEFAULT_OUTPUT_SR) / analysis.get("output_hop_length", 512)
+
+
+def load_lod(path, start, end, width, names=None):
+    """
+    時間範囲 [start, end)（秒。end が None なら最後まで）を width ピクセルに描くための縮約（lod.select の戻り値）
+    縮約ピラミッドの無い（導入前の）ファイルは元の系列から計算する
+    """
+    art = Artifact(path)
+    available = series_names(art)
+    names = names or available
+    lod.check_names(names, available)
+    n_frames = art.schema[names[0]]["length"] if names else 0
+    levels = (art.meta.get(LOD_KEY) or {}).get("levels")
+
+    computed = {}
+
+    def read(name, k, stat, b0, b1):
+        if k == 0:
+            return art.column(name, b0, b1)
+        if levels is not None:
+            return art.column(lod.column_name(name, k, stat), b0, b1)
+        if name not in computed:
+            computed[name] = lod.decimate(art.column(name, b0 << k, b1 << k), k, name in lod.SKIP_ZERO)
+        return computed[name][stat]
+
+    rate = frame_rate(art.meta)
+    f1 = n_frames if end is None else int(np.ceil(float(end) * rate))
+    return lod.select(read, n_frames, lod.n_levels(n_frames) if levels is None else levels, names,
+                      int(float(start) * rate), f1, width, rate)
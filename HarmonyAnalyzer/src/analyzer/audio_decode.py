@@ -0,0 +1,161 @@
+import os
+import json
+import subprocess
+import tempfile
+import numpy as np
+import librosa
+import soundfile as sf
+
+# アップロードされた録音（webm / opus）を wav に変換せず、ffmpeg の標準出力から直接読み込む
+#
+# ffmpeg には 16 bit PCM（元の チャンネル数・サンプリング周波数のまま）を出力させ、
+# soundfile・librosa.load と同じ手順で float32 のモノラルにする。
+# 以前の「ffmpeg で wav に変換 → librosa.load」と同じ値になるので、解析結果は変わらない
+#
+# 長い録音は decode で全体を読み込まず、PcmPipe で標準出力をブロックごとに読む（stream_analyzer.PipeSource）
+
+FFMPEG = os.environ.get("FFMPEG_PATH", "ffmpeg")
+FFPROBE = os.environ.get("FFPROBE_PATH", "ffprobe")
+STDERR_TAIL = 2000  # 失敗したときに例外に含める ffmpeg の標準エラーの末尾（文字数）
+READ_BYTES = 1 << 20  # PcmPipe で 1 回に読むバイト数
+
+
+def soundfile_readable(path):
+    """soundfile（libsndfile）で直接読める形式か（wav / flac など。webm は読めない）"""
+    try:
+        sf.info(path)
+        return True
+    except Exception:
+        return False
+
+
+def _ffprobe(path):
+    cmd = [FFPROBE, "-v", "error", "-select_streams", "a:0",
+           "-show_entries", "stream=sample_rate,channels,duration:format=duration", "-of", "json", path]
+    result = subprocess.run(cmd, capture_output=True, check=False)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe failed ({path}): {result.stderr.decode(errors='ignore').strip()}")
+    info = json.loads(result.stdout or b"{}")
+    if not info.get("streams"):
+        raise ValueError(f"{path}: 音声ストリームがありません")
+    return info
+
+
+def probe(path):
+    """最初の音声ストリームの (サンプリング周波数, チャンネル数)"""
+    stream = _ffprobe(path)["streams"][0]
+    return int(stream["sample_rate"]), int(stream["channels"])
+
+
+def duration(path):
+    """
+    録音の長さ（秒）。録音全体を読み込まずに求める
+    ffprobe で分からないとき（MediaRecorder の webm はヘッダに長さが無い）は、ffmpeg の出力を流し読みして数える
+    """
+    info = _ffprobe(path)
+    for d in (info["streams"][0].get("duration"), (info.get("format") or {}).get("duration")):
+        try:
+            return float(d)
+        except (TypeError, ValueError):
+            pass
+    sr, _ = probe(path)
+    return count_samples(path) / sr
+
+
+def _ffmpeg_cmd(path):
+    return [FFMPEG, "-nostdin", "-v", "error", "-i", path, "-map", "0:a:0",
+            "-f", "s16le", "-acodec", "pcm_s16le", "pipe:1"]
+
+
+def to_float(pcm, channels):
+    """16 bit PCM（インターリーブ）を librosa.load と同じ float32 のモノラルにする"""
+    pcm = pcm[:len(pcm) - len(pcm) % channels].reshape(-1, channels)
+    # soundfile は 16 bit を 1/32768 倍した float32 で返す（(サンプル, チャンネル) の並びも同じにしておく）
+    y = (pcm.astype(np.float32) * np.float32(1.0 / 32768)).T
+    return librosa.to_mono(y) if channels > 1 else y[0]
+
+
+class PcmPipe:
+    """
+    ffmpeg の標準出力から 16 bit PCM をブロックごとに読む
+    標準エラーは一時ファイルに書かせる（標準出力だけを読み続けても、標準エラーのパイプが埋まって止まることがない）
+    """
+
+    def __init__(self, path, channels):
+        self.path = path
+        self.channels = channels
+        self.err = tempfile.TemporaryFile()
+        self.proc = subprocess.Popen(_ffmpeg_cmd(path), stdout=subprocess.PIPE, stderr=self.err)
+        self.rest = b""
+
+    def read_bytes(self, n_bytes=READ_BYTES):
+        """次のブロック（PCM のまま）。最後まで読んだら b''（ffmpeg が失敗していたら RuntimeError）"""
+        chunk = self.proc.stdout.read(n_bytes)
+        if not chunk:
+            self._finish()
+        return chunk
+
+    def read(self, n_bytes=READ_BYTES):
+        """次のブロック（float32 のモノラル）。最後まで読んだら None"""
+        chunk = self.read_bytes(n_bytes)
+        if not chunk:
+            return None
+        data = self.rest + chunk
+        usable = len(data) - len(data) % (2 * self.channels)
+        self.rest = data[usable:]
+        return to_float(np.frombuffer(data[:usable], dtype="<i2"), self.channels)
+
+    def _finish(self):
+        code = self.proc.wait()
+        if code != 0:
+            self.err.seek(0)
+            tail = self.err.read().decode(errors="ignore").strip()[-STDERR_TAIL:]
+            raise RuntimeError(f"ffmpeg failed ({self.path}, code {code}): {tail}")
+
+    def close(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+        self.proc.stdout.close()
+        self.err.close()
+
+
+def count_samples(path):
+    """ffmpeg の出力を流し読みして数えたサンプル数（decode の戻り値の長さと同じ）"""
+    _, channels = probe(path)
+    pipe = PcmPipe(path, channels)
+    total = 0
+    try:
+        while chunk := pipe.read_bytes():
+            total += len(chunk)
+    finally:
+        pipe.close()
+    return total // (2 * channels)
+
+
+def decode(path):
+    """
+    ffmpeg のパイプで録音を読む
+    戻り値: (モノラル float32 の信号, サンプリング周波数)  librosa.load(wav, sr=None) と同じ値
+    """
+    sr, channels = probe(path)
+    cmd = _ffmpeg_cmd(path)
+    # 標準出力と標準エラーは communicate で同時に読む
+    # （標準出力を読み切ってから標準エラーを読むと、ffmpeg が標準エラーのパイプを埋めたところで互いに待ち続ける）
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = proc.communicate()
+    if proc.returncode != 0:
+        tail = err.decode(errors="ignore").strip()[-STDERR_TAIL:]
+        raise RuntimeError(f"ffmpeg failed ({path}, code {proc.returncode}): {tail}")
+
+    return to_float(np.frombuffer(out, dtype="<i2"), channels), sr
+
+
+def load_audio(path, sr=None):
+    """librosa.load(path, sr=sr) と同じ (信号, サンプリング周波数)。soundfile で読めない形式は ffmpeg で読む"""
+    if soundfile_readable(path):
+        return librosa.load(path, sr=sr)
+    y, native_sr = decode(path)
+    if sr is not None and sr != native_sr:
+        return librosa.resample(y, orig_sr=native_sr, target_sr=sr), sr
+    return y, native_sr
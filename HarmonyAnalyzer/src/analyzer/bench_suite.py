@@ -0,0 +1,260 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+import librosa
+import soundfile as sf
+
+import feature_engine
+import harmony_analize
+import read_pickle
+import analyze_audio
+from artifact import save_analysis
+from benchmark import synth_f0_tracks
+
+# 解析の処理ごとの時間・メモリを、毎回同じ合成音で測るベンチマーク（録音ファイル・ネットワーク不要）
+#
+#   python3 bench_suite.py                                  quick（10 秒・1 分、1・5 トラック）を測って表を出す
+#   python3 bench_suite.py --profile full                   10 秒〜30 分、1〜30 トラック
+#       解析と同じく STREAM_MIN_SECONDS（10 分）以上の録音はブロックごとの解析（analyze_stream）をまとめて測る
+#       （録音全体の特徴量は 10 分で 2 GB ほどになり、30 分では普通のマシンのメモリに載らない）
+#   python3 bench_suite.py --save-baseline bench_baseline.json
+#   python3 bench_suite.py --baseline bench_baseline.json [--threshold 0.25]
+#       基準より threshold（割合）以上遅い・メモリが多い、または処理結果の値が変わった項目があれば終了コード 1
+#
+# 時間は repeat 回の最小値、メモリは別に 1 回 tracemalloc で測った Python / NumPy の確保量の最大値
+# （この 1 回がウォームアップも兼ねるので、numba の JIT やフィルタバンクの作成は時間に入らない）
+# 基準は同じマシン・同じライブラリ・同じモデルで取ったものと比べる（記録した環境が違えば警告を出す）
+
+PROFILES = {
+    "quick": {"durations": (10, 60), "tracks": (1, 5), "pyin_max": 10},
+    "full": {"durations": (10, 60, 600, 1800), "tracks": (1, 5, 30), "pyin_max": 60},
+}
+SR = 48000            # MediaRecorder の録音と同じ
+LONG_SECONDS = 600    # これ以上の長さは 1 回だけ測る
+MIN_SECONDS = 0.005   # 時間の差がこれより小さい項目は遅くなったとみなさない（計測の揺れ）
+MIN_MIB = 1.0         # 同じくメモリ
+VALUE_RTOL = 1e-6
+BATCH_MAX_SECONDS = 20000  # read_pickle_batch は 曲数 x 長さ がこれを超える組み合わせを測らない（結果の JSON を全部持つのでメモリが足りない）
+
+
+# === 合成音 ===
+def synth_audio(duration, sr=SR, seed=0):
+    """
+    1 秒ごとに 和音（3 声・ビブラート）/ 単音 / 無音 が入れ替わる信号 + 少量のノイズ
+    同じ引数なら毎回同じ信号になる（1 秒ずつ作るので 30 分でも一時的なメモリは小さい）
+    """
+    rng = np.random.default_rng(seed)
+    n_seg = int(np.ceil(duration))
+    kinds = rng.choice(3, n_seg, p=[0.5, 0.35, 0.15])  # 0: 和音 1: 単音 2: 無音
+    roots = 261.63 * 2 ** (rng.integers(-9, 10, n_seg) / 12)
+    t = np.arange(sr) / sr
+    vibrato = 1.0 + 0.005 * np.sin(2 * np.pi * 5.5 * t)
+    y = np.empty(n_seg * sr, dtype=np.float32)
+    for i in range(n_seg):
+        seg = 0.003 * rng.standard_normal(sr)
+        if kinds[i] != 2:
+            ratios = (1.0, 1.25, 1.5) if kinds[i] == 0 else (1.0,)
+            seg += 0.3 * sum(np.sin(2 * np.pi * roots[i] * r * vibrato * t) for r in ratios) / len(ratios)
+        y[i * sr:(i + 1) * sr] = seg
+    return y[:int(duration * sr)]
+
+
+# === 計測 ===
+def measure(fn, repeat):
+    """
+    戻り値: (repeat 回の最小時間 [秒], tracemalloc で測った確保量の最大値 [MiB], fn の戻り値)
+    """
+    tracemalloc.start()
+    try:
+        out = fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, peak / 2**20, out
+
+
+def summary(x):
+    """処理結果の値の要約（結果が変わっていないかの確認用）"""
+    x = np.asarray(x, dtype=np.float64)
+    return float(np.nanmean(x)) if np.isfinite(x).any() else float("nan")
+
+
+def models_available():
+    return os.path.exists(analyze_audio.bundle_file) or all(
+        os.path.exists(p) for p in analyze_audio.model_files.values())
+
+
+def environment(profile):
+    import sklearn
+    return {"profile": profile, "python": platform.python_version(), "numpy": np.__version__,
+            "librosa": librosa.__version__, "sklearn": sklearn.__version__,
+            "machine": platform.machine(), "processor": platform.processor(), "cpus": os.cpu_count()}
+
+
+def run_suite(profile="quick", repeat=3, only=None):
+    """
+    戻り値: {"<処理>/<条件>": {"seconds": 秒, "peak_mib": MiB, "value": 結果の要約}}
+    only: 測る処理の名前の集合（None は全部）
+    """
+    conf = PROFILES[profile]
+    results = {}
+
+    def record(stage, case, fn, value=summary, n=repeat):
+        if only and stage not in only:
+            return None
+        key = f"{stage}/{case}"
+        seconds, peak, out = measure(fn, n)
+        results[key] = {"seconds": seconds, "peak_mib": peak, "value": value(out)}
+        print(f"  {key:28s} {seconds * 1000:10.1f} ms  {peak:8.1f} MiB", flush=True)
+        return out
+
+    has_models = models_available()
+    if not has_models:
+        print("[bench_suite] 学習済みモデルが無いので predict / upsample / read_pickle は測りません")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for duration in conf["durations"]:
+            n = 1 if duration >= LONG_SECONDS else repeat
+            case = f"{duration}s"
+            print(f"[bench_suite] {case}")
+            y = synth_audio(duration)
+            cols = os.path.join(tmp, f"{case}.cols")
+
+            if duration >= analyze_audio.STREAM_MIN_SECONDS:
+                if has_models:
+                    wav = os.path.join(tmp, f"{case}.wav")
+                    sf.write(wav, y, SR, subtype="FLOAT")
+                    record("analyze_stream", case, lambda: analyze_audio.analyze_stream(wav),
+                           value=lambda r: summary(np.concatenate([np.asarray(v) for v in r.values()])), n=n)
+                    if os.path.exists(analyze_audio.artifact_path(wav)):
+                        os.replace(analyze_audio.artifact_path(wav), cols)
+                        os.remove(wav)
+                del y
+                measure_reads(record, cols, case, duration, conf["tracks"], n, has_models)
+                measure_harmony(record, case, duration, conf["tracks"], n)
+                continue
+
+            features = record("features", case, lambda: feature_engine.extract_framewise_features(y, SR), n=n)
+            if features is None:
+                features = feature_engine.extract_framewise_features(y, SR)
+            window_frames, step_frames = analyze_audio.window_params(SR)
+            X, times_frames = analyze_audio.compute_window_stats_frames(features, window_frames, step_frames)
+            record("window_stats", case,
+                   lambda: analyze_audio.compute_window_stats_frames(features, window_frames, step_frames)[0], n=n)
+            pitch = record("pitch_yin", case, lambda: analyze_audio.extract_pitch(y, SR, engine="yin"), n=n)
+            if duration <= conf["pyin_max"]:
+                record("pitch_pyin", case, lambda: analyze_audio.extract_pitch(y, SR, engine="pyin"), n=1)
+
+            if has_models:
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    X_scaled = np.nan_to_num((X - np.nanmean(X, axis=0)) / np.nanstd(X, axis=0))
+                preds = analyze_audio.predict_windows(X_scaled)
+                record("predict", case, lambda: analyze_audio.predict_windows(X_scaled),
+                       value=lambda p: summary(np.concatenate(list(p.values()))), n=n)
+                T = len(features)
+                series = record("upsample", case,
+                                lambda: {k: analyze_audio.upsample_series_to_frames(v, times_frames, T)
+                                         for k, v in preds.items()},
+                                value=lambda s: summary(np.concatenate(list(s.values()))), n=n)
+                if series is None:
+                    series = {k: analyze_audio.upsample_series_to_frames(v, times_frames, T) for k, v in preds.items()}
+                if pitch is None:
+                    pitch = analyze_audio.extract_pitch(y, SR, engine="yin")
+                save_analysis(cols, {"pitch": pitch[:T], "volume": analyze_audio.extract_volume(y)[:T],
+                                     **series})
+            measure_reads(record, cols, case, duration, conf["tracks"], n, has_models)
+            measure_harmony(record, case, duration, conf["tracks"], n)
+    return results
+
+
+def measure_reads(record, cols, case, duration, tracks, n, has_models):
+    """解析結果（.cols）の読み込み。サーバーが返すのと同じく JSON の文字列にするまで"""
+    if not has_models or not os.path.exists(cols):
+        return
+    record("read_pickle", case, lambda: json.dumps(read_pickle.read_pickle(cols)), value=len, n=n)
+    for n_tracks in tracks:
+        if n_tracks * duration > BATCH_MAX_SECONDS:
+            continue
+        record("read_pickle_batch", f"{case}x{n_tracks}",
+               lambda: "\n".join(read_pickle.batch_lines([cols] * n_tracks)), value=len, n=n)
+
+
+def measure_harmony(record, case, duration, tracks, n):
+    for n_tracks in tracks:
+        f0s = synth_f0_tracks(n_tracks, duration)
+        record("harmony", f"{case}x{n_tracks}", lambda: harmony_analize.harmony_scores(f0s), n=n)
+
+
+# === 基準との比較 ===
+def compare(results, baseline, threshold=0.25):
+    """
+    戻り値: 問題のあった項目の説明のリスト（遅くなった・メモリが増えた・結果の値が変わった）
+    基準に無い項目・結果に無い項目は比べない
+    """
+    problems = []
+    print(f"\n{'項目':28s} {'時間':>10s} {'基準':>10s} {'比':>6s} {'メモリ':>9s} {'基準':>9s}")
+    for key, cur in results.items():
+        base = baseline.get(key)
+        if base is None:
+            print(f"{key:28s} {cur['seconds'] * 1000:8.1f}ms {'-':>10s}")
+            continue
+        ratio = cur["seconds"] / max(base["seconds"], 1e-12)
+        flags = []
+        if ratio > 1 + threshold and cur["seconds"] - base["seconds"] > MIN_SECONDS:
+            flags.append(f"時間 x{ratio:.2f}")
+        if cur["peak_mib"] > base["peak_mib"] * (1 + threshold) and cur["peak_mib"] - base["peak_mib"] > MIN_MIB:
+            flags.append(f"メモリ {base['peak_mib']:.1f} -> {cur['peak_mib']:.1f} MiB")
+        if not np.isclose(cur["value"], base["value"], rtol=VALUE_RTOL, atol=0.0, equal_nan=True):
+            flags.append(f"結果の値 {base['value']!r} -> {cur['value']!r}")
+        print(f"{key:28s} {cur['seconds'] * 1000:8.1f}ms {base['seconds'] * 1000:8.1f}ms {ratio:6.2f} "
+              f"{cur['peak_mib']:7.1f}M {base['peak_mib']:7.1f}M  {'NG: ' + ', '.join(flags) if flags else 'ok'}")
+        problems += [f"{key}: {f}" for f in flags]
+    return problems
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="解析の処理ごとの時間・メモリを合成音で測る")
+    parser.add_argument("--profile", choices=list(PROFILES), default="quick")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", default=None, help="測る処理（カンマ区切り。例: features,pitch_yin）")
+    parser.add_argument("--baseline", default=None, help="比べる基準の JSON")
+    parser.add_argument("--save-baseline", default=None, help="結果を基準として保存する JSON")
+    parser.add_argument("--threshold", type=float, default=0.25, help="これ以上（割合）遅い・重いと失敗にする")
+    args = parser.parse_args(argv)
+
+    only = set(args.only.split(",")) if args.only else None
+    env = environment(args.profile)
+    results = run_suite(args.profile, args.repeat, only)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"environment": env, "results": results}, f, ensure_ascii=False, indent=1)
+        print(f"[bench_suite] 基準を {args.save_baseline} に保存しました")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        diff = {k: (v, env.get(k)) for k, v in baseline["environment"].items() if env.get(k) != v}
+        if diff:
+            print(f"[bench_suite] 警告: 基準と環境が違います {diff}")
+        problems = compare(results, baseline["results"], args.threshold)
+        if problems:
+            print(f"\n[bench_suite] {len(problems)} 件の退行:\n  " + "\n  ".join(problems))
+            return 1
+        print("\n[bench_suite] 基準からの退行はありません")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
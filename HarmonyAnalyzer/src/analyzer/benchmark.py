@@ -0,0 +1,645 @@
+import os
+import sys
+import time
+import warnings
+import numpy as np
+import librosa
+from scipy.stats import skew, kurtosis
+
+import feature_engine
+import pitch_engine
+import window_stats
+import tree_ensemble
+import harmony_analize
+
+hop_length = 512  # フレーム長さ
+
+# 解析そのものを測るので、解析結果のキャッシュ（result_cache.py）は使わない（子プロセスにも引き継ぐ）
+os.environ["ANALYZER_CACHE_MAX_MB"] = "0"
+
+
+# =====================================================
+# 旧実装（比較用）: 特徴量ごとに STFT / メルスペクトログラムを計算していた版
+# =====================================================
+def legacy_compute_spectral_flux(y, hop_length):
+    S = np.abs(librosa.stft(y, hop_length=hop_length))
+    flux = np.sqrt(np.sum(np.diff(S, axis=1) ** 2, axis=0))
+    flux = np.insert(flux, 0, 0)
+    return flux
+
+
+def legacy_compute_high_freq_energy(y, sr, hop_length, cutoff_freq=4000):
+    S = np.abs(librosa.stft(y, hop_length=hop_length))
+    freqs = librosa.fft_frequencies(sr=sr)
+    hf_idx = np.where(freqs >= cutoff_freq)[0]
+    hf_energy = np.sum(S[hf_idx, :], axis=0)
+    return hf_energy
+
+
+def legacy_extract_framewise_features(y, sr):
+    mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13, hop_length=hop_length)
+    delta_mfcc = librosa.feature.delta(mfcc)
+    zcr = librosa.feature.zero_crossing_rate(y, hop_length=hop_length)
+    rms = librosa.feature.rms(y=y, hop_length=hop_length)
+    centroid = librosa.feature.spectral_centroid(y=y, sr=sr, hop_length=hop_length)
+    bandwidth = librosa.feature.spectral_bandwidth(y=y, sr=sr, hop_length=hop_length)
+    rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr, hop_length=hop_length)
+    flatness = librosa.feature.spectral_flatness(y=y, hop_length=hop_length)
+    chroma = librosa.feature.chroma_stft(y=y, sr=sr, hop_length=hop_length)
+    onset_env = librosa.onset.onset_strength(y=y, sr=sr, hop_length=hop_length).reshape(1, -1)
+
+    features_list = [mfcc, delta_mfcc, zcr, rms, centroid, bandwidth, rolloff, flatness, chroma, onset_env]
+    min_len = min(x.shape[1] for x in features_list)
+    features_trimmed = [x[:, :min_len] for x in features_list]
+    feats_time = np.vstack(features_trimmed)
+
+    delta_rms = np.gradient(rms[0, :min_len])
+    delta_bandwidth = np.gradient(bandwidth[0, :min_len])
+    delta2_rms = np.gradient(delta_rms)
+    delta2_bandwidth = np.gradient(delta_bandwidth)
+
+    spectral_flux = legacy_compute_spectral_flux(y, hop_length)[:min_len]
+    delta2_flux = np.gradient(spectral_flux)
+    hf_energy = legacy_compute_high_freq_energy(y, sr, hop_length)[:min_len]
+
+    return np.column_stack([
+        feats_time.T, delta_rms, delta_bandwidth, delta2_rms, delta2_bandwidth,
+        spectral_flux, delta2_flux, hf_energy
+    ])
+
+
+# === 統計量計算（フレーム指定） ===
+def legacy_compute_window_stats_frames(features, window_frames=43, step_frames=10, include_last='short'):
+    T, D = features.shape
+    w = int(window_frames)
+    s = int(step_frames)
+    if w <= 0 or s <= 0:
+        raise ValueError("window_frames と step_frames は正の整数にしてください")
+
+    stats_list, times_frames = [], []
+    start = 0
+    while start < T:
+        end = start + w
+        if end <= T:
+            window = features[start:end, :]
+        else:
+            if include_last == 'drop':
+                break
+            elif include_last == 'pad':
+                pad_len = end - T
+                window = np.pad(features[start:T, :],
+                                ((0, pad_len), (0, 0)),
+                                mode='constant', constant_values=0.0)
+            else:  # 'short'
+                window = features[start:T, :]
+
+        # 統計量
+        means = np.mean(window, axis=0)
+        vars_  = np.var(window, axis=0)
+        skews  = skew(window, axis=0, bias=False, nan_policy='omit')
+        kurts  = kurtosis(window, axis=0, bias=False, nan_policy='omit')
+
+        stats_list.append(np.concatenate([means, vars_, skews, kurts]))
+
+        # 中心フレーム（短窓のときも実際の長さに合わせる）
+        center = start + window.shape[0] / 2
+        times_frames.append(center)
+
+        start += s
+
+    return np.asarray(stats_list), np.asarray(times_frames)
+
+
+def legacy_harmony_scores(f0s):
+    """旧 harmony_analize.py のフレームごとのループ"""
+    from itertools import combinations
+
+    min_len = min(len(f) for f in f0s)
+    frame_scores = []
+    for t in range(min_len):
+        freqs = [f0[t] for f0 in f0s if not np.isnan(f0[t])]
+        if len(freqs) < 2:
+            frame_scores.append(np.nan)
+            continue
+        ratios = [max(a, b) / min(a, b) for a, b in combinations(freqs, 2)]
+        freq_diffs = [abs(a - b) for a, b in combinations(freqs, 2)]
+        freq_ave = [(a + b) / 2 for a, b in combinations(freqs, 2)]
+        scores = [harmony_analize.consonance_score(r, d, a) for r, d, a in zip(ratios, freq_diffs, freq_ave)]
+        frame_scores.append(np.mean(scores))
+    return frame_scores
+
+
+# === 計測用の音源 ===
+def synth_signal(duration=60.0, sr=48000, seed=0):
+    """ビブラート付きの和音 + 少量のノイズ（再現性のため乱数シード固定）"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sr)) / sr
+    vibrato = 1.0 + 0.005 * np.sin(2 * np.pi * 5.0 * t)
+    y = np.zeros_like(t)
+    for f in (261.63, 329.63, 392.00):
+        y += np.sin(2 * np.pi * f * vibrato * t) / 3
+    y += 0.01 * rng.standard_normal(len(t))
+    return y.astype(np.float32), sr
+
+
+def synth_melody(duration=20.0, sr=48000, seed=0):
+    """
+    音域内のランダムな旋律（0.5 秒ごとに音が変わり、ときどき休符）
+    戻り値: y, sr, フレームごとの正解 f0（休符は 0）
+    """
+    rng = np.random.default_rng(seed)
+    n_notes = int(duration / 0.5)
+    midi = rng.integers(52, 90, n_notes).astype(float)  # E3〜F#6（クラリネットの音域内）
+    rest = rng.random(n_notes) < 0.2
+    note_len = int(0.5 * sr)
+    f_inst = np.repeat(np.where(rest, 0.0, librosa.midi_to_hz(midi)), note_len)
+    t = np.arange(len(f_inst)) / sr
+    f_inst = f_inst * (1.0 + 0.003 * np.sin(2 * np.pi * 5.0 * t))
+    phase = 2 * np.pi * np.cumsum(f_inst) / sr
+    y = sum(np.sin(h * phase) / h for h in (1, 2, 3, 4))
+    y = np.where(f_inst > 0, 0.3 * y, 0.0) + 0.003 * rng.standard_normal(len(t))
+    centers = np.arange(0, len(y) + 1, hop_length)[: 1 + len(y) // hop_length]
+    f0_true = f_inst[np.minimum(centers, len(f_inst) - 1)]
+    return y.astype(np.float32), sr, f0_true
+
+
+def load_inputs(paths):
+    if not paths:
+        return [("synth_60s", *synth_signal())]
+    inputs = []
+    for p in paths:
+        y, sr = librosa.load(p, sr=None)
+        inputs.append((p, y, sr))
+    return inputs
+
+
+def best_of(fn, repeat):
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+# === 各ステージの計測 ===
+def bench_features(paths, repeat=3):
+    # librosa の初回呼び出しのキャッシュ作成を計測に含めないようにウォームアップ
+    y0, sr0 = synth_signal(duration=2.0)
+    legacy_extract_framewise_features(y0, sr0)
+    feature_engine.extract_framewise_features(y0, sr0)
+
+    for name, y, sr in load_inputs(paths):
+        t_old, old = best_of(lambda: legacy_extract_framewise_features(y, sr), repeat)
+        t_new, new = best_of(lambda: feature_engine.extract_framewise_features(y, sr), repeat)
+        identical = old.shape == new.shape and np.array_equal(old, new)
+        max_diff = float(np.max(np.abs(old - new))) if old.shape == new.shape else float("nan")
+        print(f"[features] {name}: {len(y) / sr:.1f}s audio, shape={new.shape}")
+        print(f"  legacy : {t_old * 1000:8.1f} ms")
+        print(f"  engine : {t_new * 1000:8.1f} ms  (x{t_old / t_new:.2f})")
+        print(f"  identical={identical} max_abs_diff={max_diff:.3g}")
+
+
+def bench_window_stats(paths, repeat=3):
+    for name, y, sr in load_inputs(paths):
+        features = feature_engine.extract_framewise_features(y, sr)
+        frames_per_sec = sr / hop_length
+        w = max(1, int(round(frames_per_sec * 1.0)))
+        s = max(1, int(round(frames_per_sec * 0.1)))
+        print(f"[window_stats] {name}: features={features.shape}, window={w}, step={s}")
+        for mode in ("short", "pad", "drop"):
+            with warnings.catch_warnings():
+                # 旧実装はほぼ一定の窓で scipy の桁落ち警告を大量に出すので抑制
+                warnings.simplefilter("ignore", RuntimeWarning)
+                t_old, (old, old_t) = best_of(lambda: legacy_compute_window_stats_frames(features, w, s, mode), 1)
+            t_new, (new, new_t) = best_of(lambda: window_stats.compute_window_stats(features, w, s, mode), repeat)
+            same_nan = np.array_equal(np.isnan(old), np.isnan(new))
+            with np.errstate(all='ignore'):
+                rel = np.abs(old - new) / np.maximum(np.abs(old), 1e-6)
+            max_rel = float(np.nanmax(rel)) if rel.size else 0.0
+            print(f"  {mode:5s} legacy {t_old * 1000:8.1f} ms / engine {t_new * 1000:7.1f} ms (x{t_old / t_new:.1f})"
+                  f"  max_rel_diff={max_rel:.2e} same_nan={same_nan} same_times={np.array_equal(old_t, new_t)}")
+
+
+def compare_pitch(ref, est):
+    """ref を基準にした有声/無声の一致率、大きな誤り（50 セント超）の割合、セント誤差の中央値"""
+    n = min(len(ref), len(est))
+    ref, est = ref[:n], est[:n]
+    both = (ref > 0) & (est > 0)
+    voicing_agree = float(np.mean((ref > 0) == (est > 0)))
+    if not both.any():
+        return voicing_agree, float("nan"), float("nan")
+    cents = np.abs(1200 * np.log2(est[both] / ref[both]))
+    return voicing_agree, float(np.mean(cents > 50)), float(np.median(cents))
+
+
+def bench_pitch(paths, repeat=1):
+    """各ピッチエンジンの速度と、pyin（合成音では正解 f0）に対する精度"""
+    if paths:
+        inputs = [(p, y, sr, pitch_engine.instrument_from_path(p), None) for p, y, sr in load_inputs(paths)]
+    else:
+        y, sr, f0_true = synth_melody()
+        inputs = [("synth_melody_20s", y, sr, "クラリネット", f0_true)]
+
+    for name, y, sr, instrument, f0_true in inputs:
+        print(f"[pitch] {name}: {len(y) / sr:.1f}s audio, instrument={instrument}")
+        results = {}
+        for engine in pitch_engine.PITCH_ENGINES:
+            t, f0 = best_of(lambda: pitch_engine.extract_pitch(y, sr, engine=engine, instrument=instrument), repeat)
+            results[engine] = (t, f0)
+        t_ref, f0_ref = results["pyin"]
+        for engine, (t, f0) in results.items():
+            line = f"  {engine:12s} {t * 1000:8.1f} ms (x{t_ref / t:5.1f})"
+            agree, gross, med = compare_pitch(f0_ref, f0)
+            line += f"  vs pyin: voicing={agree:.3f} gross>50c={gross:.3f} median={med:.1f}c"
+            if f0_true is not None:
+                agree, gross, med = compare_pitch(f0_true, f0)
+                line += f"  vs truth: voicing={agree:.3f} gross>50c={gross:.3f} median={med:.1f}c"
+            print(line)
+
+
+def synth_f0_tracks(n_tracks, duration=60.0, seed=0):
+    """合奏を想定した f0 列（和音の構成音 + 揺れ、所々 NaN の無声区間）"""
+    rng = np.random.default_rng(seed)
+    n = int(duration * harmony_analize.sr / harmony_analize.hop_length)
+    base = 220.0 * 2 ** (np.repeat(rng.integers(-5, 7, n // 40 + 1), 40)[:n] / 12)
+    tracks = []
+    for _ in range(n_tracks):
+        interval = rng.choice([1.0, 1.25, 1.5, 2.0, 0.5, 1.2])
+        f0 = base * interval * (1 + 0.003 * rng.standard_normal(n))
+        f0[rng.random(n) < 0.1] = np.nan
+        tracks.append(f0)
+    return tracks
+
+
+def bench_harmony(paths, repeat=3):
+    """協和度スコア: 旧ループ vs ベクトル化（2 / 8 / 30 トラック同時）"""
+    if paths:
+        t_f0, f0s = best_of(lambda: [harmony_analize.track_f0(p) for p in paths], 1)
+        print(f"[harmony] {len(paths)} files: 読み込み + yin {t_f0 * 1000:.1f} ms")
+        cases = [(f"{len(paths)} files", f0s)]
+    else:
+        cases = [(f"{n} tracks x 60s", synth_f0_tracks(n)) for n in (2, 8, 30)]
+
+    for name, f0s in cases:
+        t_old, old = best_of(lambda: legacy_harmony_scores(f0s), 1)
+        t_new, new = best_of(lambda: harmony_analize.harmony_scores(f0s), repeat)
+        old = np.asarray(old, dtype=float)
+        same_nan = np.array_equal(np.isnan(old), np.isnan(new))
+        max_diff = np.nanmax(np.abs(old - new)) if np.isfinite(old).any() else 0.0
+        n_frames = len(new)
+        print(f"[harmony] {name}: legacy {t_old * 1000:8.1f} ms  vectorized {t_new * 1000:7.2f} ms "
+              f"(x{t_old / t_new:6.1f}, {n_frames / t_new / 1e6:.2f} M frames/s)  "
+              f"max|diff|={max_diff:.2e} nan一致={same_nan}")
+
+
+def synth_forests(n_features=208, n_samples=2000, seed=0):
+    """学習済みモデルが無いとき用: audio_8_randomforest.py と同じ設定の森を乱数データで学習"""
+    from sklearn.ensemble import RandomForestRegressor
+
+    rng = np.random.default_rng(seed)
+    X = rng.standard_normal((n_samples, n_features))
+    models = {}
+    for i, name in enumerate(["brightness", "smoothness", "thickness", "clarity", "sharpness"]):
+        target = X[:, i] + 0.5 * X[:, i + 5] ** 2 + 0.1 * rng.standard_normal(n_samples)
+        models[name] = RandomForestRegressor(n_estimators=200, random_state=42, n_jobs=-1).fit(X, target)
+    return models
+
+
+def bench_predict(paths, repeat=5):
+    """5 モデルの予測: sklearn（モデルごとに predict） vs CompiledForest（1 回で全モデル）"""
+    if paths:
+        import joblib
+        models = {}
+        for p in paths:
+            name = p.rsplit("/", 1)[-1].replace("rf_model_", "").replace(".pkl", "")
+            models[name] = joblib.load(p)
+    else:
+        models = synth_forests()
+
+    forest = tree_ensemble.CompiledForest.from_sklearn(models)
+    forest.predict(np.zeros((1, forest.n_features)))  # JIT コンパイルを計測から外す
+    print(f"[predict] {len(forest.roots)} trees / {len(forest.feature)} nodes")
+    # 窓は 0.1 秒ごとなので、30 秒 / 3 分 / 10 分の録音に相当する行数
+    for n_rows in (300, 1800, 6000):
+        t_sk, t_cf, max_err = tree_ensemble.bench_models(models, forest, n_rows=n_rows, repeat=repeat)
+        print(f"  {n_rows:5d} windows: sklearn {t_sk * 1000:8.1f} ms  compiled {t_cf * 1000:8.1f} ms "
+              f"(x{t_sk / t_cf:5.1f})  max|diff|={max_err:.3g}")
+
+
+def _peak_memory(fn):
+    """fn の実行時間と、実行中に確保された Python / NumPy のメモリの最大値（tracemalloc）"""
+    import tracemalloc
+    tracemalloc.start()
+    try:
+        t0 = time.perf_counter()
+        out = fn()
+        t = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return t, peak, out
+
+
+def bench_stream(paths, block_sizes=(37, 256, 1024)):
+    """
+    ブロック解析（stream_analyzer.py）と録音全体を読み込む解析の .cols がバイト単位で一致するか、
+    ブロックの境界がいろいろな位置に来るよう小さなブロックでも確かめ、時間と最大メモリを比べる
+    """
+    import os
+    import tempfile
+    import soundfile as sf
+    import analyze_audio  # 学習済みモデルを読み込む
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if not paths:
+            paths = []
+            for minutes in (1, 3):
+                y, sr, _ = synth_melody(duration=60.0 * minutes)
+                p = os.path.join(tmp, f"synth_{minutes}min.wav")
+                sf.write(p, y, sr, subtype="FLOAT")
+                paths.append(p)
+
+        for p in paths:
+            # 元の録音の横に .cols を作らないよう、コピーしてから解析する
+            wav = os.path.join(tmp, "in" + os.path.splitext(p)[1])
+            with open(p, "rb") as src, open(wav, "wb") as dst:
+                dst.write(src.read())
+            cols = analyze_audio.artifact_path(wav)
+
+            t_mem, peak_mem, _ = _peak_memory(lambda: analyze_audio.analyze(wav, "yin", stream=False))
+            with open(cols, "rb") as f:
+                ref = f.read()
+            print(f"[stream] {os.path.basename(p)}: {sf.info(wav).duration:.1f}s  "
+                  f"in-memory {t_mem:6.2f} s  peak {peak_mem / 2**20:7.1f} MiB")
+            for block in block_sizes:
+                t, peak, _ = _peak_memory(lambda: analyze_audio.analyze_stream(wav, block_frames=block))
+                with open(cols, "rb") as f:
+                    same = f.read() == ref
+                print(f"  block={block:5d} frames  {t:6.2f} s  peak {peak / 2**20:7.1f} MiB  同一={same}")
+
+
+def bench_decode(paths, repeat=3):
+    """
+    アップロードされた webm の読み込み: 旧「ffmpeg で wav に変換 → librosa.load」と
+    新「ffmpeg のパイプから直接読む（audio_decode.py）」の時間・ディスクに書いたバイト数を比べ、
+    読み込んだ信号が一致するかを確かめる（ffmpeg / ffprobe が必要）
+    """
+    import os
+    import subprocess
+    import tempfile
+    import soundfile as sf
+    import audio_decode
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if not paths:
+            # MediaRecorder と同じ webm / opus（48 kHz）を作る
+            paths = []
+            for minutes in (1, 5):
+                y, sr, _ = synth_melody(duration=60.0 * minutes)
+                wav = os.path.join(tmp, f"synth_{minutes}min.wav")
+                sf.write(wav, y, sr)
+                p = os.path.join(tmp, f"synth_{minutes}min.webm")
+                subprocess.run([audio_decode.FFMPEG, "-nostdin", "-v", "error", "-i", wav,
+                                "-c:a", "libopus", "-b:a", "128k", p], check=True)
+                os.remove(wav)
+                paths.append(p)
+
+        for p in paths:
+            wav = os.path.join(tmp, "converted.wav")
+
+            def via_wav():
+                # recordings.ts の convertWebmToWav（fluent-ffmpeg の toFormat("wav")）と同じ変換
+                subprocess.run([audio_decode.FFMPEG, "-nostdin", "-v", "error", "-y", "-i", p, "-f", "wav", wav],
+                               check=True)
+                return librosa.load(wav, sr=None)
+
+            t_old, (y_old, sr_old) = best_of(via_wav, repeat)
+            written = os.path.getsize(wav)
+            os.remove(wav)
+            t_new, (y_new, sr_new) = best_of(lambda: audio_decode.decode(p), repeat)
+            same = sr_old == sr_new and np.array_equal(y_old, y_new)
+            print(f"[decode] {os.path.basename(p)}: {len(y_new) / sr_new:.1f}s audio, {os.path.getsize(p) / 2**20:.2f} MiB")
+            print(f"  wav + librosa.load : {t_old * 1000:8.1f} ms  disk write {written / 2**20:8.2f} MiB")
+            print(f"  ffmpeg pipe        : {t_new * 1000:8.1f} ms  disk write {0:8.2f} MiB  (x{t_old / t_new:.2f})")
+            print(f"  identical={same}")
+
+
+def drift_report(ref, out, model_names):
+    """full（ref）に対する各系列のずれ"""
+    lines = []
+    for name in model_names:
+        a, b = np.asarray(ref[name]), np.asarray(out[name])
+        r = np.corrcoef(a, b)[0, 1] if a.std() > 0 and b.std() > 0 else float("nan")
+        lines.append(f"    {name:10s} MAE={np.mean(np.abs(a - b)):.4f}  max={np.max(np.abs(a - b)):.4f}  r={r:.4f}")
+    p_ref, p_out = np.asarray(ref["pitch"]), np.asarray(out["pitch"])
+    both = (p_ref > 0) & (p_out > 0)
+    cents = 1200 * np.abs(np.log2(p_out[both] / p_ref[both])) if both.any() else np.array([np.nan])
+    lines.append(f"    pitch      有声/無声の一致 {np.mean((p_ref > 0) == (p_out > 0)):.3f}  "
+                 f"誤差 median {np.median(cents):.1f} cents  50 cents 以内 {np.mean(cents < 50):.3f}")
+    v_ref, v_out = np.asarray(ref["volume"]), np.asarray(out["volume"])
+    lines.append(f"    volume     相対誤差 mean {np.mean(np.abs(v_out - v_ref) / (v_ref + 1e-8)):.4f}")
+    return lines
+
+
+def bench_presets(paths):
+    """
+    品質プリセット（presets.py）ごとの解析時間と、full に対するずれ（学習済みの rf_model_*.pkl の予測・pitch・volume）
+    """
+    import os
+    import tempfile
+    import soundfile as sf
+    import analyze_audio  # 学習済みモデルを読み込む
+    import presets
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if not paths:
+            y, sr, _ = synth_melody(duration=60.0)
+            p = os.path.join(tmp, "synth_60s.wav")
+            sf.write(p, y, sr, subtype="FLOAT")
+            paths = [p]
+
+        for p in paths:
+            # 元の録音の横に .cols を作らないよう、コピーしてから解析する
+            src = os.path.join(tmp, "in" + os.path.splitext(p)[1])
+            with open(p, "rb") as f_in, open(src, "wb") as f_out:
+                f_out.write(f_in.read())
+            print(f"[presets] {os.path.basename(p)}")
+            ref, t_ref = None, None
+            for name in presets.PRESETS:
+                t0 = time.perf_counter()
+                out = analyze_audio.analyze(src, preset=name, stream=False)
+                t = time.perf_counter() - t0
+                if ref is None:
+                    ref, t_ref = out, t
+                print(f"  {name:9s} {t:7.2f} s  (x{t_ref / t:.2f})  frames={len(out['pitch'])}")
+                if out is not ref:
+                    print("\n".join(drift_report(ref, out, analyze_audio.model_names())))
+
+
+def bench_lod(paths, minutes=(3, 30), widths=(800, 1600)):
+    """
+    縮約ピラミッド（lod.py）: .cols の書き込み時間・サイズの増分と、
+    /items（全フレームのオブジェクト配列）と /items/:id/lod の JSON の大きさ・作る時間を比べる
+    paths: 既存の .cols（省略時は minutes 分の合成系列）
+    """
+    import os
+    import json
+    import tempfile
+    import artifact
+    import lod
+
+    with tempfile.TemporaryDirectory() as tmp:
+        inputs = [(os.path.basename(p), artifact.load_analysis(p)) for p in paths]
+        if not paths:
+            rng = np.random.default_rng(0)
+            names = ["pitch", "volume", "brightness", "smoothness", "thickness", "clarity", "sharpness"]
+            for m in minutes:
+                n = int(m * 60 * 48000 / hop_length)
+                inputs.append((f"synth_{m}min", {name: rng.random(n).astype(np.float32) for name in names}))
+
+        for name, series in inputs:
+            series = {k: np.asarray(v, dtype=np.float32) for k, v in series.items()}
+            n = len(next(iter(series.values())))
+            plain = os.path.join(tmp, "plain.cols")
+            with_lod = os.path.join(tmp, "lod.cols")
+            t_plain, _ = best_of(lambda: artifact.write_artifact(plain, series, {"series": list(series)}), 3)
+            t_lod, _ = best_of(lambda: artifact.save_analysis(with_lod, series), 3)
+            print(f"[lod] {name}: {n} frames  levels={lod.n_levels(n)}")
+            print(f"  .cols 書き込み {t_plain * 1000:7.1f} ms -> {t_lod * 1000:7.1f} ms  "
+                  f"サイズ {os.path.getsize(plain) / 2**20:6.2f} MiB -> {os.path.getsize(with_lod) / 2**20:6.2f} MiB")
+
+            def items_json():
+                data = artifact.load_analysis(with_lod)
+                keys = list(data)
+                return json.dumps([{k: data[k][i] for k in keys} for i in range(n)])
+
+            t_items, body = best_of(items_json, 1)
+            print(f"  /items 相当      {len(body) / 2**20:8.2f} MiB  {t_items * 1000:8.1f} ms")
+            for width in widths:
+                t, body = best_of(lambda: json.dumps(artifact.load_lod(with_lod, 0, None, width)), 3)
+                print(f"  lod 全体 {width:5d}px {len(body) / 2**20:8.2f} MiB  {t * 1000:8.1f} ms")
+            t, body = best_of(lambda: json.dumps(artifact.load_lod(with_lod, 30, 40, widths[-1])), 3)
+            print(f"  lod 10 秒 {widths[-1]:4d}px {len(body) / 2**20:8.2f} MiB  {t * 1000:8.1f} ms")
+
+
+# 新しいプロセスで analyze_audio を import してから、最初の予測・最初の解析が終わるまでの時間（bench_startup 用）
+# argv: 親がプロセスを起動した時刻（time.time()）, 解析する wav
+_STARTUP_CHILD = """
+import sys, time, json
+launched = float(sys.argv[1])
+t0 = time.perf_counter()
+import numpy as np
+import analyze_audio
+t1 = time.perf_counter()
+analyze_audio.load_models()
+t2 = time.perf_counter()
+analyze_audio.predict_windows(np.zeros((1, 208)))
+t3 = time.perf_counter()
+to_first_prediction = time.time() - launched
+analyze_audio.analyze(sys.argv[2], "yin", stream=False)
+t4 = time.perf_counter()
+print(json.dumps({"startup": to_first_prediction - (t3 - t0), "import": t1 - t0, "load_models": t2 - t1,
+                  "first_predict": t3 - t2, "to_first_prediction": to_first_prediction,
+                  "first_analyze": t4 - t3, "to_first_result": time.time() - launched}))
+"""
+
+
+def _import_times(cwd, module="analyze_audio"):
+    """python -X importtime で module を import し、module が直接 import したものの累積時間 [(名前, 秒)]"""
+    import subprocess
+
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=cwd, capture_output=True, text=True, check=True)
+    # 行の形式: "import time: <self us> | <cumulative us> | <2 × 深さ の空白><名前>"
+    entries, total = [], None
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():  # 見出しの行
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0 and name.strip() == module:
+            total = int(cumulative) / 1e6
+        elif depth == 1:
+            entries.append((name.strip(), int(cumulative) / 1e6))
+    return total, sorted(entries, key=lambda e: -e[1])
+
+
+def bench_startup(paths, runs=3, top=8):
+    """
+    起動の速さ: 新しいプロセスで analyze_audio を import → モデル読み込み → 最初の予測 → 最初の解析 の時間
+    （各段階は runs 回の中央値。OS のファイルキャッシュには載った状態で測る）と、
+    import に時間のかかっているモジュール（-X importtime）、モデルの無い場所・存在しない音声で落ちるまでの時間
+    """
+    import os
+    import json
+    import subprocess
+    import tempfile
+    import soundfile as sf
+    import analyze_audio
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    total, entries = _import_times(here)
+    print(f"[startup] import analyze_audio: {total * 1000:8.1f} ms（-X importtime）")
+    for name, t in entries[:top]:
+        print(f"  {name:24s} {t * 1000:8.1f} ms")
+
+    loaded = analyze_audio.load_models()
+    kind = type(loaded["predictor"]).__name__ if loaded["predictor"] is not None else "pkl"
+    with tempfile.TemporaryDirectory() as tmp:
+        if paths:
+            src = paths[0]
+        else:
+            y, sr, _ = synth_melody(duration=5.0)
+            src = os.path.join(tmp, "synth_5s.wav")
+            sf.write(src, y, sr, subtype="FLOAT")
+        # 元の録音の横に .cols を作らないよう、コピーしてから解析する
+        wav = os.path.join(tmp, "in" + os.path.splitext(src)[1])
+        with open(src, "rb") as f_in, open(wav, "wb") as f_out:
+            f_out.write(f_in.read())
+
+        rows = []
+        for _ in range(runs):
+            proc = subprocess.run([sys.executable, "-c", _STARTUP_CHILD, repr(time.time()), wav],
+                                  cwd=here, capture_output=True, text=True, check=True)
+            rows.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+        print(f"[startup] {os.path.basename(src)}  モデル: {kind}  ({runs} 回の中央値)")
+        for key, label in (("startup", "インタプリタ起動"), ("import", "import analyze_audio"),
+                           ("load_models", "モデル読み込み"), ("first_predict", "最初の予測"),
+                           ("to_first_prediction", "→ 起動から最初の予測まで"), ("first_analyze", "最初の解析"),
+                           ("to_first_result", "→ 起動から最初の解析結果まで")):
+            print(f"  {label:24s} {np.median([r[key] for r in rows]) * 1000:8.1f} ms")
+
+        # 失敗する呼び出し（存在しない音声）が落ちるまで。モデルや重いモジュールを読み込まずに終わる
+        t0 = time.perf_counter()
+        proc = subprocess.run([sys.executable, "analyze_audio.py", os.path.join(tmp, "missing.wav")],
+                              cwd=here, capture_output=True, text=True)
+        print(f"  {'存在しない音声で終了':24s} {(time.perf_counter() - t0) * 1000:8.1f} ms  "
+              f"(exit={proc.returncode})")
+
+
+BENCHES = {
+    "features": bench_features,
+    "window_stats": bench_window_stats,
+    "pitch": bench_pitch,
+    "predict": bench_predict,
+    "harmony": bench_harmony,
+    "stream": bench_stream,
+    "decode": bench_decode,
+    "presets": bench_presets,
+    "lod": bench_lod,
+    "startup": bench_startup,
+}
+
+if __name__ == "__main__":
+    # 使い方: python3 benchmark.py <stage> [audio.wav ...]
+    #         python3 benchmark.py predict [rf_model_*.pkl ...]
+    #         python3 benchmark.py decode [recording.webm ...]
+    #         python3 benchmark.py lod [analysis.cols ...]
+    #         python3 benchmark.py startup [audio.wav]
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHES:
+        sys.stderr.write(f"usage: benchmark.py {{{'|'.join(BENCHES)}}} [audio.wav ...]\n")
+        sys.exit(1)
+    BENCHES[sys.argv[1]](sys.argv[2:])
@@ -0,0 +1,203 @@
+import numpy as np
+
+# librosa の import は重い（0.3 秒ほど）ので、使う関数の中で読み込む（analyze_audio を import しただけでは読み込まない）
+
+hop_length = 512  # フレーム長さ
+n_fft = 2048      # librosa のデフォルトと同じ値（学習時の特徴量と一致させる）
+top_db = 80.0     # librosa.power_to_db のデフォルト
+
+# extract_framewise_features の列の名前（52 次元）
+FEATURE_NAMES = (
+    [f"mfcc{i}" for i in range(1, 14)] + [f"delta_mfcc{i}" for i in range(1, 14)]
+    + ["zcr", "rms", "centroid", "bandwidth", "rolloff", "flatness"]
+    + [f"chroma{i}" for i in range(1, 13)]
+    + ["onset_env", "delta_rms", "delta_bandwidth", "delta2_rms", "delta2_bandwidth",
+       "spectral_flux", "delta2_flux", "hf_energy"]
+)
+N_FEATURES = len(FEATURE_NAMES)
+
+
+# === スペクトログラム共有バッファ ===
+def compute_spectra(y, sr, hop_length=hop_length, n_fft=n_fft, center=True, mel_db_max=None):
+    """
+    STFT を 1 回だけ計算し、各特徴量で使い回すスペクトログラムをまとめて返す
+    center: False のときは y を両端埋め済みの信号の一部として扱う（stream_analyzer.py 用）
+    mel_db_max: 録音全体のメル dB の最大値（top_db で下限を切る基準。None なら y の中の最大値）
+    戻り値: dict
+        mag    : 振幅スペクトログラム |STFT|        (1 + n_fft/2, T)
+        power  : パワースペクトログラム |STFT|**2   (1 + n_fft/2, T)
+        mel_db : メルスペクトログラム（dB）        (128, T)
+    """
+    import librosa
+    mag = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length, center=center))
+    power = mag ** 2
+    mel = mel_power(power, sr, hop_length, n_fft)
+    if mel_db_max is None:
+        mel_db = librosa.power_to_db(mel)
+    else:
+        # power_to_db(mel) と同じ計算で、下限だけ録音全体の最大値から決める
+        mel_db = np.maximum(librosa.power_to_db(mel, top_db=None), mel_db_max - top_db)
+    return {"mag": mag, "power": power, "mel_db": mel_db}
+
+
+def mel_power(power, sr, hop_length=hop_length, n_fft=n_fft):
+    import librosa
+    return librosa.feature.melspectrogram(S=power, sr=sr, n_fft=n_fft, hop_length=hop_length)
+
+
+def spectral_flux_from_mag(mag):
+    flux = np.sqrt(np.sum(np.diff(mag, axis=1) ** 2, axis=0))
+    flux = np.insert(flux, 0, 0)
+    return flux
+
+
+def high_freq_energy_from_mag(mag, sr, n_fft=n_fft, cutoff_freq=4000):
+    import librosa
+    freqs = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
+    hf_idx = np.where(freqs >= cutoff_freq)[0]
+    return np.sum(mag[hf_idx, :], axis=0)
+
+
+# === フレーム単位特徴量抽出（STFT 1 回版） ===
+def extract_framewise_features(y, sr, hop_length=hop_length, n_fft=n_fft, spectra=None):
+    """
+    analyze_audio.py / audio_1_feature_extract.py の旧実装と同じ 52 次元の特徴量を、
+    共有スペクトログラムから計算する（出力は旧実装と数値的に一致）
+    spectra: compute_spectra の戻り値（既に計算済みなら渡すと再計算しない）
+    戻り値: (T, 52)
+    """
+    import librosa
+    if spectra is None:
+        spectra = compute_spectra(y, sr, hop_length=hop_length, n_fft=n_fft)
+    # zcr / rms は時間波形から計算する（旧実装と同じ値にするため）
+    zcr = librosa.feature.zero_crossing_rate(y, frame_length=n_fft, hop_length=hop_length)
+    rms = librosa.feature.rms(y=y, frame_length=n_fft, hop_length=hop_length)
+    return features_from_parts(spectra, zcr, rms, sr, hop_length=hop_length, n_fft=n_fft)
+
+
+def features_from_parts(spectra, zcr, rms, sr, hop_length=hop_length, n_fft=n_fft, tuning=None):
+    """
+    スペクトログラムと zcr / rms から 52 次元の特徴量を組み立てる
+    tuning: chroma の調律のずれ（None なら spectra から推定。録音の一部だけを渡すときは全体の値を渡す）
+    """
+    import librosa
+    mag, power, mel_db = spectra["mag"], spectra["power"], spectra["mel_db"]
+
+    mfcc = librosa.feature.mfcc(S=mel_db, sr=sr, n_mfcc=13)
+    delta_mfcc = librosa.feature.delta(mfcc)
+    centroid = librosa.feature.spectral_centroid(S=mag, sr=sr, n_fft=n_fft, hop_length=hop_length)
+    bandwidth = librosa.feature.spectral_bandwidth(S=mag, sr=sr, n_fft=n_fft, hop_length=hop_length)
+    rolloff = librosa.feature.spectral_rolloff(S=mag, sr=sr, n_fft=n_fft, hop_length=hop_length)
+    flatness = librosa.feature.spectral_flatness(S=mag, n_fft=n_fft, hop_length=hop_length)
+    chroma = librosa.feature.chroma_stft(S=power, sr=sr, n_fft=n_fft, hop_length=hop_length, tuning=tuning)
+    onset_env = librosa.onset.onset_strength(S=mel_db, sr=sr, n_fft=n_fft, hop_length=hop_length).reshape(1, -1)
+
+    features_list = [mfcc, delta_mfcc, zcr, rms, centroid, bandwidth, rolloff, flatness, chroma, onset_env]
+    min_len = min(x.shape[1] for x in features_list)
+    features_trimmed = [x[:, :min_len] for x in features_list]
+    feats_time = np.vstack(features_trimmed)
+
+    delta_rms = np.gradient(rms[0, :min_len])
+    delta_bandwidth = np.gradient(bandwidth[0, :min_len])
+    delta2_rms = np.gradient(delta_rms)
+    delta2_bandwidth = np.gradient(delta_bandwidth)
+
+    spectral_flux = spectral_flux_from_mag(mag)[:min_len]
+    delta2_flux = np.gradient(spectral_flux)
+    hf_energy = high_freq_energy_from_mag(mag, sr, n_fft)[:min_len]
+
+    # --- すべて結合 ---
+    final_features = np.column_stack([
+        feats_time.T,
+        delta_rms,
+        delta_bandwidth,
+        delta2_rms,
+        delta2_bandwidth,
+        spectral_flux,
+        delta2_flux,
+        hf_energy
+    ])
+
+    return final_features  # shape: (T, D)
+
+
+# === 一部の列だけの特徴量抽出（プルーニングしたモデル用） ===
+def feature_group(name):
+    """列の名前から、まとめて計算される特徴量の名前（mfcc3 -> mfcc, chroma7 -> chroma）"""
+    return name.rstrip("0123456789") if name.startswith(("mfcc", "delta_mfcc", "chroma")) else name
+
+
+# 特徴量ごとの先頭の列
+GROUP_START = {}
+for _i, _name in enumerate(FEATURE_NAMES):
+    GROUP_START.setdefault(feature_group(_name), _i)
+
+
+def extract_selected_features(y, sr, columns, hop_length=hop_length, n_fft=n_fft):
+    """
+    extract_framewise_features の列 columns（FEATURE_NAMES の番号）だけを計算する
+    使わない特徴量と、それにしか使わないスペクトログラム（STFT・メル）は計算しない
+    値は extract_framewise_features の同じ列と一致する（どの特徴量も center=True で同じフレーム数になるため）
+    戻り値: (T, len(columns))
+    """
+    import librosa
+    columns = [int(c) for c in columns]
+    if columns == list(range(N_FEATURES)):
+        return extract_framewise_features(y, sr, hop_length=hop_length, n_fft=n_fft)
+
+    cache = {}
+
+    def get(key):
+        if key not in cache:
+            cache[key] = compute[key]()
+        return cache[key]
+
+    def mel_db():
+        return librosa.power_to_db(mel_power(get("power"), sr, hop_length, n_fft))
+
+    compute = {
+        # スペクトログラム（compute_spectra と同じ計算）
+        "mag": lambda: np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length)),
+        "power": lambda: get("mag") ** 2,
+        "mel_db": mel_db,
+        # (次元, T) の特徴量（features_from_parts と同じ計算）
+        "mfcc": lambda: librosa.feature.mfcc(S=get("mel_db"), sr=sr, n_mfcc=13),
+        "delta_mfcc": lambda: librosa.feature.delta(get("mfcc")),
+        "zcr": lambda: librosa.feature.zero_crossing_rate(y, frame_length=n_fft, hop_length=hop_length),
+        "rms": lambda: librosa.feature.rms(y=y, frame_length=n_fft, hop_length=hop_length),
+        "centroid": lambda: librosa.feature.spectral_centroid(S=get("mag"), sr=sr, n_fft=n_fft,
+                                                              hop_length=hop_length),
+        "bandwidth": lambda: librosa.feature.spectral_bandwidth(S=get("mag"), sr=sr, n_fft=n_fft,
+                                                                hop_length=hop_length),
+        "rolloff": lambda: librosa.feature.spectral_rolloff(S=get("mag"), sr=sr, n_fft=n_fft,
+                                                            hop_length=hop_length),
+        "flatness": lambda: librosa.feature.spectral_flatness(S=get("mag"), n_fft=n_fft, hop_length=hop_length),
+        "chroma": lambda: librosa.feature.chroma_stft(S=get("power"), sr=sr, n_fft=n_fft, hop_length=hop_length),
+        "onset_env": lambda: librosa.onset.onset_strength(S=get("mel_db"), sr=sr, n_fft=n_fft,
+                                                          hop_length=hop_length).reshape(1, -1),
+        "spectral_flux": lambda: spectral_flux_from_mag(get("mag")).reshape(1, -1),
+        "hf_energy": lambda: high_freq_energy_from_mag(get("mag"), sr, n_fft).reshape(1, -1),
+    }
+    # 差分の特徴量は元の特徴量から計算する
+    derived = {
+        "delta_rms": ("rms", 1), "delta2_rms": ("rms", 2),
+        "delta_bandwidth": ("bandwidth", 1), "delta2_bandwidth": ("bandwidth", 2),
+        "delta2_flux": ("spectral_flux", 1),
+    }
+
+    groups = [feature_group(FEATURE_NAMES[c]) for c in columns]
+    for g in groups:
+        get(derived[g][0] if g in derived else g)
+    T = min(v.shape[1] for k, v in cache.items() if k not in ("mag", "power", "mel_db"))
+
+    out = np.empty((T, len(columns)))
+    for i, (c, g) in enumerate(zip(columns, groups)):
+        if g in derived:
+            src, order = derived[g]
+            v = get(src)[0, :T]
+            for _ in range(order):
+                v = np.gradient(v)
+        else:
+            v = get(g)[c - GROUP_START[g], :T]
+        out[:, i] = v
+    return out
@@ -0,0 +1,65 @@
+import numpy as np
+import feature_engine
+import window_stats
+
+# プルーニングしたモデルが使う窓統計量の列（create_model/src/audio_9_prune_features.py で選ぶ）
+#
+# 窓統計量の列は compute_window_stats と同じ並び: 列 c = STATS[c // 52] の FEATURE_NAMES[c % 52]
+# （0〜51 が平均、52〜103 が分散、…）。学習時の segment_stats.pkl の列も同じ並び
+# モデル（RandomForestRegressor）には学習に使った列を feature_columns_ として持たせる。無ければ全列
+
+STATS = window_stats.STATS
+N_BASE = feature_engine.N_FEATURES
+N_COLUMNS = N_BASE * len(STATS)
+ALL_COLUMNS = np.arange(N_COLUMNS)
+
+
+def column_name(c):
+    """窓統計量の列の名前（例: chroma7_kurt）"""
+    return f"{feature_engine.FEATURE_NAMES[c % N_BASE]}_{STATS[c // N_BASE]}"
+
+
+def normalize(columns):
+    """昇順・重複なしの列番号の配列にする"""
+    columns = np.unique(np.asarray(columns, dtype=np.int64))
+    if len(columns) == 0 or columns[0] < 0 or columns[-1] >= N_COLUMNS:
+        raise ValueError(f"列番号は 0〜{N_COLUMNS - 1} の 1 つ以上にしてください")
+    return columns
+
+
+def is_full(columns):
+    return len(columns) == N_COLUMNS
+
+
+def model_columns(model):
+    """モデルが入力に使う列（feature_columns_ が無いモデルは全列）"""
+    columns = getattr(model, "feature_columns_", None)
+    return ALL_COLUMNS if columns is None else normalize(columns)
+
+
+def base_features(columns):
+    """列を計算するのに要るフレームごとの特徴量（FEATURE_NAMES の番号）"""
+    return np.unique(np.asarray(columns) % N_BASE)
+
+
+def extract_features(y, sr, columns, hop_length=feature_engine.hop_length, n_fft=feature_engine.n_fft):
+    """columns の列に要るフレームごとの特徴量だけを計算する  戻り値: (T, len(base_features(columns)))"""
+    return feature_engine.extract_selected_features(y, sr, base_features(columns),
+                                                    hop_length=hop_length, n_fft=n_fft)
+
+
+def compute_window_stats(features, columns, window_frames, step_frames, include_last='short'):
+    """
+    features: extract_features の戻り値
+    窓統計量のうち columns の列だけを返す
+    （columns が使う統計量だけを計算する。値は全列で計算したときの同じ列と丸め誤差の範囲で一致する）
+    戻り値: (Nwin, len(columns)), 各窓の中心フレーム (Nwin,)
+    """
+    columns = normalize(columns)
+    bases = base_features(columns)
+    kinds = np.unique(columns // N_BASE)
+    stats, times_frames = window_stats.compute_window_stats(features, window_frames, step_frames, include_last,
+                                                            stats=tuple(STATS[k] for k in kinds))
+    # stats の列は [kinds[0] × len(bases), kinds[1] × len(bases), …]
+    idx = np.searchsorted(kinds, columns // N_BASE) * len(bases) + np.searchsorted(bases, columns % N_BASE)
+    return stats[:, idx], times_frames
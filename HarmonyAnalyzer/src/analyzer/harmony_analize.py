@@ -2,56 +2,142 @@ import sys
 import json
 import librosa
 import numpy as np
+from artifact import Artifact, HARMONY_F0_KEY, artifact_path
+from audio_decode import load_audio
+import metrics
 import os
+import pickle
 '''
 import matplotlib.pyplot as plt
 import pandas as pd
 '''
-from itertools import combinations
-
-files = sys.argv[1:]
 
 sr = 44100
 frame_length = 2048
 hop_length = 512
 
+fmin = librosa.note_to_hz('C2')
+fmax = librosa.note_to_hz('C7')
+
+# アップロード時の解析（analyze_audio.py）が保存する協和度用の f0 が、
+# 今の設定で計算されたものかを確かめるための設定値
+HARMONY_F0_PARAMS = {"sr": sr, "frame_length": frame_length, "hop_length": hop_length,
+                     "fmin": float(fmin), "fmax": float(fmax)}
+
+IDEAL_RATIOS = [1.0, 2.0, 1.5, 1.333, 1.25, 1.2, 1.6]
+# 一度に処理する (ペア数 × フレーム数) の上限（30 トラックでもメモリを抑える）
+MAX_BLOCK = 1 << 21
+
 def consonance_score(ratio, freq_diff, freq_ave):
-    ideal_ratio = [1.0,2.0,1.5,1.333,1.25,1.2,1.6]
+    ideal_ratio = IDEAL_RATIOS
     dist = min([abs(ratio - ir) for ir in ideal_ratio])
     # 周波数比と周波数差の両方を考慮した協和度スコア
     return 1 / (1 + dist*freq_ave / (1 + freq_diff ))
 
-mix = None
-for path in files:
-    y,_=librosa.load(path,sr=sr)
-    if mix is None:
-        mix = y
-    else:
-        mix = mix[:len(y)] + y[:len(mix)] if len(y) < len(mix) else mix + y[:len(mix)]
-
-f0s = []
-for path in files:
-    y,_ = librosa.load(path,sr=sr)
-    f0 = librosa.yin(y,fmin=librosa.note_to_hz('C2'),fmax=librosa.note_to_hz('C7'),
-                     frame_length=frame_length,hop_length=hop_length)
-    f0s.append(f0)
-
-min_len = min(len(f) for f in f0s)
-frame_scores = []
-
-for t in range(min_len):
-    freqs = [f0[t] for f0 in f0s if not np.isnan(f0[t])]
-    if len(freqs) < 2:
-        frame_scores.append(np.nan)
-        continue
-    ratios = [max(a,b)/min(a,b) for a,b in combinations(freqs,2)]
-    freq_diffs = [abs(a - b) for a,b in combinations(freqs,2)]
-    freq_ave = [(a + b)/2 for a,b in combinations(freqs,2)]
-    scores = [consonance_score(r, d, a) for r, d, a in zip(ratios, freq_diffs,freq_ave)]
-    frame_scores.append(np.mean(scores))
-
-print(json.dumps(frame_scores, ensure_ascii=False))
-sys.stdout.flush()  # ← これで Node が即座に全出力を受け取れる
+def f0_from_signal(y, y_sr):
+    """任意のサンプリング周波数の信号から協和度用の f0 を計算する（librosa.load(sr=44100) と同じリサンプル）"""
+    if y_sr != sr:
+        y = librosa.resample(y, orig_sr=y_sr, target_sr=sr)
+    return harmony_yin(y)
+
+def harmony_yin(y, center=True):
+    """44.1 kHz の信号の f0（center=False のときは y を両端埋め済みの信号の一部として扱う）"""
+    return librosa.yin(y,fmin=fmin,fmax=fmax,frame_length=frame_length,hop_length=hop_length,center=center)
+
+def harmony_f0_entry(y, y_sr):
+    """.pkl に保存する形（設定値 + f0）"""
+    return {**HARMONY_F0_PARAMS, "f0": f0_from_signal(y, y_sr)}
+
+def _is_fresh(saved_path, path):
+    return os.path.exists(saved_path) and not (
+        os.path.exists(path) and os.path.getmtime(saved_path) < os.path.getmtime(path))
+
+def _same_params(params):
+    return isinstance(params, dict) and all(params.get(k) == v for k, v in HARMONY_F0_PARAMS.items())
+
+def load_saved_f0(path):
+    """
+    path（録音）の解析結果に保存済みの f0 を返す（列指向ファイル .cols を優先し、無ければ旧形式の .pkl）
+    解析結果が無い・録音より古い・設定が違う・f0 が無いときは None
+    """
+    cols_path = artifact_path(path)
+    if cols_path != path and _is_fresh(cols_path, path):
+        try:
+            art = Artifact(cols_path)
+            if HARMONY_F0_KEY in art and _same_params(art.meta.get(HARMONY_F0_KEY)):
+                return np.array(art.column(HARMONY_F0_KEY), dtype=np.float64)
+        except (OSError, ValueError, KeyError):
+            pass
+
+    pkl_path = os.path.splitext(path)[0] + '.pkl'
+    if pkl_path == path or not _is_fresh(pkl_path, path):
+        return None
+    try:
+        with open(pkl_path, 'rb') as f:
+            entry = pickle.load(f).get(HARMONY_F0_KEY)
+    except Exception:
+        return None
+    if not _same_params(entry):
+        return None
+    return np.asarray(entry["f0"], dtype=np.float64)
+
+def track_f0(path):
+    # アップロード時に保存した f0 があればそれを使い、無ければ音声を読み込んで計算する
+    with metrics.span("harmony.f0", file=os.path.basename(path)) as sp:
+        f0 = load_saved_f0(path)
+        sp.set(saved=f0 is not None)
+        if f0 is None:
+            y,_ = load_audio(path,sr=sr)
+            f0 = harmony_yin(y)
+        sp.size(f0=f0)
+    return f0
+
+def harmony_scores(f0s):
+    """
+    f0s: トラックごとの f0 列（NaN は無声）。長さは最短のトラックに揃える
+    戻り値: (フレーム数,) 有声のトラック同士の全ペアの協和度スコアの平均（有声が 2 本未満のフレームは NaN）
+    """
+    min_len = min(len(f) for f in f0s)
+    F = np.stack([np.asarray(f[:min_len], dtype=np.float64) for f in f0s])  # (トラック, フレーム)
+    ia, ib = np.triu_indices(len(F), k=1)  # combinations と同じ順のペア
+    out = np.full(min_len, np.nan)
+    if len(ia) == 0:
+        return out
+
+    step = max(1, MAX_BLOCK // len(ia))
+    for t0 in range(0, min_len, step):
+        a = F[ia, t0:t0 + step]  # (ペア, フレーム)
+        b = F[ib, t0:t0 + step]
+        valid = ~(np.isnan(a) | np.isnan(b))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ratio = np.maximum(a, b) / np.minimum(a, b)
+            dist = np.abs(ratio - IDEAL_RATIOS[0])
+            for ir in IDEAL_RATIOS[1:]:
+                np.minimum(dist, np.abs(ratio - ir), out=dist)
+            scores = 1 / (1 + dist * ((a + b) / 2) / (1 + np.abs(a - b)))
+        n_pairs = valid.sum(axis=0)
+        total = np.where(valid, scores, 0.0).sum(axis=0)
+        # 有声が 2 本以上 ⇔ 有効なペアが 1 つ以上
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out[t0:t0 + step] = np.where(n_pairs > 0, total / n_pairs, np.nan)
+    return out
+
+def compute_harmony(files):
+    # 各ファイルは 1 回だけ読み込み、全フレーム × 全ペアをまとめて採点する
+    f0s = [track_f0(path) for path in files]
+    with metrics.span("harmony.scores", tracks=len(f0s)) as sp:
+        scores = harmony_scores(f0s)
+        sp.size(scores=scores)
+    return scores.tolist()
+
+
+if __name__ == "__main__":
+    with metrics.span("harmony", tracks=len(sys.argv) - 1):
+        frame_scores = compute_harmony(sys.argv[1:])
+        with metrics.span("harmony.json"):
+            out = json.dumps(frame_scores, ensure_ascii=False)
+    print(out)
+    sys.stdout.flush()  # ← これで Node が即座に全出力を受け取れる
 
 '''
 times = librosa.frames_to_time(np.arange(len(frame_scores)),sr=sr,hop_length=hop_length)
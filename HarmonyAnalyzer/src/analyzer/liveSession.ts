@@ -0,0 +1,168 @@
+import path from "path";
+import readline from "readline";
+import crypto from "crypto";
+import { spawn, ChildProcessWithoutNullStreams } from "child_process";
+
+// 録音中の逐次解析（live_analyzer.py）のセッション
+// 録音 1 つにつき Python プロセスを 1 つ起動し、届いた音声を順番に渡す
+
+type Pending = {
+  id: number;
+  resolve: (output: string) => void;
+  reject: (err: Error) => void;
+};
+
+type LiveSession = {
+  proc: ChildProcessWithoutNullStreams;
+  ready: Promise<number>;
+  pending: Pending[];
+  nextJobId: number;
+  stderr: string;
+  timer: NodeJS.Timeout | null;
+  closed: boolean;
+};
+
+const pythonPath = "/usr/bin/python3";
+const liveScriptPath = path.join(__dirname, "live_analyzer.py");
+// 音声が届かないまま放置されたセッションは破棄する
+const IDLE_TIMEOUT_MS = parseInt(process.env.LIVE_IDLE_TIMEOUT_MS ?? "60000", 10) || 60000;
+const MAX_SESSIONS = Math.max(1, parseInt(process.env.LIVE_MAX_SESSIONS ?? "4", 10) || 4);
+const STDERR_KEEP = 20000;
+
+const sessions = new Map<string, LiveSession>();
+
+function closeSession(sessionId: string, reason: string) {
+  const session = sessions.get(sessionId);
+  if (!session) return;
+  sessions.delete(sessionId);
+  session.closed = true;
+  if (session.timer) clearTimeout(session.timer);
+  for (const job of session.pending.splice(0)) job.reject(new Error(reason));
+  if (session.proc.exitCode === null) session.proc.kill();
+}
+
+function touch(sessionId: string) {
+  const session = sessions.get(sessionId);
+  if (!session) return;
+  if (session.timer) clearTimeout(session.timer);
+  session.timer = setTimeout(() => {
+    console.warn(`[live] session ${sessionId} timed out`);
+    closeSession(sessionId, "live session timed out");
+  }, IDLE_TIMEOUT_MS);
+}
+
+// セッションを開始し、ID と窓の予測が返るまでの遅延（ms）を返す
+export async function startLiveSession(sampleRate: number, instrument?: string): Promise<{ sessionId: string; latencyMs: number }> {
+  if (sessions.size >= MAX_SESSIONS) {
+    throw new Error("live session limit reached");
+  }
+  const sessionId = crypto.randomUUID();
+  const args = [liveScriptPath, String(Math.round(sampleRate))];
+  if (instrument) args.push(instrument);
+  const proc = spawn(pythonPath, args);
+
+  let onReady!: (latencyMs: number) => void;
+  let onFail!: (err: Error) => void;
+  const session: LiveSession = {
+    proc,
+    ready: new Promise<number>((resolve, reject) => { onReady = resolve; onFail = reject; }),
+    pending: [],
+    nextJobId: 1,
+    stderr: "",
+    timer: null,
+    closed: false,
+  };
+  sessions.set(sessionId, session);
+
+  readline.createInterface({ input: proc.stdout }).on("line", (line) => {
+    let msg: any;
+    try {
+      msg = JSON.parse(line);
+    } catch {
+      console.error("[live] 不正な応答:", line.slice(0, 200));
+      return;
+    }
+    if (msg.ready) {
+      onReady(Number(msg.latency_ms) || 0);
+      return;
+    }
+    // ジョブは送った順に 1 つずつ処理される
+    const job = session.pending.shift();
+    if (!job || msg.id !== job.id) return;
+    if (msg.ok) {
+      job.resolve(msg.output);
+    } else {
+      console.error(session.stderr);
+      job.reject(new Error(msg.error));
+    }
+    session.stderr = "";
+  });
+
+  proc.stderr.on("data", (chunk) => {
+    session.stderr = (session.stderr + chunk.toString()).slice(-STDERR_KEEP);
+  });
+
+  proc.on("exit", (code, signal) => {
+    if (!session.closed) {
+      console.error(`[live] session ${sessionId} exited with code ${code} signal ${signal}`);
+      if (session.stderr) console.error(session.stderr);
+    }
+    onFail(new Error(`live analyzer exited (code ${code})`));
+    closeSession(sessionId, `live analyzer exited (code ${code})`);
+  });
+
+  touch(sessionId);
+  const latencyMs = await session.ready;
+  return { sessionId, latencyMs };
+}
+
+function send(sessionId: string, job: Record<string, unknown>): Promise<string> {
+  const session = sessions.get(sessionId);
+  if (!session) return Promise.reject(new Error("live session not found"));
+  touch(sessionId);
+  return session.ready.then(() => new Promise<string>((resolve, reject) => {
+    if (session.closed) {
+      reject(new Error("live session closed"));
+      return;
+    }
+    const id = session.nextJobId++;
+    session.pending.push({ id, resolve, reject });
+    session.proc.stdin.write(JSON.stringify({ id, ...job }) + "\n");
+  }));
+}
+
+export function hasLiveSession(sessionId: string): boolean {
+  return sessions.has(sessionId);
+}
+
+// samples: モノラル float32（little endian）の PCM。新しく確定したフレームと窓の結果（JSON 文字列）を返す
+export function pushLive(sessionId: string, samples: Buffer): Promise<string> {
+  return send(sessionId, { type: "push", samples: samples.toString("base64") });
+}
+
+// 解析結果を audioPath（アップロードされた録音）と同じ名前の .cols に書き出し、analyze と同じ JSON 文字列を返す
+export async function finishLive(sessionId: string, audioPath: string): Promise<string> {
+  try {
+    const output = send(sessionId, { type: "finish", args: [audioPath] });
+    // 停止時は録音全体の窓統計量を計算し直すので、長い録音では時間がかかる（無操作のタイムアウトは止める）
+    const session = sessions.get(sessionId);
+    if (session?.timer) {
+      clearTimeout(session.timer);
+      session.timer = null;
+    }
+    return await output;
+  } finally {
+    closeSession(sessionId, "live session finished");
+  }
+}
+
+export async function abortLive(sessionId: string): Promise<void> {
+  if (!sessions.has(sessionId)) return;
+  try {
+    await send(sessionId, { type: "abort" });
+  } catch {
+    // プロセスが既に落ちていても破棄できればよい
+  } finally {
+    closeSession(sessionId, "live session aborted");
+  }
+}
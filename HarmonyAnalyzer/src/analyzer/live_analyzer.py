@@ -0,0 +1,379 @@
+import os
+import sys
+import json
+import base64
+import tempfile
+import contextlib
+import traceback
+import numpy as np
+import librosa
+import soundfile as sf
+import soxr
+from sklearn.preprocessing import StandardScaler
+
+import feature_engine
+import pitch_engine
+import window_stats
+import harmony_analize
+import presets
+from artifact import artifact_path, save_analysis
+from stream_analyzer import (CONTEXT_FRAMES, AudioSource, frame_span, scan_globals, upsample_block,
+                             window_predictions)
+
+# 録音中の音声を少しずつ受け取り（push）、届いた分だけ解析結果を返す
+# 停止時（finish）には録音全体の .cols を書き出すので、アップロード直後から結果を表示できる
+#
+# 録音中はまだ届いていない音声を使えないため、録音全体の値を使う箇所は「そのフレームまで」の値で置き換える
+#   - メル dB の下限: そのフレームまでの最大値 - top_db
+#   - yin の無音判定: そのフレームまでの最大 RMS が基準
+#   - chroma の調律のずれ: 推定せず tuning（既定 0 = A440）を使う
+#   - 窓統計量の標準化: それまでの窓で partial_fit
+# finish では録音全体の値で求め直すので、書き出す .cols は analyze_audio.analyze（yin・full）と
+# stream_analyzer と同じ誤差の範囲で一致する（解析し直す必要はない）
+#   - pitch: 音量以外の判定まで済ませた f0 とフレームの RMS を残しておき、録音全体の最大 RMS で判定し直す
+#   - volume・協和度用 f0: 録音全体の値を使わないので、受け取りながら求めた値のまま
+#   - 窓統計量: 受け取った音声を一時ファイル（float32 の wav）に書いておき、受け取りながら求めたメル dB の
+#     最大値と録音全体から推定した調律のずれで特徴量を計算し直し、全窓で fit した標準化で予測し直す
+#
+# 使い方: python3 live_analyzer.py <サンプリング周波数> [楽器名]
+#   標準入力に 1 行 1 ジョブの JSON、標準出力に 1 行 1 結果の JSON（analyzer_server.py と同じ形）
+#   {"id": 1, "type": "push", "samples": "<float32 little endian の base64>"}
+#   {"id": 2, "type": "finish", "args": ["/path/to/recording.webm"]}  同じ名前の .cols を書き出して終了
+#   {"id": 3, "type": "abort"}                                         何も書かずに終了
+
+hop_length = feature_engine.hop_length
+n_fft = feature_engine.n_fft
+MIN_UPDATE_FRAMES = 8    # 特徴量はこのフレーム数（約 85 ms）以上たまってからまとめて計算する
+HOLD_BACK_SAMPLES = 256  # リサンプラがまだ確定させていない可能性のある末尾のサンプル数
+
+
+class _RunningMax:
+    """フレームごとの「そのフレームまでの最大値」（後から届いたフレームで過去の値は変わらない）"""
+
+    def __init__(self):
+        self.values = np.zeros(0)
+        self.start = 0
+        self.peak = -np.inf
+
+    @property
+    def end(self):
+        return self.start + len(self.values)
+
+    def extend(self, f0, frame_max):
+        """フレーム [f0, f0 + len(frame_max)) の各フレームの最大値を追加する（f0 <= end）"""
+        new = np.asarray(frame_max, dtype=np.float64)[self.end - f0:]
+        if len(new):
+            cum = np.maximum.accumulate(np.concatenate([[self.peak], new]))[1:]
+            self.values = np.concatenate([self.values, cum])
+            self.peak = cum[-1]
+
+    def get(self, f0, f1):
+        return self.values[f0 - self.start:f1 - self.start]
+
+    def drop_before(self, f):
+        if f > self.start:
+            self.values = self.values[f - self.start:]
+            self.start = f
+
+
+class _HarmonyF0:
+    """協和度用 f0（harmony_analize.harmony_f0_entry と同じ計算）を 44.1 kHz にリサンプルしながら求める"""
+
+    def __init__(self, sr):
+        self.sr = sr
+        self.stream = soxr.ResampleStream(sr, harmony_analize.sr, 1, dtype="float32", quality="HQ") \
+            if sr != harmony_analize.sr else None
+        self.buf = np.zeros(0, dtype=np.float32)  # リサンプル後の信号の [buf_start, buf_start + len(buf))
+        self.buf_start = 0
+        self.n_done = 0
+        self.f0 = []
+
+    def push(self, y, last=False):
+        out = y if self.stream is None else self.stream.resample_chunk(y, last=last)
+        self.buf = np.concatenate([self.buf, out])
+
+    def update(self, n_total=None):
+        """n_total: 録音の終わりのときのリサンプル後の長さ（librosa.resample と同じく切り詰め / 0 埋め）"""
+        frame, hop = harmony_analize.frame_length, harmony_analize.hop_length
+        pad = frame // 2
+        if n_total is None:
+            available = self.buf_start + len(self.buf) - (0 if self.stream is None else HOLD_BACK_SAMPLES)
+            n_frames = (pad + available - frame) // hop + 1 if pad + available >= frame else 0
+        else:
+            available = n_total
+            n_frames = 1 + n_total // hop
+        if n_frames <= self.n_done:
+            return
+        start, stop = frame_span(self.n_done, n_frames, hop, frame)
+        lo, hi = max(0, start - pad), min(available, stop - pad)
+        seg = self.buf[lo - self.buf_start:hi - self.buf_start]
+        seg = np.pad(seg, (lo - (start - pad), (stop - start) - (lo - (start - pad)) - len(seg)))
+        self.f0.append(harmony_analize.harmony_yin(seg, center=False))
+        self.n_done = n_frames
+        keep = max(0, n_frames * hop - pad - self.buf_start)
+        self.buf = self.buf[keep:]
+        self.buf_start += keep
+
+
+class LiveAnalyzer:
+    """
+    push(samples) で届いた音声を解析し、新しく確定したフレームと窓の結果を返す
+    predict: 標準化済みの窓統計量 (n, 208) -> {モデル名: (n,)}（analyze_audio.predict_windows）
+    window_frames / step_frames: analyze_audio.window_params(sr) の窓
+    """
+
+    def __init__(self, sr, predict, model_names, window_frames, step_frames, instrument=None, tuning=0.0,
+                 min_update_frames=MIN_UPDATE_FRAMES):
+        self.sr = int(sr)
+        self.predict = predict
+        self.model_names = list(model_names)
+        self.window_frames = int(window_frames)
+        self.step_frames = int(step_frames)
+        self.fmin, self.fmax = pitch_engine.pitch_range(instrument)
+        self.tuning = tuning
+        self.min_update_frames = int(min_update_frames)
+
+        self.buf = np.zeros(0, dtype=np.float32)  # 受け取った音声の [buf_start, n_samples)
+        self.buf_start = 0
+        self.n_samples = 0
+        self.first = 0.0                          # 先頭のサンプル（zero_crossing_rate の端の埋め値）
+
+        self.n_raw = 0                            # pitch / volume を返したフレーム数
+        self.f0, self.frame_rms, self.volume = [], [], []  # 音量で判定する前の f0・yin のフレームの RMS・音量
+        self.rms_peak = _RunningMax()
+
+        self.n_feat = 0                           # 特徴量が確定したフレーム数
+        self.feats = None                         # 特徴量のうちまだ窓で使う部分 [feats_start, n_feat)
+        self.feats_start = 0
+        self.mel_peak = _RunningMax()
+
+        self.n_win = 0                            # 予測を返した窓の数
+        self.scaler = StandardScaler()
+        self.harmony = _HarmonyF0(self.sr)
+        self.closed = False
+
+        # 受け取った音声（finish で窓統計量を計算し直す）
+        self.tmp = tempfile.TemporaryDirectory(prefix="live_analyzer_")
+        self.spill = sf.SoundFile(os.path.join(self.tmp.name, "take.wav"), "w", samplerate=self.sr,
+                                  channels=1, subtype="FLOAT")
+
+    @property
+    def latency_frames(self):
+        """音声が届いてから窓の予測が返るまでの最大フレーム数（窓の長さ + 前後の余白 + まとめる単位）"""
+        return self.window_frames + CONTEXT_FRAMES + self.min_update_frames
+
+    # === 受け取った音声の切り出し ===
+    def _padded(self, start, stop, mode="constant"):
+        """両端を n_fft/2 埋めた信号の [start, stop)（右端の埋めは finish のときだけ使われる）"""
+        pad = n_fft // 2
+        lo, hi = max(0, start - pad), min(self.n_samples, stop - pad)
+        y = self.buf[lo - self.buf_start:hi - self.buf_start]
+        left = lo - (start - pad)
+        right = (stop - start) - left - len(y)
+        if left or right:
+            if mode == "edge":
+                y = np.concatenate([np.full(left, self.first, dtype=np.float32), y,
+                                    np.full(right, y[-1] if len(y) else self.first, dtype=np.float32)])
+            else:
+                y = np.pad(y, (left, right))
+        return y
+
+    def _ready_frames(self, final):
+        if final:
+            return 1 + self.n_samples // hop_length
+        n = n_fft // 2 + self.n_samples
+        return (n - n_fft) // hop_length + 1 if n >= n_fft else 0
+
+    # === 各段の更新 ===
+    def _update_frames(self, n_ready):
+        f0, f1 = self.n_raw, n_ready
+        if f1 <= f0:
+            return None
+        y = self._padded(*frame_span(f0, f1))
+        f0s, rms = pitch_engine.yin_candidates(y, self.sr, self.fmin, self.fmax, hop_length, center=False)
+        self.rms_peak.extend(f0, rms)
+        pitch = pitch_engine.yin_voicing(f0s, rms, self.rms_peak.get(f0, f1))
+        volume = librosa.feature.rms(y=y, hop_length=hop_length, center=False).flatten()
+        self.f0.append(f0s)
+        self.frame_rms.append(rms)
+        self.volume.append(volume)
+        self.n_raw = f1
+        self.rms_peak.drop_before(f1)
+        return {"start": f0, "pitch": pitch.tolist(), "volume": volume.tolist()}
+
+    def _update_features(self, n_ready, final):
+        f0 = self.n_feat
+        f1 = n_ready if final else n_ready - CONTEXT_FRAMES
+        if f1 - f0 < (1 if final else self.min_update_frames):
+            return
+        g0, g1 = max(0, f0 - CONTEXT_FRAMES), min(n_ready, f1 + CONTEXT_FRAMES)
+        start, stop = frame_span(g0, g1)
+        y = self._padded(start, stop)
+        spectra = feature_engine.compute_spectra(y, self.sr, center=False, mel_db_max=-np.inf)  # 下限は下で決める
+        mel_db = spectra["mel_db"]
+        self.mel_peak.extend(g0, mel_db.max(axis=0))
+        floor = self.mel_peak.get(g0, g1) - feature_engine.top_db
+        spectra["mel_db"] = np.maximum(mel_db, floor.astype(mel_db.dtype))
+        zcr = librosa.feature.zero_crossing_rate(self._padded(start, stop, mode="edge"),
+                                                 frame_length=n_fft, hop_length=hop_length, center=False)
+        rms = librosa.feature.rms(y=y, frame_length=n_fft, hop_length=hop_length, center=False)
+        feats = feature_engine.features_from_parts(spectra, zcr, rms, self.sr, tuning=self.tuning)[f0 - g0:f1 - g0]
+        self.feats = feats if self.feats is None else np.concatenate([self.feats, feats])
+        self.n_feat = f1
+        self.mel_peak.drop_before(f1 - CONTEXT_FRAMES)
+
+    def _update_windows(self, final):
+        w, s = self.window_frames, self.step_frames
+        T = self.n_feat
+        if final:
+            n_ready = (T - 1) // s + 1 if T else 0
+        else:
+            n_ready = (T - w) // s + 1 if T >= w else 0
+        if n_ready <= self.n_win:
+            return None
+        starts = np.arange(self.n_win, n_ready, dtype=np.int64) * s
+        ends = np.minimum(starts + w, T)
+        a0 = int(starts[0])
+        block = self.feats[a0 - self.feats_start:int(ends.max()) - self.feats_start]
+        means, vars_, skews, kurts = window_stats.group_moments(block, starts - a0, ends - a0)
+        stats = np.concatenate([means, vars_, skews, kurts], axis=1)
+        self.n_win = n_ready
+
+        # 次の窓より前の特徴量はもう使わない
+        drop = n_ready * s - self.feats_start
+        if drop > 0:
+            self.feats = self.feats[drop:]
+            self.feats_start += drop
+
+        self.scaler.partial_fit(stats)
+        preds = self.predict(self.scaler.transform(stats))
+        times = (starts + (ends - starts) / 2) * hop_length / self.sr
+        return {"start": int(starts[0] // s), "time": times.tolist(),
+                **{name: np.asarray(preds[name]).tolist() for name in self.model_names}}
+
+    def _trim_buffer(self):
+        # 次に使うフレームより前のサンプルを捨てる
+        frame = min(self.n_raw, max(0, self.n_feat - CONTEXT_FRAMES))
+        keep_from = max(0, frame * hop_length - n_fft // 2)
+        if keep_from > self.buf_start:
+            self.buf = self.buf[keep_from - self.buf_start:]
+            self.buf_start = keep_from
+
+    # === 公開 API ===
+    def push(self, samples):
+        """
+        samples: モノラルの float32 の音声（前回の続き）
+        戻り値: {"frames": 新しいフレームの pitch / volume, "windows": 新しい窓の予測}（無ければ None）
+        """
+        if self.closed:
+            raise RuntimeError("finish / abort 後には push できません")
+        y = np.ascontiguousarray(samples, dtype=np.float32).ravel()
+        if len(y) == 0:
+            return {"frames": None, "windows": None}
+        if self.n_samples == 0:
+            self.first = y[0]
+        self.buf = np.concatenate([self.buf, y])
+        self.n_samples += len(y)
+        self.spill.write(y)
+        self.harmony.push(y)
+        self.harmony.update()
+
+        n_ready = self._ready_frames(final=False)
+        frames = self._update_frames(n_ready)
+        self._update_features(n_ready, final=False)
+        windows = self._update_windows(final=False)
+        self._trim_buffer()
+        return {"frames": frames, "windows": windows}
+
+    def finish(self, audio_path):
+        """
+        残りを解析し、録音全体の値で求め直した解析結果を audio_path（ブラウザがアップロードした録音）と
+        同じ名前の .cols に書き出す
+        戻り値: analyze_audio.analyze と同じ形の dict
+        """
+        if self.n_samples == 0:
+            raise ValueError("音声を受け取っていません")
+        T = self._ready_frames(final=True)
+        self._update_frames(T)
+        self._update_features(T, final=True)  # メル dB の最大値を最後のフレームまで求める
+        self.harmony.push(np.zeros(0, dtype=np.float32), last=True)
+        self.harmony.update(int(np.ceil(self.n_samples * float(harmony_analize.sr) / self.sr)))
+        self.closed = True
+
+        # 窓統計量は録音全体のメル dB の下限・調律のずれで計算し直し、全窓で fit した標準化で予測する
+        self.spill.close()
+        source = AudioSource(self.spill.name)
+        try:
+            globals_ = {**scan_globals(source, peaks=False), "mel_db_max": np.float32(self.mel_peak.peak)}
+            preds, times_frames = window_predictions(source, globals_, self.predict, self.model_names,
+                                                     self.window_frames, self.step_frames)
+        finally:
+            source.close()
+            self.tmp.cleanup()
+
+        # yin の無音判定は録音全体の最大 RMS で判定し直す
+        pitch = pitch_engine.yin_voicing(np.concatenate(self.f0)[:T], np.concatenate(self.frame_rms)[:T])
+        results = {
+            "pitch": pitch.tolist(),
+            "volume": np.concatenate(self.volume)[:T].tolist(),
+            **{name: upsample_block(np.asarray(preds[name], dtype=float), times_frames, 0, T).tolist()
+               for name in self.model_names},
+        }
+        # 逐次解析は yin・full 相当（presets.is_native）
+        analysis = presets.describe(presets.get_preset("full"), self.sr, "yin")
+        save_analysis(artifact_path(audio_path), results,
+                      {**harmony_analize.HARMONY_F0_PARAMS, "f0": np.concatenate(self.harmony.f0)}, analysis)
+        return results
+
+    def abort(self):
+        self.closed = True
+        self.spill.close()
+        self.tmp.cleanup()
+
+
+# === 常駐プロセス（Node の liveSession.ts から 1 録音に 1 つ起動する） ===
+def serve(sr, instrument=None):
+    with contextlib.redirect_stdout(sys.stderr):
+        import analyze_audio
+        analyze_audio.load_models()  # 学習済みモデルを読み込む（最初の更新で読み込まないよう先に）
+
+    window_frames, step_frames = analyze_audio.window_params(sr)
+    live = LiveAnalyzer(sr, analyze_audio.predict_windows, analyze_audio.model_names(),
+                        window_frames, step_frames, instrument=instrument)
+    out = sys.stdout
+    out.write(json.dumps({"ready": True, "latency_ms": live.latency_frames * hop_length * 1000 / sr}) + "\n")
+    out.flush()
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        job_type = job.get("type")
+        try:
+            # 解析中の print などが応答の行に混ざらないよう、標準出力は stderr に逃がす
+            with contextlib.redirect_stdout(sys.stderr):
+                if job_type == "push":
+                    samples = np.frombuffer(base64.b64decode(job["samples"]), dtype="<f4")
+                    result = live.push(samples)
+                elif job_type == "finish":
+                    result = live.finish(job["args"][0])
+                elif job_type == "abort":
+                    live.abort()
+                    result = None
+                else:
+                    raise ValueError(f"unknown job type: {job_type}")
+            response = {"id": job.get("id"), "ok": True, "output": json.dumps(result, ensure_ascii=False)}
+        except Exception as e:
+            traceback.print_exc(file=sys.stderr)
+            response = {"id": job.get("id"), "ok": False, "error": f"{type(e).__name__}: {e}"}
+        out.write(json.dumps(response, ensure_ascii=False) + "\n")
+        out.flush()
+        if job_type in ("finish", "abort") and response["ok"]:
+            break
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.stderr.write("usage: live_analyzer.py <sample_rate> [instrument]\n")
+        sys.exit(1)
+    serve(int(sys.argv[1]), sys.argv[2] if len(sys.argv) > 2 else None)
@@ -0,0 +1,90 @@
+import numpy as np
+
+# フレームごとの系列の縮約ピラミッド（グラフ表示用）
+#
+# レベル k は 2**k フレームごとの min / max / mean（レベル 0 は元の系列そのもの）
+# 表示する時間範囲と横幅（ピクセル）から、1 ピクセルに 1〜2 点になるレベルを選んで返す
+# pitch の 0（無声）は縮約に含めない（有声のフレームが無い点は 0）
+
+STATS = ("min", "max", "mean")
+MIN_POINTS = 128         # 最も粗いレベルでもこの点数以上残す
+MAX_LEVEL = 16
+BLOCK_FRAMES = 1 << MAX_LEVEL  # 縮約を少しずつ計算するときの単位（どのレベルの区切りとも揃う）
+SKIP_ZERO = ("pitch",)
+UNKNOWN_SERIES = "unknown series"  # 存在しない系列を指定されたときのエラーの先頭（feedbacks.ts が 400 にする）
+
+
+def n_levels(n_frames):
+    """n_frames の系列に作るレベル数（レベル 1〜n_levels を保存する）"""
+    k = 0
+    while k < MAX_LEVEL and -(-n_frames // (1 << (k + 1))) >= MIN_POINTS:
+        k += 1
+    return k
+
+
+def level_length(n_frames, k):
+    return -(-n_frames // (1 << k))
+
+
+def column_name(name, k, stat):
+    """.cols の列名（例: pitch@3.max）"""
+    return f"{name}@{k}.{stat}"
+
+
+def decimate(values, k, skip_zero=False):
+    """
+    values を 2**k フレームごとに縮約する（values の長さが 2**k の倍数でなければ最後の点は短い区間）
+    戻り値: {"min", "max", "mean"}  各 (ceil(len / 2**k),)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    size = 1 << k
+    n = level_length(len(values), k)
+    padded = np.full(n * size, np.nan)
+    padded[:len(values)] = values
+    if skip_zero:
+        padded[padded <= 0] = np.nan
+    blocks = padded.reshape(n, size)
+    valid = ~np.isnan(blocks)
+    count = valid.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out = {
+            "min": np.where(valid, blocks, np.inf).min(axis=1),
+            "max": np.where(valid, blocks, -np.inf).max(axis=1),
+            "mean": np.where(valid, blocks, 0.0).sum(axis=1) / count,
+        }
+    empty = count == 0
+    return {stat: np.where(empty, 0.0, v) for stat, v in out.items()}
+
+
+def check_names(names, available):
+    """names が available（ファイルにある系列）に無ければ ValueError（API では 400 にする）"""
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ValueError(f"{UNKNOWN_SERIES}: {', '.join(map(str, unknown))}")
+
+
+def choose_level(f0, f1, width, levels):
+    """フレーム [f0, f1) を width ピクセルに描くときのレベル（1 ピクセルに 1〜2 点）"""
+    per_pixel = (f1 - f0) / max(1, int(width))
+    k = int(np.floor(np.log2(per_pixel))) if per_pixel >= 1 else 0
+    return max(0, min(k, levels))
+
+
+def select(read, n_frames, levels, names, f0, f1, width, frame_rate):
+    """
+    read(name, k, stat, start, stop): レベル k の縮約（レベル 0 は元の系列で stat は無視）の [start, stop)
+    戻り値: API で返す dict（レベル 0 でも min / max / mean を返す）
+    """
+    f0 = max(0, min(int(f0), n_frames))
+    f1 = max(f0, min(int(f1), n_frames))
+    k = choose_level(f0, f1, width, levels)
+    b0, b1 = f0 >> k, -(-f1 // (1 << k))
+    series = {}
+    for name in names:
+        if k == 0:
+            values = np.asarray(read(name, 0, None, b0, b1), dtype=float).tolist()
+            series[name] = {stat: values for stat in STATS}
+        else:
+            series[name] = {stat: np.asarray(read(name, k, stat, b0, b1), dtype=float).tolist() for stat in STATS}
+    return {"level": k, "frames_per_point": 1 << k, "frame_rate": frame_rate,
+            "start_frame": b0 << k, "n_frames": n_frames, "series": series}
@@ -0,0 +1,140 @@
+import os
+import sys
+import json
+import time
+import itertools
+import threading
+
+# 解析の処理ごとの計測（名前付きの区間 = span）
+#
+# 環境変数 ANALYZER_METRICS で有効にする:
+#   stderr      : 1 区間 1 行の JSON を標準エラーに出す（analyzerPool.ts が拾って集計・ログ出力する）
+#   <パス>      : そのファイルに 1 区間 1 行の JSON を追記する
+#   未設定 / 0  : 何もしない（span() は何もしない共通のオブジェクトを返すだけ）
+#
+# 1 行の形:
+#   {"span": "analyze.features", "trace": "...", "parent": "analyze", "wall_ms": ..., "cpu_ms": ...,
+#    "rss_mib": 終了時の RSS, "peak_rss_mib": プロセスの最大 RSS, "peak_rss_grew_mib": 区間中に最大 RSS が伸びた量,
+#    "attrs": {"frames": ..., "features": {"shape": [...], "mib": ...}, ...}}
+# peak_rss_mib は常駐プロセスでは起動からの最大値なので、区間ごとの比較には peak_rss_grew_mib を使う
+#
+# 使い方:
+#   with metrics.span("analyze.features", file=path) as sp:
+#       features = ...
+#       sp.size(features=features)
+
+MIB = 2 ** 20
+
+
+class _NoSpan:
+    """計測しないときの span（何もしない）"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+    def size(self, **arrays):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+_ids = itertools.count(1)
+_local = threading.local()  # スレッドごとの開いている区間（read_pickle.read_many はスレッドで読む）
+_lock = threading.Lock()
+_out = None
+
+
+def _target():
+    value = os.environ.get("ANALYZER_METRICS", "")
+    return None if value in ("", "0") else value
+
+
+def _rss_mib():
+    """現在の RSS（Linux の /proc から。読めなければ None）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / MIB
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _peak_rss_mib():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    # Linux は KiB、macOS はバイト
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / MIB if sys.platform == "darwin" else peak / 1024
+
+
+def _emit(record):
+    global _out
+    target = _target()
+    line = json.dumps(record, ensure_ascii=False, default=float) + "\n"
+    with _lock:
+        if target in ("1", "stderr"):
+            sys.__stderr__.write(line)
+            sys.__stderr__.flush()
+            return
+        if _out is None or _out.name != target:
+            _out = open(target, "a", encoding="utf-8")
+        _out.write(line)
+        _out.flush()
+
+
+class Span:
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def size(self, **arrays):
+        """配列の形と大きさを記録する"""
+        for key, a in arrays.items():
+            shape = getattr(a, "shape", None)
+            if shape is None:
+                self.attrs[key] = {"len": len(a)}
+            else:
+                self.attrs[key] = {"shape": list(shape), "mib": round(a.nbytes / MIB, 3)}
+
+    def __enter__(self):
+        if not hasattr(_local, "stack"):
+            _local.stack = []
+        self.parent = _local.stack[-1] if _local.stack else None
+        self.trace = self.parent.trace if self.parent else f"{os.getpid()}-{next(_ids)}"
+        _local.stack.append(self)
+        self.peak0 = _peak_rss_mib()
+        self.cpu0 = time.process_time()
+        self.wall0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.wall0
+        cpu = time.process_time() - self.cpu0
+        _local.stack.pop()
+        peak = _peak_rss_mib()
+        record = {"span": self.name, "trace": self.trace,
+                  "parent": self.parent.name if self.parent else None,
+                  "wall_ms": round(wall * 1000, 3), "cpu_ms": round(cpu * 1000, 3),
+                  "rss_mib": _rss_mib(), "peak_rss_mib": peak,
+                  "peak_rss_grew_mib": None if peak is None else round(peak - self.peak0, 3),
+                  "attrs": self.attrs}
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        _emit(record)
+        return False
+
+
+def span(name, **attrs):
+    """名前付きの区間（計測が無効なら何もしない）"""
+    if _target() is None:
+        return _NO_SPAN
+    return Span(name, attrs)
@@ -0,0 +1,71 @@
+import os
+import sys
+import pickle
+import numpy as np
+
+from artifact import HARMONY_F0_KEY, Artifact, artifact_path, save_analysis
+
+# uploads/ 以下の旧形式の解析結果（.pkl: リストの dict）を列指向ファイル（.cols）に変換する
+#
+# 使い方: python3 migrate_artifacts.py [uploads フォルダ] [--delete]
+#         --delete を付けると、変換して中身を確認できた .pkl を削除する
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_UPLOADS = os.path.join(BASE_DIR, "..", "uploads")
+
+
+def convert(pkl_path):
+    """1 ファイルを変換し、書き込んだ .cols のパスを返す"""
+    with open(pkl_path, "rb") as f:
+        data = pickle.load(f)
+    if not isinstance(data, dict):
+        raise ValueError("解析結果の dict ではありません")
+
+    harmony_f0 = data.get(HARMONY_F0_KEY)
+    series = {k: v for k, v in data.items() if k != HARMONY_F0_KEY}
+    cols_path = artifact_path(pkl_path)
+    save_analysis(cols_path, series, harmony_f0 if isinstance(harmony_f0, dict) else None)
+
+    # 読み戻して float32 の精度で一致するか確認
+    art = Artifact(cols_path)
+    for k, v in series.items():
+        ref = np.asarray(v, dtype=np.float64)
+        if not np.allclose(art.column(k), ref.astype(np.float32), rtol=0, atol=0, equal_nan=True):
+            raise ValueError(f"{k}: 変換後の値が一致しません")
+
+    # 旧ファイルと同じ更新時刻にして、録音より新しいかどうかの判定を変えない
+    st = os.stat(pkl_path)
+    os.utime(cols_path, (st.st_atime, st.st_mtime))
+    return cols_path
+
+
+def migrate(root, delete=False):
+    converted, skipped, failed = 0, 0, 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in sorted(filenames):
+            if not name.endswith(".pkl"):
+                continue
+            pkl_path = os.path.join(dirpath, name)
+            cols_path = artifact_path(pkl_path)
+            if os.path.exists(cols_path) and os.path.getmtime(cols_path) >= os.path.getmtime(pkl_path):
+                skipped += 1
+                continue
+            try:
+                convert(pkl_path)
+            except Exception as e:
+                failed += 1
+                print(f"[migrate] 失敗: {pkl_path}: {type(e).__name__}: {e}")
+                continue
+            converted += 1
+            print(f"[migrate] {pkl_path} -> {os.path.basename(cols_path)}")
+            if delete:
+                os.remove(pkl_path)
+
+    print(f"[migrate] 変換 {converted} / スキップ {skipped} / 失敗 {failed}")
+    return failed == 0
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if a != "--delete"]
+    ok = migrate(args[0] if args else DEFAULT_UPLOADS, delete="--delete" in sys.argv[1:])
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,53 @@
+import numpy as np
+import feature_subset
+
+# 5 指標の予測モデルをまとめた 1 ファイル（create_model/src/audio_10_distill_models.py で作る）
+#
+#   kind    : モデルの種類（表示用。"rf_multi" / "rf_small" / "hgb" / "ridge" など）
+#   names   : 出力の名前（予測の列の順）
+#   columns : 入力に使う窓統計量の列（feature_subset.py。None は全 208 列）
+#   model   : predict(X) が (n, len(names)) を返す推定器 1 つ、または {名前: predict(X) が (n,) の推定器}
+#
+# analyze_audio.py は analyzer フォルダに quality_model.joblib（または ANALYZER_MODEL_BUNDLE のパス）が
+# あればこれで推論し、無ければ従来どおり rf_model_<名前>.pkl を使う
+# 無圧縮（compress=0、既定）で保存したものは load(path, mmap_mode="r") で配列をコピーせずにメモリマップする
+# （sklearn の決定木は読み込み時に自前の領域へコピーするので、効くのは HistGradientBoosting や線形モデルの配列）
+
+FORMAT_VERSION = 1
+DEFAULT_FILE = "quality_model.joblib"
+
+
+class ModelBundle:
+    def __init__(self, model, names, columns=None, kind=""):
+        self.model = model
+        self.names = list(names)
+        self.columns = feature_subset.ALL_COLUMNS if columns is None else feature_subset.normalize(columns)
+        self.kind = kind
+
+    def predict(self, X):
+        """X: 窓統計量の columns の列 (n, len(columns))  戻り値: (n, len(names))"""
+        if isinstance(self.model, dict):
+            return np.column_stack([np.asarray(self.model[name].predict(X), dtype=float) for name in self.names])
+        preds = np.asarray(self.model.predict(X), dtype=float)
+        return preds.reshape(len(X), len(self.names))
+
+    def predict_dict(self, X):
+        preds = self.predict(X)
+        return {name: preds[:, i] for i, name in enumerate(self.names)}
+
+    def save(self, path, compress=0):
+        import joblib
+
+        # 読み込み側でクラスの場所に依存しないよう、素の dict として保存する
+        columns = None if feature_subset.is_full(self.columns) else self.columns
+        joblib.dump({"format_version": FORMAT_VERSION, "kind": self.kind, "names": self.names,
+                     "columns": columns, "model": self.model}, path, compress=compress)
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        import joblib
+
+        d = joblib.load(path, mmap_mode=mmap_mode)
+        if not isinstance(d, dict) or d.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"{path}: 未対応のモデルバンドルです")
+        return cls(d["model"], d["names"], d["columns"], d.get("kind", ""))
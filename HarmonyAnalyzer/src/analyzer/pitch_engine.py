@@ -0,0 +1,169 @@
+import os
+import numpy as np
+
+# librosa の import は重い（0.3 秒ほど）ので、使う関数の中で読み込む
+
+hop_length = 512  # フレーム長さ
+frame_length = 2048
+
+# 全音域（従来の pyin の探索範囲）
+FULL_RANGE = ("C2", "C7")
+
+# 楽器ごとの実音の音域（この範囲 ± RANGE_MARGIN 半音で探索する）
+# アップロード先フォルダ（団体/楽器/曲名_BPM_拍子）の楽器名と対応させる
+INSTRUMENT_RANGES = {
+    "ピッコロ": ("D5", "C8"),
+    "フルート": ("C4", "D7"),
+    "オーボエ": ("A#3", "A6"),
+    "ファゴット": ("A#1", "E5"),
+    "クラリネット": ("D3", "A#6"),
+    "バスクラリネット": ("C#2", "G5"),
+    "アルトサックス": ("C#3", "G#5"),
+    "テナーサックス": ("G#2", "D#5"),
+    "バリトンサックス": ("C#2", "G#4"),
+    "トランペット": ("E3", "C6"),
+    "ホルン": ("B1", "F5"),
+    "トロンボーン": ("E2", "F5"),
+    "ユーフォニアム": ("A#1", "A#4"),
+    "チューバ": ("D1", "F4"),
+    "コントラバス": ("E1", "G4"),
+    "弦バス": ("E1", "G4"),
+}
+RANGE_MARGIN = 2  # 半音
+
+# 'pyin'        : 従来どおり C2〜C7 を pyin で探索（最も正確・最も遅い）
+# 'pyin_narrow' : 楽器の音域に絞って pyin（楽器が分からなければ 'pyin' と同じ）
+# 'yin'         : ベクトル化した YIN + 無声判定（最も速い）
+PITCH_ENGINES = ("pyin", "pyin_narrow", "yin")
+DEFAULT_PITCH_ENGINE = "pyin"
+
+# yin の有声判定のしきい値
+YIN_TROUGH_THRESHOLD = 0.1   # これより深い谷のうち最短の周期を採用
+YIN_VOICED_THRESHOLD = 0.25  # 谷の深さ（非周期性）がこれ未満なら有声
+YIN_SILENCE_DB = -50.0       # 最大フレームからこの dB 以下のフレームは無声
+
+
+def instrument_from_path(audio_path):
+    """パスのフォルダ名から楽器名を探す（見つからなければ None）"""
+    for seg in reversed(os.path.normpath(audio_path).split(os.sep)):
+        if seg in INSTRUMENT_RANGES:
+            return seg
+    return None
+
+
+def pitch_range(instrument=None):
+    """
+    探索する (fmin, fmax) [Hz] を返す
+    楽器の音域に余裕を持たせた範囲を、従来の C2〜C7 の内側に収める
+    """
+    import librosa
+    full_min, full_max = (librosa.note_to_hz(n) for n in FULL_RANGE)
+    if instrument not in INSTRUMENT_RANGES:
+        return full_min, full_max
+    low, high = INSTRUMENT_RANGES[instrument]
+    fmin = librosa.note_to_hz(low) * 2 ** (-RANGE_MARGIN / 12)
+    fmax = librosa.note_to_hz(high) * 2 ** (RANGE_MARGIN / 12)
+    return max(fmin, full_min), min(fmax, full_max)
+
+
+def pyin_pitch(y, sr, fmin, fmax, hop_length=hop_length):
+    import librosa
+    f0, _, _ = librosa.pyin(y, fmin=fmin, fmax=fmax, sr=sr,
+                            frame_length=frame_length, hop_length=hop_length)
+    return np.nan_to_num(f0, nan=0.0)
+
+
+def yin_frames(y, hop_length=hop_length, center=True):
+    """yin_pitch が使うフレーム (frame_length, T)（center=False なら y は両端埋め済みの信号の一部）"""
+    import librosa
+    if center:
+        y = np.pad(y, frame_length // 2, mode='constant')
+    return librosa.util.frame(y, frame_length=frame_length, hop_length=hop_length)
+
+
+def frame_rms(frames):
+    return np.sqrt(np.mean(np.square(frames), axis=0))
+
+
+def yin_pitch(y, sr, fmin, fmax, hop_length=hop_length, center=True, ref_rms=None):
+    """
+    YIN（累積平均正規化差分関数）を全フレーム一括で計算し、
+    非周期性と音量から無声フレームを 0 にする
+    center: False のときは y を両端埋め済みの信号の一部として扱う（stream_analyzer.py 用）
+    ref_rms: 無音判定の基準にする録音全体の最大 RMS（None なら y の中の最大値）
+    戻り値: (n_frames,) pyin と同じフレーム数・同じ中心位置
+    """
+    f0, rms = yin_candidates(y, sr, fmin, fmax, hop_length, center)
+    return yin_voicing(f0, rms, ref_rms)
+
+
+def yin_candidates(y, sr, fmin, fmax, hop_length=hop_length, center=True):
+    """
+    yin_pitch のうち音量以外の無声判定まで
+    音量の判定には録音全体の最大 RMS が要るので分けてある（live_analyzer の finish で判定し直す）
+    戻り値: (有声なら f0・それ以外は 0, フレームの RMS)
+    """
+    import librosa
+    frames = yin_frames(y, hop_length, center)  # (L, T)
+
+    min_period = max(1, int(np.floor(sr / fmax)))
+    max_period = min(int(np.ceil(sr / fmin)), frame_length - 1)
+
+    # 差分関数 d(k) = 2 * (r(0) - r(k)) - sum_{m<k} y(m)^2   （r は自己相関）
+    acf = librosa.autocorrelate(frames, max_size=max_period + 1, axis=0)
+    energy = np.cumsum(np.square(frames[:max_period]), axis=0)
+    diff = 2 * (acf[:1] - acf[1:max_period + 1]) - energy
+
+    # 累積平均で正規化
+    k = np.arange(1, max_period + 1)[:, None]
+    cmnd = diff / (np.cumsum(diff, axis=0) / k + librosa.util.tiny(diff))
+    cmnd = cmnd[min_period - 1:]  # 周期 min_period..max_period
+
+    # しきい値より深い最初の谷、なければ全体の最小値
+    is_trough = np.zeros_like(cmnd, dtype=bool)
+    is_trough[1:-1] = (cmnd[1:-1] < cmnd[:-2]) & (cmnd[1:-1] <= cmnd[2:])
+    is_trough[0] = cmnd[0] < cmnd[1]
+    below = is_trough & (cmnd < YIN_TROUGH_THRESHOLD)
+    idx = np.where(below.any(axis=0), np.argmax(below, axis=0), np.argmin(cmnd, axis=0))
+
+    # 放物線補間で周期を細かく求める
+    cols = np.arange(cmnd.shape[1])
+    i0 = np.clip(idx, 1, cmnd.shape[0] - 2)
+    a, b, c = cmnd[i0 - 1, cols], cmnd[i0, cols], cmnd[i0 + 1, cols]
+    denom = a - 2 * b + c
+    with np.errstate(all='ignore'):
+        shift = np.where(np.abs(denom) > 0, 0.5 * (a - c) / denom, 0.0)
+    shift = np.where((idx == i0) & (np.abs(shift) <= 1), shift, 0.0)
+    period = min_period + idx + shift
+    f0 = sr / period
+
+    # 無声判定（非周期性が大きい / 探索範囲外）
+    aperiodicity = cmnd[idx, cols]
+    voiced = (aperiodicity < YIN_VOICED_THRESHOLD) & (f0 >= fmin) & (f0 <= fmax)
+    return np.where(voiced, f0, 0.0), frame_rms(frames)
+
+
+def yin_voicing(f0, rms, ref_rms=None):
+    """音が小さいフレームの f0 を 0 にする（ref_rms: 基準の RMS。None なら rms の最大値）"""
+    import librosa
+    loud = librosa.amplitude_to_db(rms, ref=np.max if ref_rms is None else ref_rms) > YIN_SILENCE_DB
+    return np.where(loud, f0, 0.0)
+
+
+def extract_pitch(y, sr, engine=DEFAULT_PITCH_ENGINE, instrument=None, hop_length=hop_length):
+    """
+    engine: PITCH_ENGINES のいずれか
+    instrument: 'pyin_narrow' / 'yin' の探索範囲に使う楽器名（instrument_from_path の戻り値）
+    戻り値: (n_frames,) 無声フレームは 0
+    """
+    if engine not in PITCH_ENGINES:
+        raise ValueError(f"pitch engine は {PITCH_ENGINES} のいずれかにしてください: {engine}")
+
+    if engine == "pyin":
+        fmin, fmax = pitch_range(None)
+        return pyin_pitch(y, sr, fmin, fmax, hop_length)
+
+    fmin, fmax = pitch_range(instrument)
+    if engine == "pyin_narrow":
+        return pyin_pitch(y, sr, fmin, fmax, hop_length)
+    return yin_pitch(y, sr, fmin, fmax, hop_length)
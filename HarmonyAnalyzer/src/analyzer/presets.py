@@ -0,0 +1,46 @@
+import feature_engine
+
+# 解析の品質プリセット（サーバーが混んでいるときに精度を下げて処理量を減らす）
+#
+#   sr             : 解析するサンプリング周波数（None は録音のまま）
+#   n_fft          : STFT の窓長（zcr / rms のフレーム長も同じ）
+#   hop_length     : 解析のフレーム間隔
+#   pitch_engine   : pitch_engine.PITCH_ENGINES（呼び出し側で指定があればそちらを使う）
+#   window_step    : 窓統計量を計算する間隔（秒）。窓の長さは 1 秒のまま
+#   predict_stride : 何窓に 1 回モデルで予測するか（間の窓は前後の予測から補間）
+#
+# 出力（.cols）はどのプリセットでも「録音のサンプリング周波数・hop_length 512」のフレーム列に揃える
+# （画面側は 48 kHz / 512 のフレームを前提にしている）。full は従来の analyze と同じ結果になる
+
+PRESETS = {
+    "full":     {"sr": None,  "n_fft": 2048, "hop_length": 512, "pitch_engine": "pyin",
+                 "window_step": 0.1, "predict_stride": 1},
+    "balanced": {"sr": 22050, "n_fft": 1024, "hop_length": 256, "pitch_engine": "yin",
+                 "window_step": 0.1, "predict_stride": 1},
+    "fast":     {"sr": 16000, "n_fft": 1024, "hop_length": 512, "pitch_engine": "yin",
+                 "window_step": 0.2, "predict_stride": 2},
+}
+DEFAULT_PRESET = "full"
+
+# 出力のフレーム間隔
+OUTPUT_HOP_LENGTH = feature_engine.hop_length
+
+
+def get_preset(name=None):
+    """プリセット名から設定値の dict（コピー）を返す。None は DEFAULT_PRESET"""
+    name = name or DEFAULT_PRESET
+    if name not in PRESETS:
+        raise ValueError(f"preset は {tuple(PRESETS)} のいずれかにしてください: {name}")
+    return {"preset": name, **PRESETS[name]}
+
+
+def is_native(preset):
+    """録音のサンプリング周波数・出力と同じフレームで解析するか（ブロック解析・逐次解析と同じ条件）"""
+    return (preset["sr"] is None and preset["n_fft"] == feature_engine.n_fft
+            and preset["hop_length"] == OUTPUT_HOP_LENGTH and preset["predict_stride"] == 1)
+
+
+def describe(preset, native_sr, pitch_engine_name):
+    """.cols の meta に記録する値（実際に使ったサンプリング周波数・pitch engine と出力のフレーム）"""
+    return {**preset, "sr": preset["sr"] or native_sr, "pitch_engine": pitch_engine_name,
+            "output_sr": native_sr, "output_hop_length": OUTPUT_HOP_LENGTH}
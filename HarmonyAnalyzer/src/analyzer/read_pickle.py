@@ -2,6 +2,11 @@ import pickle
 import json
 import sys
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import os
+import lod
+import metrics
+from artifact import ARTIFACT_EXT, DEFAULT_OUTPUT_SR, HARMONY_F0_KEY, load_analysis, load_lod
 
 def convert_to_serializable(obj):
     if isinstance(obj, np.ndarray):
@@ -15,15 +20,91 @@ def convert_to_serializable(obj):
     else:
         return obj
     
-def main(args):
-  path = args[0]
-  
+def read_pickle(path):
+  with metrics.span("read_pickle.load", file=os.path.basename(path)) as sp:
+    data = _read(path)
+    if isinstance(data, dict):
+      sp.set(series=len(data), frames=len(data.get("pitch", ())))
+  return data
+
+def _read(path):
+  # 列指向ファイル（.cols）はそのまま読む。.pkl は migrate_artifacts.py で変換する前の旧形式
+  if path.endswith(ARTIFACT_EXT):
+    return load_analysis(path)
+
   with open(path, 'rb') as f:
     data = pickle.load(f)
-  
-  serializable_data = convert_to_serializable(data)
-  
-  print(json.dumps(serializable_data, ensure_ascii=False))
+
+  # 協和度用の f0 は harmony_analize.py だけが使うので返さない
+  if isinstance(data, dict):
+    data.pop(HARMONY_F0_KEY, None)
+
+  return convert_to_serializable(data)
+
+def read_lod(path, start=0, end=None, width=1000, names=None):
+  """
+  時間範囲 [start, end)（秒）を width ピクセルに描くための縮約（artifact.load_lod と同じ形）
+  .pkl は縮約ピラミッドを持たないので元の系列から計算する
+  """
+  if path.endswith(ARTIFACT_EXT):
+    return load_lod(path, start, end, width, names)
+
+  data = read_pickle(path)
+  names = names or list(data)
+  lod.check_names(names, data)
+  n_frames = len(data[names[0]]) if names else 0
+  computed = {}
+
+  def read(name, k, stat, b0, b1):
+    values = np.asarray(data[name], dtype=float)
+    if k == 0:
+      return values[b0:b1]
+    if name not in computed:
+      computed[name] = lod.decimate(values[b0 << k:b1 << k], k, name in lod.SKIP_ZERO)
+    return computed[name][stat]
+
+  rate = DEFAULT_OUTPUT_SR / 512
+  f1 = n_frames if end is None else int(np.ceil(float(end) * rate))
+  return lod.select(read, n_frames, lod.n_levels(n_frames), names, int(float(start) * rate), f1, width, rate)
+
+def read_many(paths, max_workers=8):
+  """
+  複数の解析結果をスレッドで並行して読み、読み終わった順に 1 件ずつ返す
+  読めなかったファイルも止めずに {"ok": false, "error": ...} として返す
+  """
+  if not paths:
+    return
+  with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as ex:
+    futures = {ex.submit(read_pickle, p): i for i, p in enumerate(paths)}
+    for fut in as_completed(futures):
+      i = futures[fut]
+      try:
+        yield {"index": i, "path": paths[i], "ok": True, "data": fut.result()}
+      except Exception as e:
+        yield {"index": i, "path": paths[i], "ok": False, "error": f"{type(e).__name__}: {e}"}
+
+def batch_lines(paths):
+  """read_many の結果を NDJSON の行（改行なし）にする"""
+  for record in read_many(paths):
+    yield json.dumps(record, ensure_ascii=False)
+
+def main(args):
+  # 使い方: python3 read_pickle.py <path>
+  #         python3 read_pickle.py --batch <path> <path> ...   （1 行 1 ファイルの NDJSON を読み終わった順に出力）
+  if args and args[0] == '--batch':
+    for line in batch_lines(args[1:]):
+      print(line, flush=True)
+    return
+
+  path = args[0]
+
+  with metrics.span("read_pickle", file=os.path.basename(path)):
+    serializable_data = read_pickle(path)
+    with metrics.span("read_pickle.json") as sp:
+      out = json.dumps(serializable_data, ensure_ascii=False)
+      sp.set(chars=len(out))
+
+  print(out)
 
 if __name__ == "__main__":
     main(sys.argv[1:])
\ No newline at end of file
@@ -0,0 +1,171 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import functools
+
+# 解析結果（.cols）のキャッシュ（録音ファイルの中身で引く）
+#
+# 同じ録音の再アップロード、別のフォルダへの複製、コンテナ再起動後の解析し直しで、
+# 解析せずに保存済みの .cols を録音の隣に複製する（analyze_audio.analyze）
+#
+#   キー : 録音ファイルの中身の SHA-256 + 解析の設定（pitch engine・プリセット・楽器など）+ 版
+#   版   : モデルファイル（rf_model_*.pkl・rf_models_compiled.npz・モデルバンドル）の大きさと更新時刻、
+#          解析コードの中身、librosa の版から作る
+#          モデルを置き換えると版が変わるので、古い結果は使われなくなり、そのうち下の LRU で消える
+#          常駐ワーカーも解析ごとに版を確かめ、変わっていればモデルを読み込み直す（analyze_audio.refresh_models）
+#   値   : ヒット・ミスのどちらでも保存した値（float32）を返す（analyze_audio.as_saved）
+#
+# 環境変数:
+#   ANALYZER_CACHE_DIR     : 置き場所（既定は uploads の隣の analysis_cache。フォルダ一覧に出ないよう uploads の外に置く）
+#   ANALYZER_CACHE_MAX_MB  : 合計の上限。超えたら最後に使った時刻（ファイルの更新時刻）が古いものから消す。0 で無効
+#
+# ヒット・ミスの回数はプロセスごとに stats() で数える
+# ANALYZER_METRICS を有効にすると analyze.cache の区間（attrs.hit）としても出る（analyzerMetrics.ts が集計する）
+#
+# 使い方: python3 result_cache.py          置き場所・件数・合計の大きさを表示
+#         python3 result_cache.py --clear  全部消す
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.environ.get("ANALYZER_CACHE_DIR") or os.path.join(BASE_DIR, "..", "analysis_cache")
+MAX_BYTES = float(os.environ.get("ANALYZER_CACHE_MAX_MB", "2048")) * 2 ** 20
+ENTRY_EXT = ".cols"
+CHUNK = 2 ** 20
+
+# 結果に影響する解析コード・.cols に書き込むコード（中身が変われば版が変わる）
+CODE_FILES = (
+    "analyze_audio.py", "feature_engine.py", "feature_subset.py", "window_stats.py", "pitch_engine.py",
+    "presets.py", "stream_analyzer.py", "harmony_analize.py", "audio_decode.py", "artifact.py",
+    "tree_ensemble.py", "model_bundle.py", "lod.py",
+)
+
+_counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+
+def enabled():
+    return MAX_BYTES > 0
+
+
+def file_digest(path):
+    """ファイルの中身の SHA-256"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+@functools.lru_cache(maxsize=1)
+def _code_digest():
+    import librosa
+    h = hashlib.sha256(f"librosa {librosa.__version__}\n".encode())
+    for name in CODE_FILES:
+        path = os.path.join(BASE_DIR, name)
+        if os.path.exists(path):
+            h.update(name.encode() + b"\n")
+            h.update(open(path, "rb").read())
+    return h.hexdigest()
+
+
+def version(model_paths):
+    """
+    モデル・解析コードの版
+    model_paths: 解析に使う可能性のあるモデルファイル（無いものは飛ばす）。中身は読まず大きさと更新時刻を使う
+    """
+    h = hashlib.sha256(_code_digest().encode())
+    for path in model_paths:
+        if os.path.exists(path):
+            st = os.stat(path)
+            h.update(f"{os.path.basename(path)} {st.st_size} {st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+
+def key(model_version, **params):
+    """params: 録音の digest と解析の設定（JSON にできる値）"""
+    blob = json.dumps({"version": model_version, **params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def entry_path(cache_key):
+    return os.path.join(CACHE_DIR, cache_key[:2], cache_key + ENTRY_EXT)
+
+
+def _link_or_copy(src, dest):
+    """dest を src と同じ中身にする（同じファイルシステムならハードリンク。.cols は置き換えでしか書かないので共有してよい）"""
+    tmp = f"{dest}.tmp{os.getpid()}"
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dest)
+
+
+def restore(cache_key, dest):
+    """キャッシュにあれば dest に複製して True"""
+    src = entry_path(cache_key)
+    try:
+        _link_or_copy(src, dest)
+        os.utime(src)  # 最後に使った時刻（LRU）
+    except OSError:  # 無い（別のプロセスが消した場合も）・読めない
+        _counters["misses"] += 1
+        return False
+    _counters["hits"] += 1
+    return True
+
+
+def store(cache_key, src):
+    """解析した .cols をキャッシュに入れ、上限を超えた分を古いものから消す"""
+    dest = entry_path(cache_key)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    _link_or_copy(src, dest)
+    os.utime(dest)
+    _counters["stores"] += 1
+    evict()
+
+
+def entries():
+    """[(最後に使った時刻, バイト数, パス)]"""
+    out = []
+    if not os.path.isdir(CACHE_DIR):
+        return out
+    for sub in os.scandir(CACHE_DIR):
+        if not sub.is_dir():
+            continue
+        for e in os.scandir(sub.path):
+            if e.name.endswith(ENTRY_EXT):
+                try:
+                    st = e.stat()
+                except FileNotFoundError:  # 別のプロセスが消した
+                    continue
+                out.append((st.st_mtime, st.st_size, e.path))
+    return out
+
+
+def evict(max_bytes=MAX_BYTES):
+    """合計が max_bytes 以下になるまで、最後に使った時刻が古いものから消す"""
+    items = sorted(entries())
+    total = sum(size for _, size, _ in items)
+    for _, size, path in items:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        _counters["evictions"] += 1
+
+
+def stats():
+    """このプロセスでのヒット・ミスなどの回数"""
+    lookups = _counters["hits"] + _counters["misses"]
+    return {**_counters, "hit_rate": _counters["hits"] / lookups if lookups else None}
+
+
+if __name__ == "__main__":
+    if "--clear" in sys.argv[1:]:
+        evict(0)
+    items = entries()
+    print(f"{os.path.abspath(CACHE_DIR)}: {len(items)} 件 "
+          f"{sum(size for _, size, _ in items) / 2 ** 20:.1f} MiB / {MAX_BYTES / 2 ** 20:.0f} MiB")
@@ -0,0 +1,414 @@
+import os
+import tempfile
+import numpy as np
+import librosa
+import soundfile as sf
+import soxr
+
+import feature_engine
+import pitch_engine
+import window_stats
+import harmony_analize
+import audio_decode
+from artifact import HARMONY_F0_KEY, analysis_writer
+
+# 長い録音（通し練習など）を、録音全体を読み込まずにブロックごとに解析する
+# 保存される .cols は analyze_audio.analyze（録音全体をメモリに載せる版）とバイト単位で一致する
+#
+# 録音全体の値が必要な箇所は、先に録音を流し読みして求めておく
+#   - メル dB の下限（power_to_db の top_db は録音全体の最大値が基準）
+#   - chroma の調律のずれ（estimate_tuning は録音全体のピークの強さの中央値を使う）
+#   - yin の無音判定の基準（録音全体の最大 RMS）
+#   - 窓統計量の標準化（StandardScaler は全窓の統計量を一時ファイルに書き出してから fit する）
+# 録音の長さに比例してメモリを使うのは、窓ごとの予測値（5 モデル × 窓数）だけ
+#
+# pyin は録音全体で Viterbi 探索をするため分割できない。ブロック解析は yin のみ対応
+
+BLOCK_FRAMES = 1024      # 1 回に特徴量を計算するフレーム数
+CONTEXT_FRAMES = 16      # 前後に余分に計算するフレーム数（delta の 9 フレーム窓などの端の影響を消す）
+# melspectrogram / chroma の行列積は列が少ないと BLAS の別の計算経路になり、下位ビットが変わる
+# （手元の OpenBLAS では chroma が 82 列未満で変わる）。スペクトログラムは少なくともこの列数で計算する
+MIN_COLUMNS = 256
+PREDICT_ROWS = 4096      # 標準化・推論を 1 回に行う窓の数
+READ_SAMPLES = 1 << 16   # 協和度用 f0 のリサンプルで 1 回に読む サンプル数
+
+hop_length = feature_engine.hop_length
+n_fft = feature_engine.n_fft
+N_KEYS = 1 << 16         # 調律推定の中央値探しで使うヒストグラムのビン数
+# PipeSource が読んだ位置より前に残しておくサンプル数
+# （次のブロックは前後の余分なフレーム・最後のブロックを MIN_COLUMNS に広げた分だけ手前から読む）
+KEEP_SAMPLES = (MIN_COLUMNS + 2 * CONTEXT_FRAMES) * hop_length + n_fft
+
+
+class AudioSource:
+    """録音の一部を読み出す（librosa.load(sr=None) と同じくモノラル・float32）"""
+
+    def __init__(self, path):
+        self.file = sf.SoundFile(path)
+        self.sr = self.file.samplerate
+        self.n_samples = self.file.frames
+
+    def close(self):
+        self.file.close()
+
+    def read(self, start, stop):
+        start, stop = max(0, start), min(self.n_samples, stop)
+        if stop <= start:
+            return np.zeros(0, dtype=np.float32)
+        self.file.seek(start)
+        y = self.file.read(stop - start, dtype="float32", always_2d=True).T
+        return librosa.to_mono(y) if y.shape[0] > 1 else y[0]
+
+    def padded(self, start, stop, pad, mode="constant"):
+        """
+        両端を pad サンプル埋めた信号（librosa の center=True と同じ）の [start, stop)
+        mode: 'constant'（0 埋め。stft / rms / yin） / 'edge'（端の値。zero_crossing_rate）
+        """
+        y = self.read(start - pad, stop - pad)
+        left = max(0, min(stop, pad) - start)
+        right = max(0, stop - max(start, pad + self.n_samples))
+        if left or right:
+            y = np.pad(y, (left, right), mode=mode if len(y) else "constant")
+        return y
+
+    def n_frames(self, hop=hop_length):
+        return 1 + self.n_samples // hop
+
+
+class ArraySource(AudioSource):
+    """読み込み済みの信号（audio_decode.decode の戻り値など）を AudioSource と同じように読み出す"""
+
+    def __init__(self, y, sr):
+        self.y = np.asarray(y, dtype=np.float32)
+        self.sr = sr
+        self.n_samples = len(self.y)
+
+    def close(self):
+        self.y = None
+
+    def read(self, start, stop):
+        return self.y[max(0, start):min(self.n_samples, stop)]
+
+
+class PipeSource(AudioSource):
+    """
+    soundfile で読めない録音（webm など）を ffmpeg の標準出力からブロックごとに読み出す
+    解析の各パスは録音を前から順に読むので、読んだ位置の少し手前（KEEP_SAMPLES）までだけを手元に残す。
+    それより前を読むとき（次のパスの始め）は ffmpeg を起動し直して頭から読む
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.sr, self.channels = audio_decode.probe(path)
+        self.n_samples = audio_decode.count_samples(path)
+        self.pipe = None
+        self.buf = np.zeros(0, dtype=np.float32)
+        self.buf_start = 0  # buf[0] の位置（サンプル）
+
+    def close(self):
+        if self.pipe is not None:
+            self.pipe.close()
+            self.pipe = None
+
+    def _restart(self):
+        self.close()
+        self.pipe = audio_decode.PcmPipe(self.path, self.channels)
+        self.buf = np.zeros(0, dtype=np.float32)
+        self.buf_start = 0
+
+    def read(self, start, stop):
+        start, stop = max(0, start), min(self.n_samples, stop)
+        if stop <= start:
+            return np.zeros(0, dtype=np.float32)
+        if self.pipe is None or start < self.buf_start:
+            self._restart()
+        pos = self.buf_start + len(self.buf)  # ffmpeg から読んだサンプル数
+        keep = max(self.buf_start, start - KEEP_SAMPLES)
+        parts = [self.buf[keep - self.buf_start:]]
+        while pos < stop:
+            chunk = self.pipe.read()
+            if chunk is None:
+                break
+            # 手元に残す範囲より前は捨てる
+            if pos + len(chunk) > keep:
+                parts.append(chunk[max(0, keep - pos):])
+            pos += len(chunk)
+        self.buf = np.concatenate(parts) if len(parts) > 1 else parts[0]
+        self.buf_start = pos - len(self.buf)
+        return self.buf[start - self.buf_start:stop - self.buf_start]
+
+
+def open_source(audio_path):
+    """soundfile で読める形式はファイルから、webm などは ffmpeg のパイプから少しずつ読む"""
+    if audio_decode.soundfile_readable(audio_path):
+        return AudioSource(audio_path)
+    return PipeSource(audio_path)
+
+
+def frame_span(f0, f1, hop=hop_length, frame_length=n_fft):
+    """フレーム [f0, f1) が使う埋め済み信号の範囲"""
+    return f0 * hop, (f1 - 1) * hop + frame_length
+
+
+def _widen(g0, g1, n_frames, min_columns=MIN_COLUMNS):
+    """[g0, g1) を録音の範囲内で min_columns フレーム以上に広げる"""
+    short = min_columns - (g1 - g0)
+    if short > 0:
+        g1 = min(n_frames, g1 + short)
+        g0 = max(0, g1 - min_columns)
+    return g0, g1
+
+
+def _blocks(n, size):
+    for b0 in range(0, n, size):
+        yield b0, min(n, b0 + size)
+
+
+# === 1〜2 回目の流し読み: 録音全体で決まる値 ===
+def _sort_keys(vals):
+    """float32 を大小順が保たれる uint32 に変換し、上位 16 bit をヒストグラムのビンにする"""
+    bits = np.ascontiguousarray(vals, dtype=np.float32).view(np.uint32)
+    keys = np.where(bits & np.uint32(0x80000000), ~bits, bits | np.uint32(0x80000000))
+    return keys >> np.uint32(16)
+
+
+def _piptrack(power, sr):
+    # librosa.estimate_tuning(S=power, sr=sr) と同じ引数
+    return librosa.piptrack(S=power, sr=sr, n_fft=n_fft)
+
+
+def _tuning_residuals(freqs, bins_per_octave=12):
+    # librosa.pitch_tuning と同じ計算
+    residual = np.mod(bins_per_octave * librosa.hz_to_octs(freqs), 1.0)
+    residual[residual >= 0.5] -= 1.0
+    return residual
+
+
+def scan_globals(source, block_frames=BLOCK_FRAMES, peaks=True):
+    """
+    録音全体で決まる値を求める
+    peaks: False ならメル dB・RMS の最大値は求めない（live_analyzer は受け取りながら求めている）
+    戻り値: {"mel_db_max", "yin_rms_max", "tuning"}（peaks が False なら最大値は None）
+    """
+    sr = source.sr
+    T = source.n_frames()
+    mel_db_max = -np.inf
+    rms_max = None
+    hist = np.zeros(N_KEYS, dtype=np.int64)
+
+    def spectra_blocks():
+        # フレーム [f0, f1) の信号・パワースペクトログラム・メルパワー
+        for f0, f1 in _blocks(T, block_frames):
+            g0, g1 = _widen(f0, f1, T)
+            y = source.padded(*frame_span(g0, g1), n_fft // 2)
+            power = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length, center=False)) ** 2
+            mel = feature_engine.mel_power(power, sr) if peaks else power[:0]
+            yield (y[(f0 - g0) * hop_length:(f1 - g0 - 1) * hop_length + n_fft],
+                   power[:, f0 - g0:f1 - g0], mel[:, f0 - g0:f1 - g0])
+
+    # 1 回目: メル dB と RMS の最大値、ピークの強さのヒストグラム
+    for y, power, mel in spectra_blocks():
+        if peaks:
+            mel_db_max = max(mel_db_max, librosa.power_to_db(mel, top_db=None).max())
+            rms = pitch_engine.frame_rms(pitch_engine.yin_frames(y, center=False)).max()
+            rms_max = rms if rms_max is None else max(rms_max, rms)
+        pitch, mag = _piptrack(power, sr)
+        hist += np.bincount(_sort_keys(mag[pitch > 0]), minlength=N_KEYS)
+
+    # librosa.estimate_tuning: 有声のピークの強さの中央値以上のピークから調律のずれを決める
+    n = int(hist.sum())
+    tuning = 0.0
+    if n:
+        lo_rank, hi_rank = (n - 1) // 2, n // 2
+        cum = np.cumsum(hist)
+        lo_key, hi_key = np.searchsorted(cum, [lo_rank, hi_rank], side="right")
+        before = int(cum[lo_key] - hist[lo_key])
+
+        # 2 回目: 中央値を含むビンの値をすべて集め、それより上のビンのピークは残差のヒストグラムにする
+        bins = np.linspace(-0.5, 0.5, int(np.ceil(1.0 / 0.01)) + 1)
+        counts = np.zeros(len(bins) - 1, dtype=np.int64)
+        near_mag, near_pitch = [], []
+        for _, power, _ in spectra_blocks():
+            pitch, mag = _piptrack(power, sr)
+            voiced = pitch > 0
+            m, p = mag[voiced], pitch[voiced]
+            keys = _sort_keys(m)
+            near = (keys == lo_key) | (keys == hi_key)
+            near_mag.append(m[near])
+            near_pitch.append(p[near])
+            above = keys > hi_key
+            counts += np.histogram(_tuning_residuals(p[above]), bins)[0]
+        near_mag = np.concatenate(near_mag)
+        near_pitch = np.concatenate(near_pitch)
+        ranked = np.sort(near_mag)
+        threshold = np.median(ranked[[lo_rank - before, hi_rank - before]])
+        freqs = near_pitch[near_mag >= threshold]
+        counts += np.histogram(_tuning_residuals(freqs), bins)[0]
+        if counts.sum():
+            tuning = bins[np.argmax(counts)]
+
+    return {"mel_db_max": mel_db_max if peaks else None, "yin_rms_max": rms_max, "tuning": tuning}
+
+
+# === 3 回目: 特徴量・窓統計量・pitch / volume ===
+def block_features(source, f0, f1, n_frames, globals_, context=CONTEXT_FRAMES):
+    """フレーム [f0, f1) の 52 次元特徴量（前後 context フレームを余分に計算して端の影響を除く）"""
+    g0, g1 = _widen(max(0, f0 - context), min(n_frames, f1 + context), n_frames)
+    start, stop = frame_span(g0, g1)
+    y = source.padded(start, stop, n_fft // 2)
+    y_edge = source.padded(start, stop, n_fft // 2, mode="edge")
+    spectra = feature_engine.compute_spectra(y, source.sr, center=False, mel_db_max=globals_["mel_db_max"])
+    zcr = librosa.feature.zero_crossing_rate(y_edge, frame_length=n_fft, hop_length=hop_length, center=False)
+    rms = librosa.feature.rms(y=y, frame_length=n_fft, hop_length=hop_length, center=False)
+    feats = feature_engine.features_from_parts(spectra, zcr, rms, source.sr, tuning=globals_["tuning"])
+    return feats[f0 - g0:f1 - g0]
+
+
+def upsample_block(series, times_frames, f0, f1):
+    # analyze_audio.upsample_series_to_frames のフレーム [f0, f1) の部分
+    if len(times_frames) == 0:
+        return np.zeros(f1 - f0)
+    if len(times_frames) == 1:
+        return np.full(f1 - f0, series[0])
+    return np.interp(np.arange(f0, f1, dtype=float), times_frames, series, left=series[0], right=series[-1])
+
+
+def _harmony_f0(source, writer, n_out, block_frames):
+    """協和度用 f0（harmony_analize.harmony_f0_entry と同じ値）を 44.1 kHz にリサンプルしながら書き込む"""
+    h_sr = harmony_analize.sr
+    h_frame, h_hop = harmony_analize.frame_length, harmony_analize.hop_length
+    pad = h_frame // 2
+    # librosa.resample は soxr の出力を ceil(n * 比) サンプルに切り詰め / 0 埋めする
+    n_res = int(np.ceil(source.n_samples * float(h_sr) / source.sr))
+    stream = soxr.ResampleStream(source.sr, h_sr, 1, dtype="float32", quality="HQ") if source.sr != h_sr else None
+
+    buf = np.zeros(0, dtype=np.float32)  # リサンプル後の信号の [buf_start, buf_start + len(buf))
+    buf_start = 0
+    read_pos = 0
+    done = False
+    for f0, f1 in _blocks(n_out, block_frames):
+        start, stop = frame_span(f0, f1, h_hop, h_frame)
+        need = min(stop - pad, n_res)
+        while not done and buf_start + len(buf) < need:
+            chunk = source.read(read_pos, read_pos + READ_SAMPLES)
+            read_pos += len(chunk)
+            last = read_pos >= source.n_samples
+            out = chunk if stream is None else stream.resample_chunk(chunk, last=last)
+            buf = np.concatenate([buf, out])
+            done = last
+        # 埋め済みの信号の [start, stop) を切り出す
+        lo, hi = max(0, start - pad), min(n_res, stop - pad)
+        seg = buf[lo - buf_start:hi - buf_start]
+        seg = np.pad(seg, (lo - (start - pad), (hi - lo) - len(seg) + (stop - pad) - hi))
+        writer.write(HARMONY_F0_KEY, f0, harmony_analize.harmony_yin(seg, center=False))
+        # 次のブロックで使わない部分を捨てる
+        keep = max(0, f1 * h_hop - pad - buf_start)
+        buf = buf[keep:]
+        buf_start += keep
+
+
+def analyze_stream(audio_path, out_path, predict, model_names, window_frames, step_frames,
+                   instrument=None, block_frames=BLOCK_FRAMES, chunk_frames=window_stats.CHUNK_FRAMES,
+                   analysis=None):
+    """
+    audio_path を block_frames ずつ解析し、結果を out_path（.cols）に書き込む
+    audio_path の代わりに開いた AudioSource を渡してもよい（閉じるのは呼び出し側）
+    predict: 標準化済みの窓統計量 (n, 208) -> {モデル名: (n,)}（analyze_audio.predict_windows）
+    model_names: predict が返すモデル名（列の順）
+    window_frames / step_frames: analyze_audio.analyze と同じ窓
+    analysis: .cols の meta に記録する解析の設定（presets.describe の戻り値）
+    """
+    if isinstance(audio_path, AudioSource):
+        return _analyze_stream(audio_path, out_path, predict, model_names, window_frames, step_frames,
+                               instrument, block_frames, chunk_frames, analysis)
+    source = open_source(audio_path)
+    try:
+        return _analyze_stream(source, out_path, predict, model_names, window_frames, step_frames,
+                               instrument, block_frames, chunk_frames, analysis)
+    finally:
+        source.close()
+
+
+def window_predictions(source, globals_, predict, model_names, window_frames, step_frames,
+                       block_frames=BLOCK_FRAMES, chunk_frames=window_stats.CHUNK_FRAMES, on_block=None):
+    """
+    録音全体の窓統計量を block_frames ずつ計算し、全窓で fit した StandardScaler で標準化して推論する
+    globals_: scan_globals の戻り値（mel_db_max・tuning を使う）
+    on_block: 特徴量を計算したブロックごとに on_block(f0, f1) を呼ぶ（同じ順に読む処理をまとめる）
+    戻り値: ({モデル名: 窓ごとの予測}, 窓の中心のフレーム)
+    """
+    T = source.n_frames()
+    starts, ends = window_stats.sliding_window_bounds(T, window_frames, step_frames, include_last="short")
+    times_frames = starts + (ends - starts) / 2.0
+    groups = window_stats.window_groups(starts, ends, chunk_frames)
+    with tempfile.TemporaryDirectory() as tmp:
+        D = None
+        stats = None
+        buf, buf_start = None, 0  # 特徴量のうち、まだ使う部分 features[buf_start:buf_start + len(buf)]
+        g = 0
+        for f0, f1 in _blocks(T, block_frames):
+            feats = block_features(source, f0, f1, T, globals_)
+            if stats is None:
+                D = feats.shape[1]
+                stats = np.lib.format.open_memmap(os.path.join(tmp, "stats.npy"), mode="w+",
+                                                  dtype=np.float64, shape=(len(starts), 4 * D))
+                buf = np.empty((0, D))
+            buf = np.concatenate([buf, feats])
+
+            # 特徴量が揃ったまとまりから窓統計量を計算する
+            while g < len(groups) and groups[g][2] <= f1:
+                idx, r0, r1 = groups[g]
+                means, vars_, skews, kurts = window_stats.group_moments(
+                    buf[r0 - buf_start:r1 - buf_start], starts[idx] - r0, ends[idx] - r0)
+                stats[idx] = np.concatenate([means, vars_, skews, kurts], axis=1)
+                g += 1
+                next_start = groups[g][1] if g < len(groups) else f1
+                buf = buf[next_start - buf_start:]
+                buf_start = next_start
+            if on_block is not None:
+                on_block(f0, f1)
+        buf = None
+
+        # 標準化（全窓で fit）と推論
+        from sklearn.preprocessing import StandardScaler  # import が重いので使うときに読み込む
+        scaler = StandardScaler().fit(stats)
+        preds = {name: np.empty(len(starts)) for name in model_names}
+        for r0, r1 in _blocks(len(starts), PREDICT_ROWS):
+            for name, v in predict(scaler.transform(stats[r0:r1])).items():
+                preds[name][r0:r1] = v
+        del stats
+    return preds, times_frames
+
+
+def _analyze_stream(source, out_path, predict, model_names, window_frames, step_frames,
+                    instrument, block_frames, chunk_frames, analysis):
+    sr = source.sr
+    T = source.n_frames()
+    globals_ = scan_globals(source, block_frames)
+
+    n_harmony = 1 + int(np.ceil(source.n_samples * float(harmony_analize.sr) / sr)) // harmony_analize.hop_length
+    fmin, fmax = pitch_engine.pitch_range(instrument)
+
+    writer = analysis_writer(out_path, ["pitch", "volume", *model_names], T,
+                             harmony_analize.HARMONY_F0_PARAMS, n_harmony, analysis)
+    try:
+        def write_frames(f0, f1):
+            # pitch / volume（各フレームは前後 n_fft/2 サンプルしか使わない）
+            y = source.padded(*frame_span(f0, f1), n_fft // 2)
+            pitch = pitch_engine.yin_pitch(y, sr, fmin, fmax, hop_length, center=False,
+                                           ref_rms=globals_["yin_rms_max"])
+            writer.write("pitch", f0, pitch)
+            writer.write("volume", f0, librosa.feature.rms(y=y, hop_length=hop_length, center=False).flatten())
+
+        preds, times_frames = window_predictions(source, globals_, predict, model_names, window_frames,
+                                                 step_frames, block_frames, chunk_frames, write_frames)
+        for f0, f1 in _blocks(T, block_frames):
+            for name in model_names:
+                writer.write(name, f0, upsample_block(preds[name], times_frames, f0, f1))
+
+        _harmony_f0(source, writer, n_harmony, block_frames)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    return out_path
@@ -0,0 +1,80 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# 解析スクリプトは analyzer フォルダを基準に互いを import するので、そこをパスに入れる
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analyze_audio  # noqa: E402
+import feature_subset  # noqa: E402
+import result_cache  # noqa: E402
+
+SR = 22050
+NAMES = ["brightness", "clarity", "thickness"]
+
+
+def synth(duration, sr=SR, seed=0):
+    """0.4 秒ごとに音が変わる倍音付きの旋律（ときどき休符）と弱い雑音"""
+    rng = np.random.default_rng(seed)
+    n_notes = int(np.ceil(duration / 0.4))
+    midi = rng.integers(50, 88, n_notes).astype(float)
+    f = np.repeat(np.where(rng.random(n_notes) < 0.2, 0.0, 440.0 * 2 ** ((midi - 69) / 12)), int(0.4 * sr))
+    f = f[:int(duration * sr)]
+    phase = 2 * np.pi * np.cumsum(f) / sr
+    y = sum(np.sin(h * phase) / h for h in (1, 2, 3))
+    y = np.where(f > 0, 0.3 * y, 0.0) + 0.003 * rng.standard_normal(len(f))
+    return y.astype(np.float32)
+
+
+class LinearPredictor:
+    """
+    学習済みモデルの代わり（窓統計量の線形結合。木と違い入力の丸め誤差で値が跳ばない）
+    受け取った標準化済みの窓統計量を inputs に残す
+    """
+
+    def __init__(self, names, seed=0):
+        self.names = names
+        self.columns = feature_subset.ALL_COLUMNS
+        self.weights = np.random.default_rng(seed).standard_normal((len(self.columns), len(names))) / 50
+        self.inputs = []
+
+    def predict_dict(self, X):
+        self.inputs.append(np.array(X))
+        preds = X @ self.weights
+        return {name: preds[:, i] for i, name in enumerate(self.names)}
+
+
+@pytest.fixture(scope="session")
+def synth_wav():
+    """synth の信号を path に書いて path（str）を返す関数"""
+    import soundfile as sf
+
+    def write(path, duration, seed=0):
+        sf.write(path, synth(duration, seed=seed), SR, subtype="FLOAT")
+        return str(path)
+    return write
+
+
+@pytest.fixture
+def predictor(monkeypatch):
+    """analyze_audio のモデルを LinearPredictor に差し替える（版は "test"。解析結果のキャッシュは使わない）"""
+    predictor = LinearPredictor(NAMES)
+    monkeypatch.setattr(analyze_audio, "_loaded", {
+        "predictor": predictor, "models": {}, "names": NAMES, "columns": predictor.columns,
+        "positions": None, "version": "test"})
+    monkeypatch.setattr(analyze_audio, "model_version", lambda: "test")
+    monkeypatch.setattr(result_cache, "MAX_BYTES", 0)
+    return predictor
+
+
+@pytest.fixture
+def fake_tool(tmp_path):
+    """body を実行する Python スクリプト（ffmpeg・ffprobe の代わり）を tmp_path に作ってパスを返す関数"""
+    def write(name, body):
+        path = tmp_path / name
+        path.write_text(f"#!{sys.executable}\nimport sys\n{body}\n")
+        path.chmod(0o755)
+        return str(path)
+    return write
@@ -0,0 +1,65 @@
+import threading
+
+import numpy as np
+import pytest
+
+import audio_decode
+
+# audio_decode.decode を ffmpeg・ffprobe の代わりのスクリプトで確かめる
+# （標準エラーを大量に書く ffmpeg で止まらないこと、失敗したときに標準エラーの末尾が例外に入ること）
+
+SR = 16000
+CHANNELS = 2
+PCM = (np.arange(SR * CHANNELS, dtype=np.int64) % 2000 - 1000).astype("<i2")
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path, monkeypatch, fake_tool):
+    """stderr_bytes バイトの標準エラーを書いてから PCM を出す ffmpeg を用意する"""
+    pcm_path = tmp_path / "pcm.raw"
+    pcm_path.write_bytes(PCM.tobytes())
+    probe = fake_tool("ffprobe", 'sys.stdout.write(\'{"streams": [{"sample_rate": "%d", "channels": %d}]}\')'
+                   % (SR, CHANNELS))
+    monkeypatch.setattr(audio_decode, "FFPROBE", probe)
+
+    def make(stderr_bytes, code=0):
+        ffmpeg = fake_tool("ffmpeg", f"""
+sys.stderr.write("x" * {stderr_bytes} + "last error line\\n")
+sys.stderr.flush()
+sys.stdout.buffer.write(open({str(pcm_path)!r}, "rb").read())
+sys.exit({code})""")
+        monkeypatch.setattr(audio_decode, "FFMPEG", ffmpeg)
+    return make
+
+
+def decode_with_timeout(path, timeout=30):
+    out = {}
+
+    def run():
+        try:
+            out["result"] = audio_decode.decode(path)
+        except Exception as e:
+            out["error"] = e
+    t = threading.Thread(target=run, daemon=True)
+    t.start()
+    t.join(timeout)
+    assert not t.is_alive(), "decode が終わらない（パイプの読み方で止まっている）"
+    return out
+
+
+def test_decode_with_large_stderr(fake_ffmpeg, tmp_path):
+    fake_ffmpeg(stderr_bytes=1 << 20)  # パイプの容量（64 KiB 程度）を超える
+    out = decode_with_timeout(str(tmp_path / "take.webm"))
+    y, sr = out["result"]
+    assert sr == SR
+    ref = (PCM.reshape(-1, CHANNELS).astype(np.float32) / 32768).mean(axis=1)
+    np.testing.assert_allclose(y, ref, rtol=1e-6, atol=1e-7)
+
+
+def test_decode_failure_reports_stderr_tail(fake_ffmpeg, tmp_path):
+    fake_ffmpeg(stderr_bytes=1 << 20, code=1)
+    out = decode_with_timeout(str(tmp_path / "take.webm"))
+    err = out["error"]
+    assert isinstance(err, RuntimeError)
+    assert "last error line" in str(err)
+    assert len(str(err)) < audio_decode.STDERR_TAIL + 500
@@ -0,0 +1,87 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import analyze_audio
+from artifact import HARMONY_F0_KEY, Artifact, load_analysis
+from conftest import NAMES, SR, synth
+from live_analyzer import LiveAnalyzer
+
+# 逐次解析（live_analyzer.py）の確認
+# 半端な大きさ（1 サンプル・hop 512 の倍数でない・窓の長さちょうど）に分けて push し、
+# フレーム・窓が取りこぼし・重複なく順に返ること、finish の .cols が analyze() の結果と一致することを確かめる
+
+DURATION = 7.3
+# 予測は録音全体で fit した標準化の後なので stream_analyzer と同じ誤差の範囲（test_stream_analyzer.TOL）
+TOL = {"rtol": 1e-5, "atol": 1e-6}
+
+
+def read_result(path):
+    art = Artifact(analyze_audio.artifact_path(path))
+    return load_analysis(art.path), np.asarray(art.column(HARMONY_F0_KEY), dtype=float)
+
+
+@pytest.fixture
+def offline(tmp_path, synth_wav, predictor):
+    wav = synth_wav(tmp_path / "take.wav", DURATION)
+    analyze_audio.analyze(wav, "yin", stream=False)
+    return read_result(wav)
+
+
+def chunk_sizes(window_samples):
+    return itertools.cycle([1, 700, 513, window_samples, 1, 4097, 511, 2 * window_samples + 3])
+
+
+def test_live_matches_offline(tmp_path, offline, predictor):
+    ref_series, ref_harmony_f0 = offline
+    y = synth(DURATION)
+    window_frames, step_frames = analyze_audio.window_params(SR)
+    live = LiveAnalyzer(SR, analyze_audio.predict_windows, analyze_audio.model_names(),
+                        window_frames, step_frames)
+
+    n_frames, n_windows = 0, 0
+    volume = []
+    pushes_with_frames = pushes_with_windows = 0
+    pos = 0
+    for size in chunk_sizes(window_frames * analyze_audio.hop_length):
+        if pos >= len(y):
+            break
+        out = live.push(y[pos:pos + size])
+        pos += size
+        if out["frames"] is not None:
+            # フレームは前回の続きから（取りこぼし・重複なし）
+            assert out["frames"]["start"] == n_frames
+            assert len(out["frames"]["pitch"]) == len(out["frames"]["volume"]) > 0
+            n_frames += len(out["frames"]["volume"])
+            volume.extend(out["frames"]["volume"])
+            pushes_with_frames += 1
+        if out["windows"] is not None:
+            assert out["windows"]["start"] == n_windows
+            assert set(NAMES) <= set(out["windows"])
+            n_windows += len(out["windows"]["time"])
+            pushes_with_windows += 1
+        # 届いた音声のフレームは次の push を待たずに返る（右端の n_fft/2 サンプルが届いていないものだけ残る）
+        assert n_frames == live._ready_frames(final=False)
+
+    T = len(ref_series["pitch"])
+    assert pushes_with_frames > 10 and pushes_with_windows > 1
+    assert 0 < n_windows and T - 4 <= n_frames < T
+    # 録音中に返した音量は analyze() と同じ
+    np.testing.assert_allclose(volume, np.asarray(ref_series["volume"], dtype=float)[:n_frames], **TOL)
+
+    live.finish(str(tmp_path / "live.webm"))
+    series, harmony_f0 = read_result(str(tmp_path / "live.webm"))
+    assert list(series) == list(ref_series)
+
+    # pitch（録音全体の最大 RMS で無音を判定し直す）・音量・協和度用の f0 は analyze() と同じ
+    for name in ("pitch", "volume"):
+        np.testing.assert_array_equal(np.asarray(series[name], dtype=float),
+                                      np.asarray(ref_series[name], dtype=float), err_msg=name)
+    np.testing.assert_array_equal(harmony_f0, ref_harmony_f0)
+    assert np.isfinite(np.asarray(series["pitch"], dtype=float)).any()
+
+    # 予測（録音全体のメル dB の下限・調律のずれ・標準化で計算し直したもの）
+    for name in NAMES:
+        np.testing.assert_allclose(np.asarray(series[name], dtype=float),
+                                   np.asarray(ref_series[name], dtype=float), err_msg=name, **TOL)
@@ -0,0 +1,35 @@
+import pickle
+
+import numpy as np
+import pytest
+
+import read_pickle
+from artifact import save_analysis
+
+# /items/:id/lod の series の確認（存在しない系列は ValueError。feedbacks.ts が 400 にする）
+
+N_FRAMES = 3000
+
+
+@pytest.fixture(params=[".cols", ".pkl"])
+def analysis_file(request, tmp_path):
+    rng = np.random.default_rng(0)
+    series = {"pitch": rng.uniform(100, 400, N_FRAMES), "volume": rng.uniform(0, 1, N_FRAMES)}
+    path = tmp_path / f"take{request.param}"
+    if request.param == ".cols":
+        save_analysis(str(path), series)
+    else:
+        with open(path, "wb") as f:
+            pickle.dump(series, f)
+    return str(path)
+
+
+def test_known_series(analysis_file):
+    out = read_pickle.read_lod(analysis_file, width=200, names=["volume"])
+    assert list(out["series"]) == ["volume"]
+    assert list(read_pickle.read_lod(analysis_file, width=200)["series"]) == ["pitch", "volume"]
+
+
+def test_unknown_series(analysis_file):
+    with pytest.raises(ValueError, match="^unknown series: nope$"):
+        read_pickle.read_lod(analysis_file, width=200, names=["pitch", "nope"])
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+import analyze_audio
+import result_cache
+
+# 解析結果のキャッシュ（result_cache.py）: ヒットしたときとミスしたときで同じ値が返るか、モデルの更新で読み込み直すか
+
+
+@pytest.fixture
+def models(monkeypatch, tmp_path, predictor):
+    """学習済みモデルの代わり（conftest.py）と、tmp_path のキャッシュ（版は state["version"]）"""
+    state = {"version": "test"}
+    monkeypatch.setattr(analyze_audio, "model_version", lambda: state["version"])
+    monkeypatch.setattr(result_cache, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(result_cache, "MAX_BYTES", 2 ** 30)
+    return state
+
+
+def test_hit_matches_miss(models, tmp_path, synth_wav):
+    path = synth_wav(tmp_path / "take.wav", 3.0)
+    before = result_cache.stats()
+    miss = analyze_audio.analyze(str(path), "yin", stream=False)
+    hit = analyze_audio.analyze(str(path), "yin", stream=False)
+    after = result_cache.stats()
+    assert (after["misses"] - before["misses"], after["hits"] - before["hits"]) == (1, 1)
+
+    assert list(hit) == list(miss)
+    for name in miss:
+        values = np.asarray(miss[name])
+        np.testing.assert_array_equal(np.asarray(hit[name]), values, err_msg=name)  # float32 に丸めた同じ値
+        np.testing.assert_array_equal(values.astype(np.float32).astype(float), values)
+
+
+def test_refresh_models(models):
+    analyze_audio.refresh_models()
+    assert analyze_audio._loaded is not None  # 版が同じなら読み込み直さない
+
+    models["version"] = "updated"  # モデルファイルが置き換わった
+    analyze_audio.refresh_models()
+    assert analyze_audio._loaded is None
@@ -0,0 +1,145 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+import analyze_audio
+import audio_decode
+import stream_analyzer
+from artifact import HARMONY_F0_KEY, Artifact, load_analysis
+from conftest import SR, synth
+
+# ブロックごとの解析（stream_analyzer.py）が、録音全体を読み込む analyze() と同じ結果になるか
+# ブロックの境界が窓・フレームの途中に来るよう、半端な大きさのブロックでも確かめる
+
+DURATION = 7.3
+TOL = {"rtol": 1e-5, "atol": 1e-6}
+
+
+@pytest.fixture(scope="module")
+def wav(tmp_path_factory, synth_wav):
+    return synth_wav(tmp_path_factory.mktemp("stream") / "take.wav", DURATION)
+
+
+def read_result(path):
+    art = Artifact(analyze_audio.artifact_path(path))
+    return load_analysis(art.path), np.asarray(art.column(HARMONY_F0_KEY), dtype=float)
+
+
+@pytest.fixture
+def in_memory(wav, predictor):
+    analyze_audio.analyze(wav, "yin", stream=False)
+    series, harmony_f0 = read_result(wav)
+    return series, harmony_f0, np.concatenate(predictor.inputs)
+
+
+@pytest.mark.parametrize("block_frames", [37, 256])
+def test_stream_matches_in_memory(wav, predictor, in_memory, block_frames):
+    ref_series, ref_harmony_f0, ref_X = in_memory
+    n_frames = len(ref_series["pitch"])
+    assert n_frames > block_frames  # 境界を少なくとも 1 つ通る
+
+    predictor.inputs.clear()
+    analyze_audio.analyze_stream(wav, block_frames=block_frames)
+    series, harmony_f0 = read_result(wav)
+
+    # 窓統計量（標準化済み。推論に渡されたもの）
+    X = np.concatenate(predictor.inputs)
+    assert X.shape == ref_X.shape
+    np.testing.assert_allclose(X, ref_X, **TOL)
+
+    # f0（yin）・音量・予測・協和度用の f0
+    assert list(series) == list(ref_series)
+    for name in ref_series:
+        np.testing.assert_allclose(np.asarray(series[name], dtype=float),
+                                   np.asarray(ref_series[name], dtype=float), err_msg=name, **TOL)
+    np.testing.assert_allclose(harmony_f0, ref_harmony_f0, **TOL)
+    assert np.isfinite(np.asarray(series["pitch"], dtype=float)).any()
+
+
+# === webm（soundfile で読めない形式）を ffmpeg のパイプから少しずつ読む（stream_analyzer.PipeSource） ===
+# ffmpeg・ffprobe の代わりに、PCM のファイルを少しずつ標準出力に書くスクリプトを使う
+
+PIPE_SR = 8000
+PIPE_CHANNELS = 2
+LONG_SECONDS = 20 * 60
+
+
+@pytest.fixture
+def fake_webm(tmp_path, monkeypatch, fake_tool):
+    """PCM（int16・インターリーブ）を書いた .webm を作る関数。duration=False なら ffprobe は長さを返さない"""
+    def make(pcm, sr=PIPE_SR, channels=PIPE_CHANNELS, duration=True):
+        raw = tmp_path / "pcm.raw"
+        np.asarray(pcm, dtype="<i2").tofile(raw)
+        fmt = f', "format": {{"duration": "{len(pcm) / channels / sr:.6f}"}}' if duration else ""
+        monkeypatch.setattr(audio_decode, "FFPROBE", fake_tool("ffprobe", "sys.stdout.write(%r)" % (
+            f'{{"streams": [{{"sample_rate": "{sr}", "channels": {channels}}}]{fmt}}}')))
+        monkeypatch.setattr(audio_decode, "FFMPEG", fake_tool("ffmpeg", f"""
+with open({str(raw)!r}, "rb") as f:
+    while chunk := f.read(65536):
+        sys.stdout.buffer.write(chunk)"""))
+        path = tmp_path / "take.webm"
+        path.write_bytes(b"")
+        return str(path), raw
+    return make
+
+
+def long_pcm(seconds=LONG_SECONDS):
+    n = seconds * PIPE_SR * PIPE_CHANNELS
+    return ((np.arange(n, dtype=np.int64) * 7919) % 65536 - 32768).astype("<i2")
+
+
+def test_pipe_source_reads_long_webm_in_blocks(fake_webm, monkeypatch):
+    path, raw = fake_webm(long_pcm())
+    monkeypatch.setattr(audio_decode, "decode", None)  # 録音全体を読み込む経路は通らない
+    ref_pcm = np.memmap(raw, dtype="<i2", mode="r")
+    n = len(ref_pcm) // PIPE_CHANNELS
+    full_bytes = n * 4  # 録音全体を float32 で持ったときの大きさ
+
+    tracemalloc.start()
+    try:
+        assert analyze_audio.use_stream(path, "yin")
+        source = stream_analyzer.open_source(path)
+        assert isinstance(source, stream_analyzer.PipeSource)
+        assert source.n_samples == n and source.sr == PIPE_SR
+        # 解析と同じく、少し手前から重ねて前へ読み進める
+        block = 1 << 18
+        for start in range(0, n, block):
+            a, b = start - 3000, start + block
+            y = source.read(a, b)
+            ref = audio_decode.to_float(ref_pcm[max(0, a) * 2:min(n, b) * 2], PIPE_CHANNELS)
+            np.testing.assert_array_equal(y, ref)
+        # 前に戻ると頭から読み直す
+        np.testing.assert_array_equal(source.read(10, 500), audio_decode.to_float(ref_pcm[20:1000], PIPE_CHANNELS))
+        source.close()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < full_bytes / 4, f"peak {peak} bytes (録音全体 {full_bytes} bytes)"
+
+
+def test_webm_length_without_duration(fake_webm, monkeypatch):
+    """ヘッダに長さの無い webm（MediaRecorder）は、デコードせずに ffmpeg の出力を数えて長さを決める"""
+    path, _ = fake_webm(long_pcm(), duration=False)
+    monkeypatch.setattr(audio_decode, "decode", None)
+    assert audio_decode.duration(path) == LONG_SECONDS
+    assert analyze_audio.use_stream(path, "yin")
+    path, _ = fake_webm(long_pcm(30), duration=False)
+    assert not analyze_audio.use_stream(path, "yin")
+
+
+def test_pipe_source_matches_decoded(fake_webm, predictor):
+    """パイプから読んだブロック解析が、デコード済みの信号のブロック解析と同じ .cols になる"""
+    pcm = np.round(np.clip(synth(DURATION), -1, 1) * 32767).astype("<i2")
+    path, _ = fake_webm(pcm, sr=SR, channels=1)
+
+    analyze_audio.analyze_stream(path, block_frames=37,
+                                 source=stream_analyzer.ArraySource(*audio_decode.decode(path)))
+    ref_series, ref_harmony_f0 = read_result(path)
+    analyze_audio.analyze_stream(path, block_frames=37)
+    series, harmony_f0 = read_result(path)
+    assert list(series) == list(ref_series)
+    for name in ref_series:
+        np.testing.assert_array_equal(np.asarray(series[name], dtype=float),
+                                      np.asarray(ref_series[name], dtype=float), err_msg=name)
+    np.testing.assert_array_equal(harmony_f0, ref_harmony_f0)
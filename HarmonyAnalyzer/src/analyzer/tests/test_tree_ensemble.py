@@ -0,0 +1,173 @@
+import io
+import struct
+import zipfile
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+import tree_ensemble
+from tree_ensemble import CompiledForest, check_parity, input_columns, load_npz_mmap
+
+# CompiledForest.predict が RandomForestRegressor.predict と同じ値を返すか（小さな森で確認する）
+
+N_FEATURES = 8
+# プルーニングしたモデルの列（窓統計量の列番号。feature_subset.py）
+PRUNED = {"a": [3, 10, 60, 100], "b": [10, 20, 150]}
+
+
+def fit(X, y, seed, columns=None):
+    model = RandomForestRegressor(n_estimators=7, max_depth=6, random_state=seed).fit(X, y)
+    if columns is not None:
+        model.feature_columns_ = np.asarray(columns)
+    return model
+
+
+def training_data(n_features, seed, nan=False):
+    rng = np.random.default_rng(seed)
+    X = rng.standard_normal((300, n_features))
+    y = X[:, 0] * 2 - X[:, -1] + rng.standard_normal(300) * 0.1
+    if nan:  # 学習に NaN があると、木は NaN をどちらに進めるか（missing_go_to_left）を覚える
+        X[rng.random(X.shape) < 0.1] = np.nan
+    return X, y
+
+
+@pytest.fixture(scope="module")
+def models():
+    out = {}
+    for i, name in enumerate(("brightness", "clarity", "thickness")):
+        X, y = training_data(N_FEATURES, i, nan=(i == 1))
+        out[name] = fit(X, y, i)
+    return out
+
+
+@pytest.fixture(scope="module")
+def pruned_models():
+    out = {}
+    for i, (name, columns) in enumerate(PRUNED.items()):
+        X, y = training_data(len(columns), i, nan=True)
+        out[name] = fit(X, y, i, columns)
+    return out
+
+
+def inputs(n_features, seed=1, n=200):
+    return np.random.default_rng(seed).standard_normal((n, n_features)) * 2.0
+
+
+def tree_mean(model, X):
+    """predict の入力検査（inf を受け付けない）を通さずに、木ごとの予測の平均を取る"""
+    X = np.asarray(X, dtype=np.float32)
+    return np.mean([est.tree_.predict(X)[:, 0] for est in model.estimators_], axis=0)
+
+
+def test_predict_matches_sklearn(models):
+    forest = CompiledForest.from_sklearn(models)
+    X = inputs(N_FEATURES)
+    preds = forest.predict(X)
+    assert preds.shape == (len(X), len(models))
+    for i, model in enumerate(models.values()):
+        np.testing.assert_allclose(preds[:, i], model.predict(X), rtol=1e-9, atol=1e-9)
+    assert forest.predict_dict(X).keys() == models.keys()
+
+
+def test_nan_inputs(models):
+    forest = CompiledForest.from_sklearn(models)
+    X = inputs(N_FEATURES, seed=2)
+    X[::3, 0] = np.nan
+    X[1::4, -1] = np.nan
+    preds = forest.predict(X)
+    for i, model in enumerate(models.values()):
+        np.testing.assert_allclose(preds[:, i], model.predict(X), rtol=1e-9, atol=1e-9)
+
+
+def test_inf_inputs(models):
+    forest = CompiledForest.from_sklearn(models)
+    X = inputs(N_FEATURES, seed=3)
+    X[::3, 0] = np.inf
+    X[1::3, 0] = -np.inf
+    X[::5, -1] = np.nan
+    preds = forest.predict(X)
+    for i, model in enumerate(models.values()):
+        np.testing.assert_allclose(preds[:, i], tree_mean(model, X), rtol=1e-9, atol=1e-9)
+
+
+def test_pruned_columns_remap(pruned_models, tmp_path):
+    forest = CompiledForest.from_sklearn(pruned_models)
+    columns, positions = input_columns(pruned_models)
+    np.testing.assert_array_equal(forest.columns, sorted(set(PRUNED["a"]) | set(PRUNED["b"])))
+
+    X = inputs(len(columns), seed=4)
+    X[::4, 1] = np.nan
+    path = tmp_path / "pruned.npz"
+    forest.save(path)
+    for loaded in (CompiledForest.load(path), CompiledForest.load(path, mmap=True)):
+        np.testing.assert_array_equal(loaded.columns, forest.columns)
+        preds = loaded.predict(X)
+        for i, (name, model) in enumerate(pruned_models.items()):
+            np.testing.assert_array_equal(positions[name], np.searchsorted(columns, PRUNED[name]))
+            np.testing.assert_allclose(preds[:, i], model.predict(X[:, positions[name]]), rtol=1e-9, atol=1e-9)
+    assert check_parity(forest, pruned_models, X) < 1e-9
+
+
+def test_mmap_aligned_npz(models, tmp_path):
+    forest = CompiledForest.from_sklearn(models)
+    path = tmp_path / "forest.npz"
+    forest.save(path)
+    arrays = load_npz_mmap(path)
+    assert isinstance(arrays["feature"].base, np.memmap)
+    X = inputs(N_FEATURES, seed=5)
+    np.testing.assert_array_equal(CompiledForest.load(path, mmap=True).predict(X), forest.predict(X))
+
+
+def save_npz_unaligned(path, arrays):
+    """np.savez と同じ形式で、各配列のデータをわざと 8 バイト境界からずらして書く（古い np.savez のファイルの代わり）"""
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as zf:
+        for name, arr in arrays.items():
+            buf = io.BytesIO()
+            np.lib.format.write_array(buf, np.asanyarray(arr), allow_pickle=False)
+            info = zipfile.ZipInfo(name + ".npy", date_time=(1980, 1, 1, 0, 0, 0))
+            start = zf.fp.tell() + 30 + len(info.filename.encode())
+            pad = (1 - start) % 8 + 8  # .npy のヘッダは 64 バイト単位なので、データの先頭も 8 で割って 1 余る
+            info.extra = struct.pack("<HH", 0xCAFE, pad - 4) + bytes(pad - 4)
+            zf.writestr(info, buf.getvalue())
+
+
+def test_mmap_unaligned_v1_npz(models, tmp_path):
+    forest = CompiledForest.from_sklearn(models)
+    path = tmp_path / "forest_v1.npz"
+    # version 1 は columns を持たない（全列）
+    save_npz_unaligned(path, {
+        "format_version": np.asarray(1),
+        "feature": forest.feature, "threshold": forest.threshold, "left": forest.left, "right": forest.right,
+        "missing_left": forest.missing_left, "value": forest.value, "roots": forest.roots,
+        "tree_model": forest.tree_model, "names": np.asarray(forest.names),
+        "n_features": np.asarray(forest.n_features), "max_depth": np.asarray(forest.max_depth)})
+
+    arrays = load_npz_mmap(path)
+    assert not isinstance(arrays["threshold"].base, np.memmap)  # 揃っていない配列は読み込む
+    np.testing.assert_array_equal(arrays["threshold"], forest.threshold)
+
+    loaded = CompiledForest.load(path, mmap=True)
+    np.testing.assert_array_equal(loaded.columns, np.arange(N_FEATURES))
+    X = inputs(N_FEATURES, seed=6)
+    X[::3, 2] = np.nan
+    preds = loaded.predict(X)
+    for i, model in enumerate(models.values()):
+        np.testing.assert_allclose(preds[:, i], model.predict(X), rtol=1e-9, atol=1e-9)
+
+
+def test_check_parity_detects_mismatch(models):
+    forest = CompiledForest.from_sklearn(models)
+    forest.value = forest.value + 1.0
+    with pytest.raises(ValueError):
+        check_parity(forest, models, inputs(N_FEATURES))
+
+
+def test_unknown_format_version(models, tmp_path):
+    forest = CompiledForest.from_sklearn(models)
+    path = tmp_path / "forest.npz"
+    forest.save(path)
+    arrays = dict(np.load(path))
+    arrays["format_version"] = np.asarray(tree_ensemble.FORMAT_VERSION + 1)
+    np.savez(path, **arrays)
+    with pytest.raises(ValueError):
+        CompiledForest.load(path)
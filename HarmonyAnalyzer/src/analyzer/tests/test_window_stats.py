@@ -0,0 +1,166 @@
+import itertools
+import os
+import warnings
+
+import numpy as np
+import pytest
+
+import feature_subset
+import window_stats
+
+# 一部の統計量だけを計算したとき（プルーニングしたモデルの推論）に、全部計算した場合と同じ値になるか
+
+
+def features(T=3000, D=6, seed=0):
+    """大きさ・オフセットの違う列、一定の列、NaN のある列を含む特徴量"""
+    rng = np.random.default_rng(seed)
+    scale = np.resize([1, 1e-6, 1e3, 1, 1, 1], D)
+    offset = np.resize([0, 1e4, 0, 5, 0, 0], D)
+    F = rng.standard_normal((T, D)) * scale + offset
+    F[:, 3] = 7.0
+    F[100:130, 4] = np.nan
+    F[1000:1200, 5] = 1.0
+    return F
+
+
+@pytest.mark.parametrize("stats", [s for r in range(1, 5) for s in itertools.combinations(window_stats.STATS, r)])
+def test_subset_matches_full(stats):
+    F = features()
+    D = F.shape[1]
+    full, times = window_stats.compute_window_stats(F, 43, 10)
+    part, part_times = window_stats.compute_window_stats(F, 43, 10, stats=stats)
+    ref = np.concatenate([full[:, D * window_stats.STATS.index(k):D * (window_stats.STATS.index(k) + 1)]
+                          for k in stats], axis=1)
+    np.testing.assert_allclose(part, ref, rtol=1e-7, atol=1e-9, equal_nan=True)
+    np.testing.assert_array_equal(part_times, times)
+
+
+def test_pruned_columns():
+    F = features(D=feature_subset.N_BASE)
+    full, _ = window_stats.compute_window_stats(F, 43, 10)
+    for columns in ([0, 60, 61, 70], [5, 200, 201], [150]):
+        columns = np.array(columns)
+        bases = feature_subset.base_features(columns)
+        part, _ = feature_subset.compute_window_stats(F[:, bases], columns, 43, 10)
+        np.testing.assert_allclose(part, full[:, columns], rtol=1e-7, atol=1e-9, equal_nan=True)
+
+
+def test_unknown_stat():
+    with pytest.raises(ValueError):
+        window_stats.compute_window_stats(features(), 43, 10, stats=("median",))
+
+
+# === 置き換える前の実装（scipy.stats で窓ごとに計算）との一致 ===
+# 窓統計量は 1〜4 乗の累積和から計算し、誤差が大きくなりそうな窓は直接計算に回す（window_stats.py）
+# ほぼ一定の窓（揺らぎが値の 1e-10 程度）は scipy 自身が桁落ちする（Precision loss の警告）ので、
+# 中心化してから計算した値を正として、scipy 以上に近いことを確かめる
+BASELINE_TOL = {"rtol": 1e-7, "atol": 1e-9}
+NEAR_CONSTANT_ATOL = 1e-5
+
+
+def baseline_window_stats(features, window_frames, step_frames, include_last='short'):
+    """置き換える前の analyze_audio.compute_window_stats_frames"""
+    from scipy.stats import kurtosis, skew
+    T = features.shape[0]
+    stats_list, times_frames = [], []
+    start = 0
+    while start < T:
+        end = start + window_frames
+        if end <= T:
+            window = features[start:end, :]
+        elif include_last == 'drop':
+            break
+        elif include_last == 'pad':
+            window = np.pad(features[start:T, :], ((0, end - T), (0, 0)), mode='constant', constant_values=0.0)
+        else:
+            window = features[start:T, :]
+        with np.errstate(all='ignore'), warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            stats_list.append(np.concatenate([
+                np.mean(window, axis=0), np.var(window, axis=0),
+                skew(window, axis=0, bias=False, nan_policy='omit'),
+                kurtosis(window, axis=0, bias=False, nan_policy='omit')]))
+        times_frames.append(start + window.shape[0] / 2)
+        start += step_frames
+    return np.asarray(stats_list), np.asarray(times_frames)
+
+
+def baseline_features(T=1503, seed=1):
+    """
+    features のうち scipy が桁落ちしない列（正規分布・一定・NaN・一部が一定）に、
+    1〜3 フレームだけ値が違う列を加えたもの（末尾に短い窓が残る長さ）
+    """
+    F = features(T=T, D=6, seed=seed)[:, [0, 2, 3, 4, 5]]
+    spikes = np.zeros((T, 1))
+    spikes[200:203, 0] = [1.0, 2.0, 0.5]
+    spikes[700, 0] = 3.0
+    return np.hstack([F, spikes])
+
+
+@pytest.mark.parametrize("include_last", ["short", "pad", "drop"])
+@pytest.mark.parametrize("window_frames, step_frames", [(43, 10), (7, 3), (100, 100)])
+def test_matches_scipy_baseline(include_last, window_frames, step_frames):
+    F = baseline_features()
+    ref, ref_times = baseline_window_stats(F, window_frames, step_frames, include_last)
+    stats, times = window_stats.compute_window_stats(F, window_frames, step_frames, include_last)
+    assert stats.shape == ref.shape
+    np.testing.assert_array_equal(times, ref_times)
+    np.testing.assert_allclose(stats, ref, equal_nan=True, **BASELINE_TOL)
+
+
+@pytest.mark.parametrize("offset, scale", [(1e4, 1e-6), (5.0, 1e-9)])
+def test_near_constant_windows(offset, scale):
+    from scipy.stats import kurtosis, skew
+    T, w, s = 1503, 43, 10
+    F = offset + scale * np.random.default_rng(3).standard_normal((T, 1))
+    stats, _ = window_stats.compute_window_stats(F, w, s)
+    ref, _ = baseline_window_stats(F, w, s)
+    starts, ends = window_stats.sliding_window_bounds(T, w, s)
+    # offset を引いてから計算した値（近い値どうしの引き算なので誤差が無い）
+    centered = [F[a:b, 0] - offset for a, b in zip(starts, ends)]
+    exact = {2: np.array([skew(x, bias=False) for x in centered]),
+             3: np.array([kurtosis(x, bias=False) for x in centered])}
+    for k, values in exact.items():
+        err = np.abs(stats[:, k] - values)
+        assert np.nanmax(err) <= NEAR_CONSTANT_ATOL
+        assert np.nanmax(err) <= np.nanmax(np.abs(ref[:, k] - values))
+    np.testing.assert_allclose(stats[:, :2], ref[:, :2], **BASELINE_TOL)
+
+
+def baseline_segment_stats(feature_matrix, n_segments=5):
+    """置き換える前の create_model/src/audio_2_segment_stats.compute_segment_stats"""
+    from scipy.stats import kurtosis, skew
+    n_frames = feature_matrix.shape[1]
+    seg_len = n_frames // n_segments
+    eps = 1e-10
+    stats_list = []
+    for i in range(n_segments):
+        start = i * seg_len
+        end = (i + 1) * seg_len if i < n_segments - 1 else n_frames
+        segment = feature_matrix[:, start:end].astype(np.float64)
+        means = np.mean(segment, axis=1)
+        vars_ = np.var(segment, axis=1)
+        safe_segment = np.where(np.abs(segment - means[:, None]) < eps, means[:, None], segment)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            skews = skew(safe_segment, axis=1, bias=False, nan_policy='omit')
+            kurts = kurtosis(safe_segment, axis=1, bias=False, nan_policy='omit')
+        skews[np.isnan(skews)] = 0
+        kurts[np.isnan(kurts)] = 0
+        skews[vars_ < eps] = 0
+        kurts[vars_ < eps] = 0
+        stats_list.append(np.concatenate([means, vars_, skews, kurts]))
+    return np.vstack(stats_list)
+
+
+def test_segment_stats_matches_scipy_baseline(monkeypatch):
+    """学習データのセグメント統計量（create_model/src/audio_2_segment_stats.py）も同じエンジンで計算する"""
+    create_model_src = os.path.join(os.path.dirname(__file__), "..", "..", "..", "..", "create_model", "src")
+    monkeypatch.syspath_prepend(create_model_src)
+    from audio_2_segment_stats import compute_segment_stats
+
+    F = baseline_features(seed=2)
+    F = F[:, np.arange(F.shape[1]) != 3]  # 学習時の特徴量には NaN が無い
+    for n_segments in (1, 5, 7):
+        np.testing.assert_allclose(compute_segment_stats(F.T, n_segments),
+                                   baseline_segment_stats(F.T, n_segments), **BASELINE_TOL)
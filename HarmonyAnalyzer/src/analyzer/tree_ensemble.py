@@ -0,0 +1,303 @@
+import io
+import os
+import sys
+import time
+import struct
+import zipfile
+import functools
+import numpy as np
+
+# 5 つの RandomForestRegressor（各 200 本）の全ノードを連続した NumPy 配列にまとめ、
+# 1 回の呼び出しで全窓 × 全モデルの予測を行う推論器（木の探索は numba でコンパイルしたループで行う）
+#
+# 変換:  python3 tree_ensemble.py compile <出力.npz> rf_model_brightness.pkl rf_model_smoothness.pkl ...
+#        （audio_8_randomforest.py が出力した pkl をそのまま使う。変換後に sklearn との一致を確認する）
+#
+# プルーニングしたモデル（feature_columns_ を持つ。feature_subset.py）は、5 モデルが使う列を合わせた
+# columns だけを入力に取るように木の特徴量番号を付け替える
+#
+# .npz は np.load でそのまま読める無圧縮の zip で、各配列のデータを ALIGN バイト境界に揃えて書く。
+# load(path, mmap=True) は配列をコピーせずにファイルをメモリマップする（起動時に木を読み込まない）
+# numba の import（約 0.25 秒）とコンパイルは最初に predict するときに行う（import しただけでは読み込まない）
+
+FORMAT_VERSION = 2
+ALIGN = 64
+PARITY_RTOL = 1e-9
+PARITY_ATOL = 1e-9
+
+
+def _forest_sums(X, feature, threshold, left, right, missing_left, value, roots, tree_model, n_models,
+                 block_rows):
+    """
+    全行 × 全木を辿り、モデルごとに葉の値を足し合わせる
+    （行を block_rows ずつに区切り、区切りの中では木ごとに全行を流して木と入力をキャッシュに載せたまま使う）
+    """
+    out = np.zeros((X.shape[0], n_models))
+    for r0 in range(0, X.shape[0], block_rows):
+        r1 = min(r0 + block_rows, X.shape[0])
+        for t in range(roots.shape[0]):
+            m = tree_model[t]
+            for i in range(r0, r1):
+                node = roots[t]
+                while True:
+                    v = X[i, feature[node]]
+                    if np.isnan(v):
+                        nxt = left[node] if missing_left[node] else right[node]
+                    elif v <= threshold[node]:
+                        nxt = left[node]
+                    else:
+                        nxt = right[node]
+                    if nxt == node:
+                        break
+                    node = nxt
+                out[i, m] += value[node]
+    return out
+
+
+@functools.lru_cache(maxsize=1)
+def _compiled_forest_sums():
+    """numba でコンパイルした _forest_sums（コンパイル結果は numba のキャッシュに残る）"""
+    from numba import njit
+    return njit(cache=True, nogil=True)(_forest_sums)
+
+
+class CompiledForest:
+    """
+    feature / threshold / left / right / value : 全木の全ノード（木ごとに連続して並ぶ）
+        葉ノードは left = right = 自分自身 にしてあるので、辿り続けても葉に留まる
+    missing_left : 入力が NaN のとき左に進むか（sklearn の tree_.missing_go_to_left と同じ）
+    roots      : 各木の根ノードの番号
+    tree_model : 各木がどのモデル（出力列）に属するか
+    names      : モデル名（出力列の順）
+    columns    : 入力の各列が窓統計量（208 次元）のどの列か（feature_subset.py。全列なら 0〜207）
+    """
+
+    def __init__(self, feature, threshold, left, right, missing_left, value, roots, tree_model, names,
+                 n_features, max_depth, columns=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing_left = missing_left
+        self.value = value
+        self.roots = roots
+        self.tree_model = tree_model
+        self.names = list(names)
+        self.n_features = int(n_features)
+        self.max_depth = int(max_depth)
+        self.trees_per_model = np.bincount(tree_model, minlength=len(self.names))
+        self.columns = np.arange(self.n_features) if columns is None else np.asarray(columns, dtype=np.int64)
+
+    # === sklearn のモデルから変換 ===
+    @classmethod
+    def from_sklearn(cls, models):
+        """models: {名前: RandomForestRegressor}（名前の順が出力列の順になる）"""
+        columns, positions = input_columns(models)
+        feature, threshold, left, right, missing_left, value = [], [], [], [], [], []
+        roots, tree_model = [], []
+        max_depth = 0
+        offset = 0
+        for m, (name, model) in enumerate(models.items()):
+            for est in model.estimators_:
+                t = est.tree_
+                if t.n_outputs != 1:
+                    raise ValueError(f"{name}: 出力が 1 次元の回帰木のみ対応しています")
+                n = t.node_count
+                idx = np.arange(n)
+                is_leaf = t.children_left == -1
+                feature.append(np.where(is_leaf, 0, positions[name][np.maximum(t.feature, 0)]).astype(np.int32))
+                threshold.append(np.where(is_leaf, np.inf, t.threshold).astype(np.float64))
+                left.append((np.where(is_leaf, idx, t.children_left) + offset).astype(np.int32))
+                right.append((np.where(is_leaf, idx, t.children_right) + offset).astype(np.int32))
+                # 古い sklearn には missing_go_to_left が無い（NaN は比較が偽になるので右へ進む）
+                missing = getattr(t, "missing_go_to_left", np.zeros(n, dtype=bool))
+                missing_left.append(np.asarray(missing, dtype=bool))
+                value.append(t.value[:, 0, 0].astype(np.float64))
+                roots.append(offset)
+                tree_model.append(m)
+                max_depth = max(max_depth, t.max_depth)
+                offset += n
+        return cls(np.concatenate(feature), np.concatenate(threshold),
+                   np.concatenate(left), np.concatenate(right), np.concatenate(missing_left),
+                   np.concatenate(value),
+                   np.asarray(roots, dtype=np.int32), np.asarray(tree_model, dtype=np.int32),
+                   list(models.keys()), len(columns), max_depth, columns)
+
+    # === 保存・読み込み ===
+    def save(self, path):
+        save_npz_aligned(path, {
+            "format_version": np.asarray(FORMAT_VERSION),
+            "feature": self.feature, "threshold": self.threshold, "left": self.left, "right": self.right,
+            "missing_left": self.missing_left, "value": self.value, "roots": self.roots,
+            "tree_model": self.tree_model, "names": np.asarray(self.names),
+            "n_features": np.asarray(self.n_features), "max_depth": np.asarray(self.max_depth),
+            "columns": self.columns})
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        """mmap: 木の配列をファイルのメモリマップ（コピーオンライト）のまま使う"""
+        if mmap:
+            return cls._from_arrays(path, load_npz_mmap(path))
+        with np.load(path, allow_pickle=False) as z:
+            return cls._from_arrays(path, z)
+
+    @classmethod
+    def _from_arrays(cls, path, z):
+        version = int(z["format_version"])
+        if version not in (1, FORMAT_VERSION):
+            raise ValueError(f"{path}: 未対応のフォーマットです (version={version})")
+        # version 1 は columns が無い（全列）
+        return cls(z["feature"], z["threshold"], z["left"], z["right"], z["missing_left"], z["value"],
+                   z["roots"], z["tree_model"], [str(n) for n in z["names"]],
+                   int(z["n_features"]), int(z["max_depth"]), z["columns"] if version >= 2 else None)
+
+    # === 推論 ===
+    def predict(self, X, block_rows=256):
+        """
+        X: (n, n_features)  窓統計量の columns の列
+        戻り値: (n, モデル数)  各列は RandomForestRegressor.predict と同じ値
+        """
+        # sklearn の決定木は入力を float32 にしてから閾値と比較する
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"X の形が不正です: {X.shape} (n_features={self.n_features})")
+        sums = _compiled_forest_sums()(X, self.feature, self.threshold, self.left, self.right, self.missing_left,
+                                       self.value, self.roots, self.tree_model, len(self.names), block_rows)
+        return sums / self.trees_per_model
+
+    def predict_dict(self, X):
+        preds = self.predict(X)
+        return {name: preds[:, i] for i, name in enumerate(self.names)}
+
+
+def save_npz_aligned(path, arrays):
+    """
+    np.savez と同じ形式（無圧縮）で、各配列のデータの先頭がファイル内で ALIGN バイト境界に来るように書く
+    （zip のローカルヘッダの extra を詰め物にする。.npy のヘッダは numpy が 64 バイト単位に揃えている）
+    """
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for name, arr in arrays.items():
+            buf = io.BytesIO()
+            np.lib.format.write_array(buf, np.asanyarray(arr), allow_pickle=False)
+            info = zipfile.ZipInfo(name + ".npy", date_time=(1980, 1, 1, 0, 0, 0))
+            info.compress_type = zipfile.ZIP_STORED
+            start = zf.fp.tell() + 30 + len(info.filename.encode())
+            pad = -start % ALIGN
+            if 0 < pad < 4:  # extra の 1 項目は 4 バイトのヘッダを持つ
+                pad += ALIGN
+            if pad:
+                info.extra = struct.pack("<HH", 0xCAFE, pad - 4) + bytes(pad - 4)
+            zf.writestr(info, buf.getvalue())
+
+
+def load_npz_mmap(path):
+    """
+    .npz の各配列を {名前: 配列} で返す。無圧縮で境界の揃った配列はメモリマップ（mode="c"）、
+    それ以外（np.savez で書いた古いファイルの揃っていない配列・0 次元の値など）は読み込む
+    """
+    out = {}
+    with zipfile.ZipFile(path) as zf, open(path, "rb") as f:
+        for info in zf.infolist():
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            f.seek(info.header_offset)
+            n_name, n_extra = struct.unpack("<HH", f.read(30)[26:30])
+            f.seek(info.header_offset + 30 + n_name + n_extra)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+            offset = f.tell()
+            if (info.compress_type == zipfile.ZIP_STORED and len(shape) > 0 and np.prod(shape) > 0
+                    and not dtype.hasobject and offset % dtype.alignment == 0):
+                # 書き込み可能な ndarray として渡す（読み取り専用だと numba が別の型として再コンパイルする）
+                out[name] = np.asarray(np.memmap(path, dtype=dtype, mode="c", offset=offset, shape=shape,
+                                                 order="F" if fortran else "C"))
+            else:
+                with zf.open(info) as member:
+                    out[name] = np.lib.format.read_array(member, allow_pickle=False)
+    return out
+
+
+def input_columns(models):
+    """
+    models が使う列を合わせたもの columns と、各モデルの列が columns の何番目か {名前: (n_features_in_,)}
+    feature_columns_ の無いモデルは入力の全列を使う（そのときは全モデルの次元数が同じであること）
+    """
+    import feature_subset
+
+    plain = {name: m.n_features_in_ for name, m in models.items() if getattr(m, "feature_columns_", None) is None}
+    if len(set(plain.values())) > 1:
+        raise ValueError(f"特徴量の次元数がモデルによって異なります: {plain}")
+    if len(plain) == len(models):
+        n = next(iter(plain.values()))
+        return np.arange(n), {name: np.arange(n) for name in models}
+
+    own = {name: feature_subset.model_columns(m) for name, m in models.items()}
+    for name, cols in own.items():
+        if len(cols) != models[name].n_features_in_:
+            raise ValueError(f"{name}: feature_columns_ の長さが n_features_in_ と一致しません")
+    columns = np.unique(np.concatenate(list(own.values())))
+    return columns, {name: np.searchsorted(columns, cols) for name, cols in own.items()}
+
+
+def check_parity(forest, models, X):
+    """sklearn の predict と一致するか確認し、最大誤差を返す（一致しなければ例外）"""
+    ours = forest.predict(X)
+    _, positions = input_columns(models)
+    max_err = 0.0
+    for i, (name, model) in enumerate(models.items()):
+        ref = model.predict(X[:, positions[name]])
+        if not np.allclose(ours[:, i], ref, rtol=PARITY_RTOL, atol=PARITY_ATOL):
+            raise ValueError(f"{name}: sklearn の予測と一致しません (max diff={np.max(np.abs(ours[:, i] - ref)):.3g})")
+        max_err = max(max_err, float(np.max(np.abs(ours[:, i] - ref))))
+    return max_err
+
+
+def compile_models(out_path, model_paths, n_check=2000, seed=0):
+    """rf_model_<名前>.pkl を読み込んで変換し、乱数入力で sklearn と一致を確認してから保存する"""
+    import joblib
+
+    models = {}
+    for p in model_paths:
+        name = os.path.splitext(os.path.basename(p))[0]
+        if name.startswith("rf_model_"):
+            name = name[len("rf_model_"):]
+        models[name] = joblib.load(p)
+
+    forest = CompiledForest.from_sklearn(models)
+    rng = np.random.default_rng(seed)
+    X = rng.standard_normal((n_check, forest.n_features)) * 2.0
+    max_err = check_parity(forest, models, X)
+    forest.save(out_path)
+    print(f"{len(forest.roots)} 本の木 / {len(forest.feature)} ノードを {out_path} に保存しました "
+          f"(sklearn との最大誤差 {max_err:.3g})")
+    return forest
+
+
+def bench_models(models, forest, n_rows=300, repeat=5, seed=0):
+    """sklearn（モデルごとに predict）と CompiledForest（1 回で全モデル）の推論時間を比較"""
+    rng = np.random.default_rng(seed)
+    X = rng.standard_normal((n_rows, forest.n_features))
+
+    def best(fn):
+        t_best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            t_best = min(t_best, time.perf_counter() - t0)
+        return t_best
+
+    _, positions = input_columns(models)
+    t_sk = best(lambda: {k: m.predict(X[:, positions[k]]) for k, m in models.items()})
+    t_cf = best(lambda: forest.predict(X))
+    max_err = check_parity(forest, models, X)
+    return t_sk, t_cf, max_err
+
+
+if __name__ == "__main__":
+    # 使い方: python3 tree_ensemble.py compile <出力.npz> <rf_model_*.pkl ...>
+    if len(sys.argv) < 4 or sys.argv[1] != "compile":
+        sys.stderr.write("usage: tree_ensemble.py compile <out.npz> <rf_model_*.pkl ...>\n")
+        sys.exit(1)
+    compile_models(sys.argv[2], sys.argv[3:])
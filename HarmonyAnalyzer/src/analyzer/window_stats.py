@@ -0,0 +1,233 @@
+import numpy as np
+
+# 累積和から求めた中心モーメントの丸め誤差が、この相対値を超えそうな窓・列は
+# 窓の中身から直接（2 パスで）計算し直す
+FALLBACK_RTOL = 1e-9
+# 累積和を取り直す単位（フレーム数）。累積和の桁が大きくなりすぎないように区切る
+CHUNK_FRAMES = 2048
+# 窓統計量の種類（compute_window_stats の列の並び）。高い次数ほど累積和・補正の計算が増える
+STATS = ("mean", "var", "skew", "kurt")
+
+
+def _order(stats):
+    """stats（STATS の部分集合）を計算するのに要る次数（分散までは誤差の判定に使うので 2 以上）"""
+    unknown = [k for k in stats if k not in STATS]
+    if unknown or not stats:
+        raise ValueError(f"stats は {STATS} から 1 つ以上選んでください: {stats}")
+    return max(2, max(STATS.index(k) for k in stats) + 1)
+
+
+def _finish_moments(n, mean, m2, m3, m4):
+    """
+    scipy.stats.skew / kurtosis (bias=False, fisher=True) と同じ規則で補正する
+    m3 / m4 が None なら歪度 / 尖度は計算せず None を返す
+    """
+    skews = kurts = None
+    with np.errstate(all='ignore'):
+        zero = m2 <= (np.finfo(np.float64).eps * mean) ** 2
+        if m3 is not None:
+            skews = np.where(zero, np.nan, m3 / m2 ** 1.5)
+            can_skew = ~zero & (n > 2)
+            skews = np.where(can_skew, ((n - 1.0) * n) ** 0.5 / (n - 2.0) * m3 / m2 ** 1.5, skews)
+        if m4 is not None:
+            kurts = np.where(zero, np.nan, m4 / m2 ** 2.0)
+            can_kurt = ~zero & (n > 3)
+            kurts = np.where(can_kurt,
+                             1.0 / (n - 2) / (n - 3) * ((n ** 2 - 1.0) * m4 / m2 ** 2.0 - 3 * (n - 1) ** 2.0) + 3.0,
+                             kurts) - 3
+    return skews, kurts
+
+
+def _direct_moments(block):
+    """block: (K, L) 各行を 1 つの窓として NaN を除いて 2 パスで中心モーメントを計算"""
+    valid = ~np.isnan(block)
+    n = valid.sum(axis=1).astype(np.float64)
+    with np.errstate(all='ignore'):
+        mean = np.where(valid, block, 0.0).sum(axis=1) / n
+        d = np.where(valid, block - mean[:, None], 0.0)
+        d2 = d * d
+        m2 = d2.sum(axis=1) / n
+        m3 = (d2 * d).sum(axis=1) / n
+        m4 = (d2 * d2).sum(axis=1) / n
+    return n, mean, m2, m3, m4
+
+
+def window_groups(starts, ends, chunk_frames=CHUNK_FRAMES):
+    """
+    累積和を取り直す単位で窓をまとめる
+    戻り値: [(窓の番号の配列, r0, r1), ...]  まとまりの窓はすべて features[r0:r1] に収まる
+    （窓が長いときはまとまりも長くして、重なり部分の再計算を全体の数割以内に抑える）
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    if len(starts) == 0:
+        return []
+    chunk = max(1, int(chunk_frames), 4 * int((ends - starts).max()))
+    group = starts // chunk
+    bounds = np.flatnonzero(np.diff(group)) + 1
+    return [(idx, int(starts[idx].min()), int(ends[idx].max()))
+            for idx in np.split(np.arange(len(starts)), bounds)]
+
+
+def group_moments(block, a, b, stats=STATS):
+    """
+    1 つのまとまり（window_groups の 1 要素）の窓ごとの平均・分散・歪度・尖度
+    block: features[r0:r1]
+    a, b: 各窓の開始・終了（block の先頭からのフレーム番号）
+    stats: 返す統計量（STATS の部分集合）。要らない高次の累積和は計算しない
+    戻り値: stats の順の (Nwin, D) の配列のタプル
+    結果は block の中身だけで決まるので、特徴量を少しずつ受け取る場合でも同じ値になる
+    """
+    order = _order(stats)
+    block = np.asarray(block, dtype=np.float64)
+    a = np.asarray(a, dtype=np.int64)
+    b = np.asarray(b, dtype=np.int64)
+    D = block.shape[1]
+    eps = np.finfo(np.float64).eps
+
+    # まとまりの平均を基準に中心化してから累積和を取る（桁落ち対策）
+    nan_mask = np.isnan(block)
+    has_nan = bool(nan_mask.any())
+    if has_nan:
+        with np.errstate(all='ignore'):
+            ref = np.nanmean(block, axis=0) if (~nan_mask).any() else np.zeros(D)
+        ref = np.nan_to_num(ref)
+        d = np.where(nan_mask, 0.0, block - ref)
+    else:
+        ref = block.mean(axis=0)
+        d = block - ref
+
+    d2 = d * d
+    zeros = np.zeros((1, D))
+    P1 = np.concatenate([zeros, np.cumsum(d, axis=0)])
+    P2 = np.concatenate([zeros, np.cumsum(d2, axis=0)])
+    P3 = np.concatenate([zeros, np.cumsum(d2 * d, axis=0)]) if order >= 3 else None
+    P4 = np.concatenate([zeros, np.cumsum(d2 * d2, axis=0)]) if order >= 4 else None
+
+    n_all = (b - a).astype(np.float64)[:, None]
+    if has_nan:
+        Pn = np.concatenate([zeros, np.cumsum(nan_mask, axis=0)])
+        n_nan = Pn[b] - Pn[a]
+        n = n_all - n_nan
+    else:
+        n_nan = np.zeros_like(n_all)
+        n = np.broadcast_to(n_all, (len(a), D))
+
+    with np.errstate(all='ignore'):
+        mu = (P1[b] - P1[a]) / n
+        e2 = (P2[b] - P2[a]) / n
+        mu2 = mu * mu
+        m2 = e2 - mu2
+        m3 = m4 = None
+        if order >= 3:
+            e3 = (P3[b] - P3[a]) / n
+            m3 = e3 - 3 * mu * e2 + 2 * mu2 * mu
+        if order >= 4:
+            e4 = (P4[b] - P4[a]) / n
+            m4 = e4 - 4 * mu * e3 + 6 * mu2 * e2 - 3 * mu2 * mu2
+
+        # 累積和の大きさから見積もった誤差が大きい窓・列は直接計算に回す
+        # （尖度を返さないときは 4 乗の累積和の誤差は見ない）
+        err = eps * len(block) / n
+        unstable = (err * P2[-1] > FALLBACK_RTOL * m2) | ~np.isfinite(m2)
+        if order >= 4:
+            unstable |= err * P4[-1] > FALLBACK_RTOL * m2 * m2
+    mean = ref + mu
+
+    skews, kurts = _finish_moments(n, mean, m2, m3, m4)
+    out = {
+        "mean": np.where(n_nan > 0, np.nan, mean),
+        "var": np.where(n_nan > 0, np.nan, np.maximum(m2, 0.0)),
+        "skew": skews,
+        "kurt": kurts,
+    }
+
+    wi, ci = np.nonzero(unstable)
+    if len(wi):
+        _redo_direct(block, a, b, wi, ci, out)
+    return tuple(out[k] for k in stats)
+
+
+def window_moments(features, starts, ends, chunk_frames=CHUNK_FRAMES, stats=STATS):
+    """
+    任意の窓 [starts[i], ends[i]) ごとの平均・分散・歪度・尖度を、
+    1〜4 乗の累積和から一括で計算する（窓の長さに計算量が依存しない）
+    features: (T, D)
+    starts, ends: (Nwin,) 窓の開始・終了フレーム（end は含まない）
+    stats: 返す統計量（STATS の部分集合）
+    戻り値: means, vars, skews, kurts（stats を指定したときはその順）  いずれも (Nwin, D)
+        means / vars は np.mean / np.var と同じく窓に NaN があれば NaN、
+        skews / kurts は scipy.stats.skew / kurtosis(bias=False, nan_policy='omit') と同じ値
+    """
+    features = np.asarray(features, dtype=np.float64)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    n_win = len(starts)
+    D = features.shape[1]
+
+    out = tuple(np.empty((n_win, D)) for _ in stats)
+
+    for idx, r0, r1 in window_groups(starts, ends, chunk_frames):
+        for dest, values in zip(out, group_moments(features[r0:r1], starts[idx] - r0, ends[idx] - r0, stats)):
+            dest[idx] = values
+
+    return out
+
+
+def _redo_direct(features, starts, ends, win, col, out, batch=65536):
+    """不安定と判定された (窓, 列) を窓の中身から直接計算して out（統計量の名前 → 配列。None は飛ばす）に上書きする"""
+    lengths = ends[win] - starts[win]
+    for L in np.unique(lengths):
+        sel = np.flatnonzero(lengths == L)
+        if L == 0:
+            continue
+        view = np.lib.stride_tricks.sliding_window_view(features, int(L), axis=0)  # (T-L+1, D, L)
+        for b0 in range(0, len(sel), batch):
+            part = sel[b0:b0 + batch]
+            w, c = win[part], col[part]
+            block = view[starts[w], c]  # (K, L)
+            n, mean, m2, m3, m4 = _direct_moments(block)
+            s, k = _finish_moments(n, mean, m2, m3, m4)
+            has_nan = n < L
+            values = {"mean": np.where(has_nan, np.nan, mean), "var": np.where(has_nan, np.nan, m2), "skew": s, "kurt": k}
+            for name, dest in out.items():
+                if dest is not None:
+                    dest[w, c] = values[name]
+
+
+def sliding_window_bounds(T, window_frames, step_frames, include_last='short'):
+    """
+    compute_window_stats_frames と同じ規則で窓の開始・終了フレームを作る
+    include_last: 'short' 末尾は短い窓 / 'pad' 末尾は 0 埋めした窓 / 'drop' 末尾の不完全な窓は捨てる
+    戻り値: starts, ends（'pad' のときは ends が T を超えることがある）
+    """
+    w = int(window_frames)
+    s = int(step_frames)
+    if w <= 0 or s <= 0:
+        raise ValueError("window_frames と step_frames は正の整数にしてください")
+
+    starts = np.arange(0, T, s, dtype=np.int64)
+    ends = starts + w
+    if include_last == 'drop':
+        keep = ends <= T
+        starts, ends = starts[keep], ends[keep]
+    elif include_last != 'pad':  # 'short'
+        ends = np.minimum(ends, T)
+    return starts, ends
+
+
+def compute_window_stats(features, window_frames, step_frames, include_last='short', stats=STATS):
+    """
+    スライディング窓ごとの [平均, 分散, 歪度, 尖度] を連結した統計量と、各窓の中心フレームを返す
+    stats: 計算する統計量（STATS の部分集合。この順に連結する）
+    戻り値: (Nwin, len(stats) * D), (Nwin,)
+    """
+    T, D = features.shape
+    starts, ends = sliding_window_bounds(T, window_frames, step_frames, include_last)
+    if len(starts) and ends[-1] > T:  # 'pad'
+        features = np.pad(features, ((0, int(ends[-1]) - T), (0, 0)),
+                          mode='constant', constant_values=0.0)
+
+    moments = window_moments(features, starts, ends, stats=stats)
+    times_frames = starts + (ends - starts) / 2
+    return np.concatenate(moments, axis=1), times_frames
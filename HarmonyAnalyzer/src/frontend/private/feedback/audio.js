@@ -62,7 +62,8 @@ export function setupAudioPlayer(state, filepath) {
   }
 
   const nameNoExt = baseName.replace(/\.[^.]*$/, '');
-  const candidates = [`${nameNoExt}.wav`, `${nameNoExt}.webm`];
+  // 新しい録音は wav を作らないので webm を先に試す（古い録音は wav も残っている）
+  const candidates = [`${nameNoExt}.webm`, `${nameNoExt}.wav`];
 
   let attempt = 0;
   state.audioLoaded = false;
@@ -365,7 +365,7 @@ function getDisplayName(fileName, isDirectory = false) {
     return fileName;
   } else {
     // 音源ファイル名 (user_yyyymmdd_HHMMSS.拡張子)
-    const m = fileName.match(/^(.+?)_(\d{8})_(\d{6})\.(wav|webm|pkl)$/);
+    const m = fileName.match(/^(.+?)_(\d{8})_(\d{6})\.(wav|webm|pkl|cols)$/);
     if (m) {
       const userName = m[1];
       const date = m[2]; // yyyymmdd
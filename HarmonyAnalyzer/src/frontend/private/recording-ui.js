@@ -16,6 +16,7 @@
   const levelL = document.getElementById('levelL')?.querySelector('.level-fill');
   const levelR = document.getElementById('levelR')?.querySelector('.level-fill');
   const messageEl = overlay?.querySelector('.overlay-message');
+  const liveScoresEl = document.getElementById('liveScores');
 
   const countdownModal = document.getElementById('countdownModal');
   const countNumber = document.getElementById('countNumber');
@@ -143,6 +144,7 @@
   function closeOverlay() {
     if (!overlay) return;
     overlay.setAttribute('aria-hidden', 'true');
+    setLiveScores(null);
     stopAnim();
     running = false; paused = false;
     try { if (lastFocused && typeof lastFocused.focus === 'function') lastFocused.focus(); } catch(e){}
@@ -290,6 +292,27 @@
 
   function showMessage(msg) { if (messageEl) messageEl.textContent = msg; }
 
+  // 逐次解析の直近の結果（scores: { brightness, clarity, ..., pitch }。null で消す）
+  const LIVE_LABELS = { brightness: '明るさ', clarity: '明瞭さ', sharpness: '鋭さ', smoothness: '滑らかさ', thickness: '厚さ' };
+  function setLiveScores(scores) {
+    if (!liveScoresEl) return;
+    liveScoresEl.textContent = '';
+    if (!scores) return;
+    const items = Object.entries(LIVE_LABELS)
+      .filter(([key]) => Number.isFinite(scores[key]))
+      .map(([key, label]) => [label, scores[key].toFixed(2)]);
+    if (Number.isFinite(scores.pitch) && scores.pitch > 0) items.push(['ピッチ', `${scores.pitch.toFixed(1)} Hz`]);
+    for (const [label, value] of items) {
+      const span = document.createElement('span');
+      span.className = 'live-score';
+      span.textContent = label;
+      const b = document.createElement('b');
+      b.textContent = value;
+      span.appendChild(b);
+      liveScoresEl.appendChild(span);
+    }
+  }
+
   function showProcessing(msg = '測定結果を解析しています…') {
     if (!processingModal || !processingText) return;
     processingText.textContent = msg;
@@ -340,6 +363,7 @@
     resume: resumeOverlay,
     stop: stopOverlay,
     setLevels,
+    setLiveScores,
     showMessage,
     showProcessing,
     hideProcessing,
@@ -34,6 +34,18 @@
   let countInTimeoutId = null;
   let countdownInProgress = false;
 
+  // 録音中の逐次解析（../api/recording/live/*）
+  // 録音中の PCM を LIVE_SEND_MS ごとにサーバーへ送り、確定した窓の結果をその場で表示する
+  // 停止時は upload に liveSession を付けると、サーバーは webm の変換・再解析をせずに結果を返す
+  const LIVE_SEND_MS = 250;
+  let liveSessionId = null;
+  let liveProcessor = null;
+  let liveSendTimer = null;
+  let liveBuffers = [];
+  let liveChain = Promise.resolve();
+  let liveStarting = Promise.resolve();
+  let liveFailed = false;
+
   // helpers
   function showMessage(text, visible = true) {
     if (!messageArea) return;
@@ -133,6 +145,127 @@
   }
   function stopAnalysisLoop() { if (analysisRaf) cancelAnimationFrame(analysisRaf); analysisRaf = null; }
 
+  // === Live analysis ===
+  // カウントインと並行してセッションを準備する（準備が終わるまでの音声は溜めておいて後で送る）
+  function startLive() {
+    liveSessionId = null;
+    liveBuffers = [];
+    liveFailed = false;
+    liveChain = Promise.resolve();
+    if (!audioContext || !mediaStream || !audioContext.createScriptProcessor) {
+      liveFailed = true;
+      liveStarting = Promise.resolve();
+      return liveStarting;
+    }
+
+    if (!liveProcessor) {
+      const source = audioContext.createMediaStreamSource(mediaStream);
+      liveProcessor = audioContext.createScriptProcessor(4096, 1, 1);
+      const mute = audioContext.createGain();
+      mute.gain.value = 0;
+      source.connect(liveProcessor);
+      liveProcessor.connect(mute);
+      mute.connect(audioContext.destination);
+    }
+    liveProcessor.onaudioprocess = (e) => {
+      // 一時停止中は MediaRecorder と同じく音声を捨てる
+      if (!isRecording || isPaused || liveFailed) return;
+      liveBuffers.push(new Float32Array(e.inputBuffer.getChannelData(0)));
+    };
+
+    liveStarting = (async () => {
+      try {
+        if (audioContext.state === 'suspended') await audioContext.resume();
+        const resp = await fetch('../api/recording/live/start', {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ sampleRate: audioContext.sampleRate, instrument: instrumentSelect?.value || '' })
+        });
+        if (!resp.ok) throw new Error(`HTTPエラー: ${resp.status}`);
+        const sessionId = (await resp.json()).sessionId;
+        // 準備中に破棄された場合はそのまま閉じる
+        if (liveFailed) { discardLive(sessionId); return; }
+        liveSessionId = sessionId;
+        liveSendTimer = setInterval(sendLiveChunk, LIVE_SEND_MS);
+      } catch (e) {
+        // 逐次解析が使えなくても録音は続ける（停止後に従来どおり解析される）
+        console.warn('逐次解析を開始できません', e);
+        liveFailed = true;
+        liveBuffers = [];
+      }
+    })();
+    return liveStarting;
+  }
+
+  function sendLiveChunk() {
+    if (!liveSessionId || liveFailed || liveBuffers.length === 0) return liveChain;
+    const total = liveBuffers.reduce((n, b) => n + b.length, 0);
+    const pcm = new Float32Array(total);
+    let offset = 0;
+    for (const b of liveBuffers) { pcm.set(b, offset); offset += b.length; }
+    liveBuffers = [];
+
+    // 音声の順番が入れ替わらないよう、前の送信が終わってから送る
+    const sessionId = liveSessionId;
+    liveChain = liveChain.then(async () => {
+      if (liveFailed) return;
+      try {
+        const resp = await fetch(`../api/recording/live/${encodeURIComponent(sessionId)}/chunk`, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/octet-stream' },
+          body: pcm.buffer
+        });
+        if (!resp.ok) throw new Error(`HTTPエラー: ${resp.status}`);
+        showLiveResult(await resp.json());
+      } catch (e) {
+        console.warn('逐次解析に失敗しました（停止後に解析し直します）', e);
+        liveFailed = true;
+      }
+    });
+    return liveChain;
+  }
+
+  function showLiveResult(result) {
+    if (!window.recordingUI || typeof window.recordingUI.setLiveScores !== 'function') return;
+    const win = result?.windows;
+    if (!win || !win.time || win.time.length === 0) return;
+    const last = win.time.length - 1;
+    const pitch = result.frames?.pitch?.filter((p) => p > 0).pop();
+    window.recordingUI.setLiveScores({
+      brightness: win.brightness?.[last],
+      clarity: win.clarity?.[last],
+      sharpness: win.sharpness?.[last],
+      smoothness: win.smoothness?.[last],
+      thickness: win.thickness?.[last],
+      pitch
+    });
+  }
+
+  // 残りを送り切り、アップロードに付けるセッション ID を返す（使えなければ null）
+  async function finishLive() {
+    await liveStarting;
+    if (liveSendTimer) { clearInterval(liveSendTimer); liveSendTimer = null; }
+    if (!liveSessionId) return null;
+    await sendLiveChunk();
+    const sessionId = liveSessionId;
+    liveSessionId = null;
+    if (liveFailed) {
+      discardLive(sessionId);
+      return null;
+    }
+    return sessionId;
+  }
+
+  function discardLive(sessionId = liveSessionId) {
+    if (liveSendTimer) { clearInterval(liveSendTimer); liveSendTimer = null; }
+    liveSessionId = null;
+    liveBuffers = [];
+    liveFailed = true;
+    if (sessionId) {
+      fetch(`../api/recording/live/${encodeURIComponent(sessionId)}`, { method: 'DELETE' }).catch(() => {});
+    }
+  }
+
   // === Visual metronome ===
   function startVisualMetronome(bpm, beatsPerBar) {
     stopVisualMetronome();
@@ -169,6 +302,9 @@
       stopAnalysisLoop();
       stopVisualMetronome();
 
+      const liveSession = discardRequested ? null : await finishLive();
+      if (discardRequested) discardLive();
+
       isRecording = false;
       isPaused = false;
 
@@ -189,16 +325,20 @@
 
         let soundId, data;
         try {
-          const resp = await sendRecording(blob, folderName);
+          const resp = await sendRecording(blob, folderName, liveSession);
           soundId = resp.soundId;
-          data = resp.data;
           if (window.recordingUI && typeof window.recordingUI.showMessage === 'function') {
             window.recordingUI.showMessage('アップロード完了');
           }
+          // 逐次解析の結果があれば data がすぐ返る。無ければ解析は順番待ちになるので終わるまで待つ
+          data = resp.jobId ? await waitForAnalysis(resp.jobId, soundId) : resp.data;
         } catch (e) {
           console.error('アップロード失敗', e);
           if (window.recordingUI && typeof window.recordingUI.showMessage === 'function') {
-            window.recordingUI.showMessage('アップロードに失敗しました');
+            // 503 は解析の待ちが上限に達していて受け付けられなかった
+            window.recordingUI.showMessage(e.status === 503
+              ? '解析が混み合っています。しばらくしてから録音し直してください'
+              : 'アップロードに失敗しました');
           }
         } finally {
           if (window.recordingUI && typeof window.recordingUI.hideProcessing === 'function') {
@@ -241,18 +381,52 @@
   function resumeRecording() { if (!mediaRecorder || mediaRecorder.state !== 'paused') return; mediaRecorder.resume(); isPaused = false; }
   function discardRecording() { discardRequested = true; if (mediaRecorder && mediaRecorder.state !== 'inactive') mediaRecorder.stop(); else chunks = []; }
 
-  async function sendRecording(blob, folderName) {
+  async function sendRecording(blob, folderName, liveSession = null) {
     const form = new FormData();
+    if (liveSession) form.append('liveSession', liveSession);
     form.append('file', blob, 'recording.webm');
     form.append('bpm', tempoInput?.value || '120');
     form.append('beats', (timeSigSelect?.value || '4/4').split('/')[0]);
     form.append('countInBars', countInSelect?.value || '1');
     const url = `../api/recording/upload/${encodeURIComponent(folderName)}`;
     const resp = await fetch(url, { method: 'POST', body: form });
-    if (!resp.ok) throw new Error(`HTTPエラー: ${resp.status}`);
+    if (!resp.ok) throw Object.assign(new Error(`HTTPエラー: ${resp.status}`), { status: resp.status });
     return resp.json();
   }
 
+  // アップロード後の解析ジョブの状態を、終わるまで間隔を空けながら問い合わせる
+  // 解析ジョブの結果を待つ
+  // サーバーが再起動するとジョブの状態は消える（jobs/:id が 404）ので、録音の解析結果を取り直す
+  // （結果が無ければサーバーが解析し直し、新しい jobId を返す）
+  async function waitForAnalysis(jobId, soundId) {
+    let delay = 1000;
+    let recovered = 0;
+    for (;;) {
+      const resp = await fetch(`../api/recording/jobs/${encodeURIComponent(jobId)}`);
+      if (resp.status === 404 && recovered < 3) {
+        recovered++;
+        const found = await fetch(`../api/recording/sounds/${encodeURIComponent(soundId)}/analysis`);
+        if (!found.ok) throw new Error(`HTTPエラー: ${found.status}`);
+        const result = await found.json();
+        if (result.state === 'done') return result.data;
+        if (result.state === 'failed') return { id: soundId, error: result.error || '解析に失敗しました' };
+        jobId = result.jobId;
+        continue;
+      }
+      if (!resp.ok) throw new Error(`HTTPエラー: ${resp.status}`);
+      const job = await resp.json();
+      if (job.state === 'done') return job.data;
+      if (job.state === 'failed') return { id: soundId, error: job.error || '解析に失敗しました' };
+      if (window.recordingUI && typeof window.recordingUI.showProcessing === 'function') {
+        window.recordingUI.showProcessing(job.state === 'queued'
+          ? `解析の順番待ちです（${job.position} 番目）…`
+          : '測定結果を解析しています…');
+      }
+      await new Promise(r => setTimeout(r, delay));
+      delay = Math.min(delay * 1.5, 5000);
+    }
+  }
+
   // === Countdown / count-in flow ===
   async function startCountdownFlow() {
     if (isRecording) { stopRecording(); return; }
@@ -264,6 +438,7 @@
     const countInBars = parseInt(countInSelect?.value, 10) || 1; // 何小節分カウントするか
 
     await initMedia();
+    startLive();
 
     // UI の showCountdownBPM を順に実行
     
@@ -308,6 +483,7 @@
   window.addEventListener('beforeunload', () => {
     stopVisualMetronome();
     stopAnalysisLoop();
+    discardLive();
     if (audioContext?.close) { try { audioContext.close(); } catch (e) {} audioContext = null; }
     if (mediaStream) { try { mediaStream.getTracks().forEach(t => t.stop()); } catch (e) {} mediaStream = null; }
 
@@ -2,6 +2,8 @@ import express, { Request, Response } from 'express';
 import os from 'os';
 import { Pool } from 'pg';
 import cookieParser from 'cookie-parser';
+import { startAnalyzerPool } from './analyzer/analyzerPool';
+import { restoreAnalysisJobs } from './analyzer/analysisJobs';
 
 const app = express();
 const port = 3000;
@@ -49,6 +51,25 @@ async function initDb() {
       FOREIGN KEY (userId) REFERENCES users(id) ON DELETE SET NULL,
       FOREIGN KEY (songId) REFERENCES songs(id) ON DELETE SET NULL
     );
+
+    -- アップロードされた録音の解析ジョブ（analyzer/analysisJobs.ts。解析結果そのものは録音の隣の .cols）
+    CREATE TABLE IF NOT EXISTS analysis_jobs (
+      id TEXT PRIMARY KEY,
+      soundId INTEGER NOT NULL,
+      organization TEXT NOT NULL,
+      userId INTEGER,
+      state VARCHAR(16) NOT NULL,
+      engine VARCHAR(16) NOT NULL,
+      preset VARCHAR(16),
+      error TEXT,
+      createdAt TIMESTAMPTZ NOT NULL,
+      startedAt TIMESTAMPTZ,
+      finishedAt TIMESTAMPTZ,
+      FOREIGN KEY (soundId) REFERENCES sounds(id) ON DELETE CASCADE,
+      FOREIGN KEY (userId) REFERENCES users(id) ON DELETE SET NULL
+    );
+    CREATE INDEX IF NOT EXISTS analysis_jobs_sound ON analysis_jobs (soundId, createdAt);
+    CREATE INDEX IF NOT EXISTS analysis_jobs_state ON analysis_jobs (state);
   `);
 
   // 初期データ
@@ -192,6 +213,12 @@ initDb()
       console.log(`[backend] listening on:`);
       console.log(`  Local:   http://localhost:${port}/login`);
     });
+    // 解析ワーカーを先に起動しておく（モデル読み込みを最初のアップロードまで待たない）
+    startAnalyzerPool();
+    // 再起動前に終わらなかった解析ジョブを順番待ちに入れ直す
+    restoreAnalysisJobs()
+      .then((n) => { if (n > 0) console.log(`[backend] 解析ジョブを ${n} 件入れ直しました`); })
+      .catch((err) => console.error('[backend] 解析ジョブを入れ直せません:', err));
   })
   .catch(err => {
     console.error('[backend] init error:', err);
@@ -2,7 +2,7 @@ import express, { Request, Response } from 'express';
 import fs from "fs";
 import path from "path";
 import { Pool } from 'pg';
-import { spawn } from "child_process";
+import { runAnalyzer } from "../../analyzer/analyzerPool";
 
 const router = express.Router();
 
@@ -82,9 +82,6 @@ router.use(express.static(path.join(__dirname, '../frontend/private')));
 // アップロードディレクトリのルートを指定
 const UPLOAD_FOLDER = path.join(__dirname, '../../', 'uploads');
 
-// Python 実行環境とスクリプトパス
-const pythonPath = "/usr/bin/python3";
-
 // -------------------------------
 //このコードはJSON を返します
 // -------------------------------
@@ -108,123 +105,162 @@ router.get('/items', async (req: Request, res: Response) => {
     return res.status(404).json({ error: "音声ファイルが存在しません" });
   }
 
-  const results = [];
-  // それぞれの録音データのpklファイルを読む
-  const readscriptPath = path.join(__dirname, "../../analyzer", "read_pickle.py");
+  // 協調度は解析結果の読み込みと並行して別のワーカーで計算する
+  let harmonyPromise: Promise<any> | null = null;
+  if (soundFiles.length > 1) {
+    let files = []
+    for (const { filepath } of soundFiles) {
+      // 録音（webm）を渡す。保存済みの f0（.cols）が無いときは ffmpeg のパイプで読み込んで計算する
+      files.push(UPLOAD_FOLDER + '/' + filepath);
+    }
 
-  for (const { id, filepath } of soundFiles) {
+    harmonyPromise = runAnalyzer("harmony", files)
+      .then((stdoutData) => {
+        try {
+          const result = JSON.parse(stdoutData);
+          const length = Array.isArray(result) ? result.length : 0;
+          const arrayData = [];
+          for (let i = 0; i < length; i++) {
+            arrayData.push({
+              degree: result[i],
+            });
+          }
+          return { harmony: arrayData };
+        } catch (err) {
+          console.error("JSON parse error:", err);
+          return { error: "JSON 変換エラー" };
+        }
+      })
+      .catch((err) => {
+        console.error("[feedback] Python(harmony_analize) 実行エラー:", err);
+        return { error: "Python(harmony_analize) 実行エラー" };
+      });
+  }
+
+  // それぞれの録音データの解析結果を 1 回のジョブでまとめて読む（常駐ワーカーで処理）
+  // 列指向ファイル（.cols）を優先し、変換前の .pkl しか無ければそちらを読む
+  const results: any[] = new Array(soundFiles.length);
+  const batchPaths: string[] = [];
+  const batchSlots: number[] = [];
+  soundFiles.forEach(({ id, filepath }, slot) => {
     console.log(`[feedback] 表示するファイルのパス: ${filepath}`);
-    const audioPath = path.join(UPLOAD_FOLDER, filepath).replace(".webm", ".pkl");
+    const colsPath = path.join(UPLOAD_FOLDER, filepath).replace(".webm", ".cols");
+    const pklPath = path.join(UPLOAD_FOLDER, filepath).replace(".webm", ".pkl");
+    const audioPath = fs.existsSync(colsPath) ? colsPath : pklPath;
 
     if (!fs.existsSync(audioPath)) {
-      results.push({ id, error: "音声ファイルが存在しません" });
-      continue;
+      results[slot] = { id, error: "音声ファイルが存在しません" };
+      return;
     }
+    batchPaths.push(audioPath);
+    batchSlots.push(slot);
+  });
 
-    const pythonProcess = spawn(pythonPath, [readscriptPath, audioPath]);
-
-    let stdoutData = "";
-    let stderrData = "";
-
-    pythonProcess.stdout.on("data", (chunk) => {
-      stdoutData += chunk.toString();
-    });
-
-    pythonProcess.stderr.on("data", (chunk) => {
-      stderrData += chunk.toString();
-    });
-
-    // Promise で待機
-    const singleResult: any = await new Promise((resolve) => {
-      pythonProcess.on("close", (code) => {
-        if (code !== 0) {
-          console.error(`Python process exited with code ${code}`);
-          console.error(stderrData);
-          resolve({ id, error: "Python(read_pickle) 実行エラー" });
-        } else {
-          try {
-            const result = JSON.parse(stdoutData);
-            const length = result.pitch.length;
-            const analysis = [];
-            for (let i = 0; i < length; i++) {
-              analysis.push({
-                brightness: result.brightness[i],
-                clarity: result.clarity[i],
-                sharpness: result.sharpness[i],
-                smoothness: result.smoothness[i],
-                thickness: result.thickness[i],
-                pitch: result.pitch[i],
-                volume: result.volume[i],
-              });
-            }
-            const filename = path.parse(filepath).name;
-            const view_name = formatFilename(filename);
-            const option = parseBpmAndMeterOne(filepath);
-            console.log(`option.bpm: ${option.bpm}`);
-            resolve({ id, analysis, filepath, view_name, option });
-          } catch (err) {
-            console.error("JSON parse error:", err);
-            resolve({ id, error: "JSON 変換エラー" });
-          }
-          console.log('[recording] Python 処理完了');
+  if (batchPaths.length > 0) {
+    // ファイルごとの結果 {index, path, ok, data | error}。index は batchPaths の位置
+    // ワーカーが 1 ファイル読み終わるごとに届くので、残りを読んでいる間に画面用の形にしておく
+    const onRecord = (record: any) => {
+      const slot = batchSlots[record.index];
+      if (slot === undefined) return;
+      const { id, filepath } = soundFiles[slot];
+      if (!record.ok) {
+        console.error(`[feedback] Python(read_pickle) 読み込みエラー: ${record.path}: ${record.error}`);
+        results[slot] = { id, error: "Python(read_pickle) 実行エラー" };
+        return;
+      }
+      try {
+        const result = record.data;
+        const length = result.pitch.length;
+        const analysis = [];
+        for (let i = 0; i < length; i++) {
+          analysis.push({
+            brightness: result.brightness[i],
+            clarity: result.clarity[i],
+            sharpness: result.sharpness[i],
+            smoothness: result.smoothness[i],
+            thickness: result.thickness[i],
+            pitch: result.pitch[i],
+            volume: result.volume[i],
+          });
         }
-      });
-    });
-
-    results.push(singleResult);
+        const filename = path.parse(filepath).name;
+        const view_name = formatFilename(filename);
+        const option = parseBpmAndMeterOne(filepath);
+        console.log(`option.bpm: ${option.bpm}`);
+        results[slot] = { id, analysis, filepath, view_name, option };
+      } catch (err) {
+        console.error("JSON parse error:", err);
+        results[slot] = { id, error: "JSON 変換エラー" };
+      }
+    };
+    try {
+      await runAnalyzer("read_pickle_batch", batchPaths, {}, onRecord);
+      console.log('[recording] Python 処理完了');
+    } catch (err) {
+      console.error("[feedback] Python(read_pickle) 実行エラー:", err);
+    }
+    // 応答に含まれなかったファイル（ワーカーの異常終了など）はエラーにする
+    for (const slot of batchSlots) {
+      if (!results[slot]) {
+        results[slot] = { id: soundFiles[slot].id, error: "Python(read_pickle) 実行エラー" };
+      }
+    }
   }
 
   // 協調度を受け取る
-  const harmonyscriptPath = path.join(__dirname, "../../analyzer", "harmony_analize.py");
-
-  if (soundFiles.length > 1) {
-    let files = []
-    for (const { filepath } of soundFiles) {
-      files.push(UPLOAD_FOLDER + '/' + filepath.replace("webm", "wav"));
-    }
-    const args = [harmonyscriptPath, ...files];
-    const pythonProcess = spawn(pythonPath, args);
+  if (harmonyPromise) {
+    results.push(await harmonyPromise);
+  }
 
-    let stdoutData = "";
-    let stderrData = "";
+  // 複数ファイル分の解析結果を返す
+  return res.json(results);
+});
 
-    pythonProcess.stdout.on("data", (chunk) => {
-      stdoutData += chunk.toString();
-    });
+// -------------------------------
+// グラフ表示用の縮約（lod.py）
+// /items/:id/lod?start=10&end=70&width=1200&series=pitch,volume
+// 時間範囲（秒）を横幅（ピクセル）に描くのにちょうどよい粒度の min / max / mean を返す
+// -------------------------------
+const LOD_MAX_WIDTH = 8192;
 
-    pythonProcess.stderr.on("data", (chunk) => {
-      stderrData += chunk.toString();
-    });
+router.get('/items/:id/lod', async (req: Request, res: Response) => {
+  const id = Number(req.params.id);
+  if (!Number.isInteger(id)) {
+    return res.status(400).json({ error: "id が不正です" });
+  }
+  const start = req.query.start !== undefined ? Number(req.query.start) : 0;
+  const end = req.query.end !== undefined ? Number(req.query.end) : undefined;
+  const width = req.query.width !== undefined ? Number(req.query.width) : 1000;
+  if (!Number.isFinite(start) || start < 0 || (end !== undefined && !(Number.isFinite(end) && end > start))
+      || !Number.isInteger(width) || width < 1 || width > LOD_MAX_WIDTH) {
+    return res.status(400).json({ error: "start / end / width が不正です" });
+  }
+  const series = typeof req.query.series === "string" && req.query.series
+    ? req.query.series.split(",").filter(Boolean)
+    : undefined;
 
-    const harmony: any = await new Promise((resolve) => {
-      pythonProcess.on("close", (code) => {
-        if (code !== 0) {
-          console.error(`Python process exited with code ${code}`);
-          console.error(stderrData);
-          resolve({ error: "Python(harmony_analize) 実行エラー" });
-        } else {
-          try {
-            const result = JSON.parse(stdoutData);
-            const length = Array.isArray(result) ? result.length : 0;
-            const arrayData = [];
-            for (let i = 0; i < length; i++) {
-              arrayData.push({
-                degree: result[i],
-              });
-            }
-            resolve({ harmony: arrayData });
-          } catch (err) {
-            console.error("JSON parse error:", err);
-            resolve({ error: "JSON 変換エラー" });
-          }
-        }
-      });
-    });
-    results.push(harmony);
+  const [soundFile] = await getFilePaths(id);
+  if (!soundFile) {
+    return res.status(404).json({ error: "音声ファイルが存在しません" });
+  }
+  const colsPath = path.join(UPLOAD_FOLDER, soundFile.filepath).replace(".webm", ".cols");
+  const pklPath = path.join(UPLOAD_FOLDER, soundFile.filepath).replace(".webm", ".pkl");
+  const analysisPath = fs.existsSync(colsPath) ? colsPath : pklPath;
+  if (!fs.existsSync(analysisPath)) {
+    return res.status(404).json({ error: "解析結果が存在しません" });
   }
 
-  // 複数ファイル分の解析結果を返す
-  return res.json(results);
+  try {
+    const output = await runAnalyzer("lod", [analysisPath], { start, end, width, series });
+    res.type("application/json").send(output);
+  } catch (err) {
+    // 存在しない系列の指定（lod.check_names）は 400
+    if (err instanceof Error && err.message.startsWith("ValueError: unknown series")) {
+      return res.status(400).json({ error: err.message.replace(/^ValueError: /, "") });
+    }
+    console.error("[feedback] Python(lod) 実行エラー:", err);
+    res.status(500).json({ error: "Python(lod) 実行エラー" });
+  }
 });
 
 // 拡張子→MIME の簡易マップ（必要に応じて追加）
@@ -122,7 +122,7 @@ router.post("/delete-files", async (req: Request, res: Response) => {
     const filepaths = resDb.rows.map(row => row.filepath);
     for (const filepath of filepaths) {
       const baseName = filepath.split('.')[0];
-      const extensions = ['webm', 'pkl', 'wav'];
+      const extensions = ['webm', 'cols', 'pkl', 'wav'];
 
       for (const ext of extensions) {
         const fullPath = path.join(UPLOAD_ROOT, `${baseName}.${ext}`);
@@ -4,7 +4,13 @@ import path from "path";
 import { Pool } from 'pg';
 import jwt from 'jsonwebtoken';
 import ffmpeg from "fluent-ffmpeg";
-import { spawn } from "child_process";
+import { runAnalyzer, pendingAnalyzerJobs, AnalyzerOptions } from "../../analyzer/analyzerPool";
+import { analyzerMetricsSnapshot } from "../../analyzer/analyzerMetrics";
+import {
+  type AnalysisJob, setAnalysisJobStore, submitAnalysisJob, findAnalysisJob, latestAnalysisJob,
+  analysisQueueFull, analysisQueuePosition, queuedAnalysisJobs,
+} from "../../analyzer/analysisJobs";
+import { startLiveSession, pushLive, finishLive, abortLive, hasLiveSession } from "../../analyzer/liveSession";
 import multer, { Multer } from "multer";
 
 import cookieParser from 'cookie-parser';
@@ -85,17 +91,6 @@ const storage = multer.diskStorage({
 });
 const upload: Multer = multer({ storage: storage });
 
-// WAV 変換関数
-function convertWebmToWav(inputPath: string, outputPath: string) {
-  return new Promise<void>((resolve, reject) => {
-    ffmpeg(inputPath)
-      .toFormat("wav")
-      .on("end", () => resolve())
-      .on("error", (err) => reject(err))
-      .save(outputPath);
-  });
-}
-
 function trimWav(inputPath: string, outputPath: string, offsetSec: number) {
   return new Promise<void>((resolve, reject) => {
     ffmpeg(inputPath)
@@ -150,10 +145,107 @@ export function parseBpmAndMeterOne(filepath: string): ParsedInfo {
   return { songTitle, bpm, beats };
 }
 
+// アップロード時のピッチ推定エンジン（既定は高速な yin、フォームで pitchEngine=pyin を指定すると従来の pyin）
+type PitchEngine = NonNullable<AnalyzerOptions["pitch_engine"]>;
+const PITCH_ENGINES: PitchEngine[] = ["pyin", "pyin_narrow", "yin"];
+const UPLOAD_PITCH_ENGINE = (process.env.UPLOAD_PITCH_ENGINE ?? "yin") as PitchEngine;
+
+function selectPitchEngine(requested: unknown): PitchEngine {
+  return PITCH_ENGINES.find((e) => e === requested) ?? UPLOAD_PITCH_ENGINE;
+}
 
-// Python 実行環境とスクリプトパス
-const pythonPath = "/usr/bin/python3";
-const scriptPath = path.join(__dirname, "../../analyzer", "analyze_audio.py");
+// 解析の品質プリセット（フォームで preset を指定しなければ、待ちのジョブが多いときだけ軽いものにする）
+// 解析の順番が来たときに選ぶので、待っている間に空けば full で解析する
+type Preset = NonNullable<AnalyzerOptions["preset"]>;
+const PRESETS: Preset[] = ["full", "balanced", "fast"];
+const UPLOAD_PRESET = (process.env.UPLOAD_ANALYSIS_PRESET ?? "full") as Preset;
+const BUSY_PRESET = (process.env.BUSY_ANALYSIS_PRESET ?? "fast") as Preset;
+const BUSY_PENDING_JOBS = parseInt(process.env.BUSY_PENDING_JOBS ?? "4", 10) || 4;
+
+function selectPreset(requested: unknown): Preset {
+  const preset = PRESETS.find((p) => p === requested);
+  if (preset) return preset;
+  return pendingAnalyzerJobs() + queuedAnalysisJobs() >= BUSY_PENDING_JOBS ? BUSY_PRESET : UPLOAD_PRESET;
+}
+
+// 解析結果（analyze_audio.py / read_pickle.py の出力）を画面用の形にする
+// filepath: UPLOAD_FOLDER からの相対パス（団体/楽器/曲名_BPM_拍子/ファイル名.webm）
+function toSingleResult(stdoutData: string, soundId: number, filepath: string) {
+  const result = JSON.parse(stdoutData);
+  const length = result.brightness.length;
+  const analysis = [];
+  for (let i = 0; i < length; i++) {
+    analysis.push({
+      brightness: result.brightness[i],
+      clarity: result.clarity[i],
+      sharpness: result.sharpness[i],
+      smoothness: result.smoothness[i],
+      thickness: result.thickness[i],
+      pitch: result.pitch[i],
+      volume: result.volume[i],
+    });
+  }
+  const view_name = formatFilename(path.posix.basename(filepath).replace(".webm", ""));
+  const option = parseBpmAndMeterOne(filepath);
+  return { id: soundId, analysis, filepath, view_name, option };
+}
+
+// 録音の持ち主と UPLOAD_FOLDER からの相対パス（団体/楽器/曲名_BPM_拍子/ファイル名.webm）
+async function findSound(soundId: number): Promise<{ userId: number | null; filepath: string } | null> {
+  const found = await pool.query(`
+    SELECT s.userId AS userid, songs.folderPath || '/' || s.filename AS filepath
+    FROM sounds s
+    LEFT JOIN songs ON s.songId = songs.id
+    WHERE s.id = $1
+  `, [soundId]);
+  const sound = found.rows[0];
+  return sound && sound.filepath ? { userId: sound.userid, filepath: sound.filepath } : null;
+}
+
+// 保存済みの解析結果（.cols / .pkl）を画面用の形で読む（無ければ null）
+async function readSavedAnalysis(soundId: number, filepath: string) {
+  const audioPath = path.join(UPLOAD_FOLDER, filepath);
+  const analysisPath = [".cols", ".pkl"].map((ext) => audioPath.replace(/\.webm$/, ext)).find((p) => fs.existsSync(p));
+  if (!analysisPath) return null;
+  return toSingleResult(await runAnalyzer("read_pickle", [analysisPath]), soundId, filepath);
+}
+
+// 順番が来た解析ジョブを常駐ワーカー（モデル読み込み済み）で解析する
+async function runUploadAnalysis(job: AnalysisJob) {
+  const sound = await findSound(job.soundId);
+  if (!sound) throw new Error("録音がありません");
+  const audioPath = path.join(UPLOAD_FOLDER, sound.filepath);
+  const preset = selectPreset(job.preset);
+  job.preset = preset;
+  const stdoutData = await runAnalyzer("analyze", [audioPath], { pitch_engine: selectPitchEngine(job.engine), preset })
+    .catch((err) => {
+      console.error("[recording] Python(analyze_audio) 実行エラー:", err);
+      throw new Error("Python(analyze_audio) 実行エラー");
+    });
+  try {
+    const singleResult = toSingleResult(stdoutData, job.soundId, sound.filepath);
+    console.log('[recording] Python 処理完了');
+    return singleResult;
+  } catch (err) {
+    console.error("JSON parse error:", err);
+    throw new Error("JSON 変換エラー");
+  }
+}
+
+// 解析ジョブは analysis_jobs テーブルにも書く（再起動後に入れ直し、終わったジョブの状態もそこから返す）
+setAnalysisJobStore(pool, runUploadAnalysis);
+
+// 解析ジョブを順番待ちに入れる（プリセットの指定が無ければ順番が来たときに選ぶ）
+function submitUploadAnalysis(soundId: number, filepath: string, userId: number | null,
+                              pitchEngine: PitchEngine, requestedPreset: unknown) {
+  return submitAnalysisJob({
+    soundId,
+    organization: filepath.split("/")[0],
+    userId,
+    engine: pitchEngine,
+    preset: PRESETS.find((p) => p === requestedPreset) ?? null,
+  });
+}
 
 router.post('/upload/:path', upload.single('file'), async (req: Request, res: Response) => {
   try {
@@ -161,6 +253,14 @@ router.post('/upload/:path', upload.single('file'), async (req: Request, res: Re
       return res.status(400).json({ success: false, message: 'ファイルがありません' });
     }
 
+    // 解析の待ちが上限に達していれば、保存せずに断る（逐次解析の結果があるものは解析しないので受け付ける）
+    const liveSession = String((req.body as any).liveSession ?? '');
+    if (!hasLiveSession(liveSession) && analysisQueueFull()) {
+      await fs.promises.unlink(req.file.path).catch(() => {});
+      res.set('Retry-After', '30');
+      return res.status(503).json({ success: false, message: '解析が混み合っています。しばらくしてから送り直してください' });
+    }
+
     const folder = req.params.path || 'default';
 
     // 団体名を抽出
@@ -182,10 +282,26 @@ router.post('/upload/:path', upload.single('file'), async (req: Request, res: Re
     // データベース登録
     const soundId = await createSound(filename, payload?.userId, folder, organizationName);
 
-    // wav に変換
-    const newFilename = filename.replace('.webm', '.wav');
-    const audioPath = path.join(targetDir, newFilename);
-    await convertWebmToWav(targetPath, audioPath);
+    // webm は wav に変換せず、解析側（audio_decode.py）が ffmpeg のパイプで直接読む
+    const audioPath = targetPath;
+    const pitchEngine = selectPitchEngine((req.body as any).pitchEngine);
+    const requestedPreset = (req.body as any).preset;
+
+    // 録音中に逐次解析していれば、セッションが解析結果（.cols）を書き出すので、それをすぐ返す
+    // （逐次解析は yin・full 相当のみ。失敗したときは従来どおりアップロードされた webm から解析する）
+    // セッションは停止時に録音全体の値で求め直すので、アップロードされた webm を解析し直す必要はない
+    let liveOutput: string | null = null;
+    if (liveSession && hasLiveSession(liveSession)) {
+      // 結果が手元にあるので、混んでいても（プリセットの指定が無ければ）その場では解析し直さない
+      if (pitchEngine === "yin" && selectPreset(requestedPreset ?? "full") === "full") {
+        liveOutput = await finishLive(liveSession, audioPath).catch((err) => {
+          console.error("[recording] 逐次解析の結果を使えないため解析し直します:", err);
+          return null;
+        });
+      } else {
+        await abortLive(liveSession);
+      }
+    }
 
     // フォームから取得
     const bpm = parseFloat((req.body as any).bpm) || 120;
@@ -207,65 +323,148 @@ router.post('/upload/:path', upload.single('file'), async (req: Request, res: Re
       return res.status(404).json({ error: "音声ファイルが存在しません" });
     }
 
+    const filepath = path.posix.join(folder, filename);
+
+    // 逐次解析の結果があれば、そのまま返す
+    if (liveOutput !== null) {
+      let singleResult: any;
+      try {
+        singleResult = toSingleResult(liveOutput, soundId, filepath);
+      } catch (err) {
+        console.error("JSON parse error:", err);
+        singleResult = { id: soundId, error: "JSON 変換エラー" };
+      }
+      return res.json({ success: true, message: 'pklファイル保存完了', path: targetPath, soundId: soundId, data: singleResult });
+    }
 
-    const pythonProcess = spawn(pythonPath, [scriptPath, audioPath]);
-
-    let stdoutData = "";
-    let stderrData = "";
+    // 解析は順番待ちに入れてすぐ返す（画面は jobs/:id を問い合わせて結果を待つ）
+    const job = submitUploadAnalysis(soundId, filepath, payload?.userId ?? null, pitchEngine, requestedPreset);
 
-    pythonProcess.stdout.on("data", (chunk) => {
-      stdoutData += chunk.toString();
+    res.status(202).json({
+      success: true, message: 'pklファイル保存完了', path: targetPath, soundId: soundId,
+      jobId: job.id, state: job.state, position: analysisQueuePosition(job),
     });
+  } catch (error) {
+    console.error('アップロードエラー:', error);
+    res.status(500).json({ success: false, message: 'サーバーエラー', error: String(error) });
+  }
+});
 
-    pythonProcess.stderr.on("data", (chunk) => {
-      stderrData += chunk.toString();
+// 解析ジョブの状態（アップロードの応答の jobId で問い合わせる。done なら data に解析結果が入る）
+// 終わってから時間が経った・再起動をはさんだジョブは analysis_jobs テーブルから返す（done の結果は .cols から読む）
+router.get('/jobs/:id', async (req: Request, res: Response) => {
+  try {
+    const job = await findAnalysisJob(req.params.id);
+    const payload = jwt.decode(req.cookies.auth_token) as { userId: number } | null;
+    if (!job || job.userId !== (payload?.userId ?? null)) {
+      return res.status(404).json({ success: false, message: 'ジョブがありません' });
+    }
+    let data = job.state === "done" ? job.result : undefined;
+    if (job.state === "done" && data === null) {
+      const sound = await findSound(job.soundId);
+      data = sound ? await readSavedAnalysis(job.soundId, sound.filepath) : null;
+      if (!data) {
+        return res.status(404).json({ success: false, message: '解析結果がありません' });
+      }
+    }
+    res.json({
+      success: true, jobId: job.id, state: job.state, position: analysisQueuePosition(job),
+      data, error: job.error,
     });
+  } catch (err) {
+    console.error('[recording] 解析ジョブの取得エラー:', err);
+    res.status(500).json({ success: false, message: 'サーバーエラー', error: String(err) });
+  }
+});
 
-    pythonProcess.on("exit", (code, signal) => {
-      console.log("[recording] Python exited with code", code, "signal", signal);
-    });
+// 録音の解析結果（jobs/:id が 404 のとき、画面はこちらで結果を取り直す）
+// - 最後のジョブが順番待ち・解析中ならその jobId、失敗していればその error を返す（解析し直さない）
+// - 解析結果（.cols / .pkl）があれば done として返す
+// - どちらも無ければ（ジョブの記録が無い録音など）解析を順番待ちに入れ、新しい jobId を返す
+router.get('/sounds/:id/analysis', async (req: Request, res: Response) => {
+  const soundId = Number(req.params.id);
+  if (!Number.isInteger(soundId)) {
+    return res.status(400).json({ success: false, message: 'id が不正です' });
+  }
+  const payload = jwt.decode(req.cookies.auth_token) as { userId: number } | null;
+  const userId = payload?.userId ?? null;
+  try {
+    const sound = await findSound(soundId);
+    if (!sound || sound.userId !== userId) {
+      return res.status(404).json({ success: false, message: '録音がありません' });
+    }
+    const filepath = sound.filepath;
+    const latest = await latestAnalysisJob(soundId);
+    if (latest && (latest.state === "queued" || latest.state === "running")) {
+      return res.status(202).json({ success: true, jobId: latest.id, state: latest.state, position: analysisQueuePosition(latest) });
+    }
+    if (latest && latest.state === "failed") {
+      return res.json({ success: true, jobId: latest.id, state: "failed", error: latest.error });
+    }
+    const data = await readSavedAnalysis(soundId, filepath);
+    if (data) {
+      return res.json({ success: true, state: "done", data });
+    }
+    if (!fs.existsSync(path.join(UPLOAD_FOLDER, filepath))) {
+      return res.status(404).json({ success: false, message: '音声ファイルが存在しません' });
+    }
+    if (analysisQueueFull()) {
+      res.set('Retry-After', '30');
+      return res.status(503).json({ success: false, message: '解析が混み合っています。しばらくしてから開き直してください' });
+    }
+    const job = submitUploadAnalysis(soundId, filepath, userId, selectPitchEngine(undefined), undefined);
+    console.log(`[recording] 解析ジョブの記録が無いため解析します: sound=${soundId}`);
+    res.status(202).json({ success: true, jobId: job.id, state: job.state, position: analysisQueuePosition(job) });
+  } catch (err) {
+    console.error('[recording] 解析結果の取得エラー:', err);
+    res.status(500).json({ success: false, message: 'サーバーエラー', error: String(err) });
+  }
+});
 
-    const singleResult: any = await new Promise((resolve) => {
-      pythonProcess.on("close", (code) => {
-        if (code !== 0) {
-          console.error(`Python process exited with code ${code}`);
-          console.error(stderrData);
-          resolve({ id: soundId, error: "Python(read_pickle) 実行エラー" });
-        } else {
-          try {
-            const result = JSON.parse(stdoutData);
-            const length = result.brightness.length;
-            const analysis = [];
-            for (let i = 0; i < length; i++) {
-              analysis.push({
-                brightness: result.brightness[i],
-                clarity: result.clarity[i],
-                sharpness: result.sharpness[i],
-                smoothness: result.smoothness[i],
-                thickness: result.thickness[i],
-                pitch: result.pitch[i],
-                volume: result.volume[i],
-              });
-            }
-            const filepath = path.posix.join(folder, filename);
-            const view_name = formatFilename(filename.replace(".webm", ""));
-            const option = parseBpmAndMeterOne(filepath);
-            resolve({ id: soundId, analysis, filepath, view_name, option });
-          } catch (err) {
-            console.error("JSON parse error:", err);
-            resolve({ id: soundId, error: "JSON 変換エラー" });
-          }
-          console.log('[recording] Python 処理完了');
-        }
-      });
-    });
+// === 録音中の逐次解析 ===
+// 録音開始時に start、録音中は PCM（モノラル float32）を chunk で送り、停止時は upload に liveSession を付ける
+router.post('/live/start', async (req: Request, res: Response) => {
+  const sampleRate = Number(req.body?.sampleRate);
+  if (!Number.isFinite(sampleRate) || sampleRate < 8000 || sampleRate > 192000) {
+    return res.status(400).json({ success: false, message: 'sampleRate が不正です' });
+  }
+  const instrument = typeof req.body?.instrument === 'string' ? req.body.instrument : undefined;
+  try {
+    const { sessionId, latencyMs } = await startLiveSession(sampleRate, instrument);
+    res.json({ success: true, sessionId, latencyMs });
+  } catch (error) {
+    console.error('[recording] 逐次解析の開始エラー:', error);
+    res.status(503).json({ success: false, message: '逐次解析を開始できません', error: String(error) });
+  }
+});
 
-    res.json({ success: true, message: 'pklファイル保存完了', path: targetPath, soundId: soundId, data: singleResult });
+router.post('/live/:id/chunk', express.raw({ type: 'application/octet-stream', limit: '16mb' }), async (req: Request, res: Response) => {
+  const sessionId = req.params.id;
+  if (!hasLiveSession(sessionId)) {
+    return res.status(404).json({ success: false, message: 'セッションがありません' });
+  }
+  const body = req.body;
+  if (!Buffer.isBuffer(body) || body.length % 4 !== 0) {
+    return res.status(400).json({ success: false, message: 'float32 の PCM を送ってください' });
+  }
+  try {
+    // 新しく確定したフレーム（pitch / volume）と窓（brightness など）の結果
+    res.type('application/json').send(await pushLive(sessionId, body));
   } catch (error) {
-    console.error('アップロードエラー:', error);
-    res.status(500).json({ success: false, message: 'サーバーエラー', error: String(error) });
+    console.error('[recording] 逐次解析エラー:', error);
+    res.status(500).json({ success: false, message: '逐次解析エラー', error: String(error) });
   }
 });
 
+router.delete('/live/:id', async (req: Request, res: Response) => {
+  await abortLive(req.params.id);
+  res.json({ success: true });
+});
+
+// 解析ワーカーの処理ごとの時間・メモリの集計（ANALYZER_METRICS=stderr で起動したときのみ中身がある）
+router.get('/analyzer/metrics', (_req: Request, res: Response) => {
+  res.json({ success: true, spans: analyzerMetricsSnapshot() });
+});
+
 
 module.exports = router;
\ No newline at end of file
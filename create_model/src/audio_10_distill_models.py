@@ -0,0 +1,148 @@
+import os
+import sys
+import time
+import pickle
+import argparse
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor, HistGradientBoostingRegressor
+from sklearn.linear_model import Ridge
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import mean_squared_error
+
+# モデルバンドルの形式はアプリ側（HarmonyAnalyzer/src/analyzer/model_bundle.py）と共通
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "..", "HarmonyAnalyzer", "src", "analyzer"))
+from model_bundle import ModelBundle
+
+# 5 指標のモデルの候補を学習し、MSE・ファイルサイズ・読み込み時間・予測速度の表を出す
+#
+#   rf_separate : audio_8_randomforest.py と同じ 指標ごとの RandomForest（200 本 × 5）
+#   rf_multi    : 5 指標をまとめて 1 つの RandomForest（200 本）で予測する
+#   以下は rf_separate を教師にした蒸留（学習データ + 少し揺らしたデータに教師の予測を付けて学習する）
+#   rf_small    : 木を減らして浅くした RandomForest（5 指標まとめて 1 つ）
+#   hgb         : 指標ごとの HistGradientBoosting
+#   ridge       : 教師の重要度の上位の列だけを使う線形モデル（解析時もその列だけ計算する。feature_subset.py）
+#
+# 各候補は model_bundles/quality_model_<候補>.joblib に保存する。使うものを
+# HarmonyAnalyzer/src/analyzer/quality_model.joblib としてコピーすると analyze_audio.py がそれで推論する
+#
+# 使い方: python3 audio_10_distill_models.py [--output-dir model_bundles] [--ridge-columns 32]
+
+target_cols = ["brightness", "smoothness", "thickness", "clarity", "sharpness"]
+N_ESTIMATORS = 200
+AUGMENT_NOISE = 0.1   # 蒸留用に揺らすときの雑音（各列の標準偏差に対する割合）
+BENCH_ROWS = 6000     # 予測速度を測る窓の数（10 分の録音の窓の数くらい）
+
+
+def fit_rf_separate(X, Y):
+    models = {}
+    for i, target in enumerate(target_cols):
+        rf = RandomForestRegressor(n_estimators=N_ESTIMATORS, random_state=42, n_jobs=-1)
+        models[target] = rf.fit(X, Y[:, i])
+    return ModelBundle(models, target_cols, kind="rf_separate")
+
+
+def fit_rf_multi(X, Y):
+    rf = RandomForestRegressor(n_estimators=N_ESTIMATORS, random_state=42, n_jobs=-1)
+    return ModelBundle(rf.fit(X, Y), target_cols, kind="rf_multi")
+
+
+def distill_data(teacher, X_train, seed=0):
+    """学習データと、各列を少し揺らしたデータに教師の予測を付けたもの"""
+    rng = np.random.default_rng(seed)
+    noise = rng.standard_normal(X_train.shape) * (AUGMENT_NOISE * X_train.std(axis=0))
+    X = np.vstack([X_train, X_train + noise])
+    return X, teacher.predict(X)
+
+
+def fit_rf_small(X, Y):
+    rf = RandomForestRegressor(n_estimators=30, max_depth=10, min_samples_leaf=2, random_state=42, n_jobs=-1)
+    return ModelBundle(rf.fit(X, Y), target_cols, kind="rf_small")
+
+
+def fit_hgb(X, Y):
+    models = {}
+    for i, target in enumerate(target_cols):
+        hgb = HistGradientBoostingRegressor(max_iter=200, max_depth=6, learning_rate=0.1, random_state=42)
+        models[target] = hgb.fit(X, Y[:, i])
+    return ModelBundle(models, target_cols, kind="hgb")
+
+
+def fit_ridge(X, Y, columns):
+    # 解析時の窓統計量には NaN（一定の窓の歪度・尖度）が残ることがあるので 0 にする（audio_2 と同じ扱い）
+    model = make_pipeline(SimpleImputer(strategy="constant", fill_value=0.0, keep_empty_features=True),
+                          StandardScaler(), Ridge(alpha=1.0))
+    return ModelBundle(model.fit(X[:, columns], Y), target_cols, columns=columns, kind="ridge")
+
+
+def teacher_importance(bundle):
+    """rf_separate の 5 モデルの重要度の平均"""
+    return np.mean([m.feature_importances_ for m in bundle.model.values()], axis=0)
+
+
+def measure(bundle, path, X_test, Y_test, repeat=3):
+    """MSE（5 指標の平均と指標ごと）, ファイルサイズ, 読み込み時間, 予測速度（窓/秒）"""
+    bundle.save(path)
+    t0 = time.perf_counter()
+    loaded = ModelBundle.load(path)
+    load_time = time.perf_counter() - t0
+
+    X = X_test[:, loaded.columns]
+    pred = loaded.predict(X)
+    mse = [mean_squared_error(Y_test[:, i], pred[:, i]) for i in range(len(target_cols))]
+
+    X_bench = X[np.arange(BENCH_ROWS) % len(X)]
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        loaded.predict(X_bench)
+        best = min(best, time.perf_counter() - t0)
+    return {"candidate": bundle.kind, "mse": float(np.mean(mse)),
+            **{f"mse_{t}": m for t, m in zip(target_cols, mse)},
+            "columns": len(loaded.columns), "bytes": os.path.getsize(path),
+            "load_ms": load_time * 1000, "windows_per_sec": BENCH_ROWS / best}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="5 指標のモデルの候補を学習して比較する")
+    parser.add_argument("--output-dir", default="model_bundles")
+    parser.add_argument("--ridge-columns", type=int, default=32, help="ridge で使う列の数（教師の重要度の上位）")
+    args = parser.parse_args()
+
+    with open("training_data.pkl", "rb") as f:
+        data = pickle.load(f)
+    feature_cols = [c for c in data.columns if c.startswith("feature_")]
+    X = data[feature_cols].values
+    Y = data[target_cols].values
+    # audio_8_randomforest.py と同じ分け方（指標ごとに分けても行の選ばれ方は同じ）
+    X_train, X_test, Y_train, Y_test = train_test_split(X, Y, test_size=0.2, random_state=42)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    print("学習中: rf_separate / rf_multi")
+    teacher = fit_rf_separate(X_train, Y_train)
+    candidates = [teacher, fit_rf_multi(X_train, Y_train)]
+
+    print("蒸留中: rf_small / hgb / ridge")
+    X_distill, Y_distill = distill_data(teacher, X_train)
+    top = np.sort(np.argsort(-teacher_importance(teacher), kind="stable")[:args.ridge_columns])
+    candidates += [fit_rf_small(X_distill, Y_distill), fit_hgb(X_distill, Y_distill),
+                   fit_ridge(X_distill, Y_distill, top)]
+
+    rows = []
+    for bundle in candidates:
+        path = os.path.join(args.output_dir, f"quality_model_{bundle.kind}.joblib")
+        rows.append(measure(bundle, path, X_test, Y_test))
+    table = pd.DataFrame(rows)
+    table.to_csv(os.path.join(args.output_dir, "model_candidates.csv"), index=False, encoding="utf-8-sig")
+
+    print()
+    print(f"{'候補':<12} {'MSE':>8} {'列数':>5} {'サイズ':>11} {'読み込み':>10} {'予測':>14}")
+    for r in rows:
+        print(f"{r['candidate']:<12} {r['mse']:8.4f} {r['columns']:5d} {r['bytes'] / 1024:9.0f}KB "
+              f"{r['load_ms']:8.1f}ms {r['windows_per_sec']:10.0f}窓/秒")
+    print(f"\n▶ {args.output_dir}/quality_model_<候補>.joblib を "
+          f"HarmonyAnalyzer/src/analyzer/quality_model.joblib としてコピーすると、そのモデルで解析します。")
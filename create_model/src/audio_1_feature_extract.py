@@ -1,73 +1,124 @@
 import os
-import librosa
+import sys
+import time
+import hashlib
+import argparse
+
+# ワーカープロセスごとに BLAS を 1 スレッドにする（プロセス数でスケールさせる。numpy の import より前に設定）
+for _var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_var, "1")
+
 import numpy as np
-import pickle
+import librosa
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# 特徴量のエンジンはアプリ側（HarmonyAnalyzer/src/analyzer/feature_engine.py）と共通
+ANALYZER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "..", "..", "HarmonyAnalyzer", "src", "analyzer")
+sys.path.append(ANALYZER_DIR)
+import feature_engine
+import feature_store
 
 hop_length = 512
 
-def compute_spectral_flux(y, hop_length):
-    S = np.abs(librosa.stft(y, hop_length=hop_length))
-    flux = np.sqrt(np.sum(np.diff(S, axis=1)**2, axis=0))
-    flux = np.insert(flux, 0, 0)
-    return flux
-
-def compute_high_freq_energy(y, sr, hop_length, cutoff_freq=4000):
-    S = np.abs(librosa.stft(y, hop_length=hop_length))
-    freqs = librosa.fft_frequencies(sr=sr)
-    hf_idx = np.where(freqs >= cutoff_freq)[0]
-    hf_energy = np.sum(S[hf_idx, :], axis=0)
-    return hf_energy
-
-def extract_framewise_features(y, sr, hop_length=512):
-    mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13, hop_length=hop_length)
-    delta_mfcc = librosa.feature.delta(mfcc)
-    zcr = librosa.feature.zero_crossing_rate(y, hop_length=hop_length)
-    rms = librosa.feature.rms(y=y, hop_length=hop_length)
-    centroid = librosa.feature.spectral_centroid(y=y, sr=sr, hop_length=hop_length)
-    bandwidth = librosa.feature.spectral_bandwidth(y=y, sr=sr, hop_length=hop_length)
-    rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr, hop_length=hop_length)
-    flatness = librosa.feature.spectral_flatness(y=y, hop_length=hop_length)
-    chroma = librosa.feature.chroma_stft(y=y, sr=sr, hop_length=hop_length)
-    onset_env = librosa.onset.onset_strength(y=y, sr=sr, hop_length=hop_length).reshape(1, -1)
-
-    # 時系列特徴量を結合
-    features_list = [mfcc, delta_mfcc, zcr, rms, centroid, bandwidth, rolloff, flatness, chroma, onset_env]
-
-    # 各特徴量の長さを揃える
-    min_len = min(x.shape[1] for x in features_list)
-    features_trimmed = [x[:, :min_len] for x in features_list]
-
-    # 基本特徴量の結合
-    feats_time = np.vstack(features_trimmed)
-
-    # delta, 2階微分、スペクトルフラックス、ハイフリケンシーエネルギー
-    delta_rms = np.gradient(rms[0, :min_len])
-    delta_bandwidth = np.gradient(bandwidth[0, :min_len])
-    delta2_rms = np.gradient(delta_rms)
-    delta2_bandwidth = np.gradient(delta_bandwidth)
-    spectral_flux = compute_spectral_flux(y, hop_length)[:min_len]
-    delta2_flux = np.gradient(spectral_flux)
-    hf_energy = compute_high_freq_energy(y, sr, hop_length)[:min_len]
-
-    # 全特徴量を横に結合 (T, D)
-    final_features = np.column_stack([
-        feats_time.T, delta_rms, delta_bandwidth, delta2_rms, delta2_bandwidth, spectral_flux, delta2_flux, hf_energy
-    ])
-    return final_features
-
-def process_audio_folder(folder="tmp_audio"):
-    feature_dict = {}
-    for file in os.listdir(folder):
-        if file.endswith(".wav"):
-            filepath = os.path.join(folder, file)
-            y, sr = librosa.load(filepath, sr=None)
-            features = extract_framewise_features(y, sr, hop_length)
-            key = os.path.splitext(file)[0]
-            feature_dict[key] = features
-    return feature_dict
+# 1 ファイルごとの特徴量を キャッシュ（<cache_dir>/<音声の sha256>_<特徴量コードの版>.npy）に保存する
+# 途中で落ちても計算済みのファイルは残り、音声を足したときは新しいファイルだけ計算する
+# 特徴量のコード（feature_engine.py）や librosa を変えると版が変わり、全ファイル計算し直しになる
+DEFAULT_CACHE_DIR = "feature_cache"
+HASH_CHUNK = 1 << 20
+
+
+def feature_version():
+    """特徴量のコードの版（feature_engine.py の内容・hop_length・librosa / numpy のバージョンから作る）"""
+    h = hashlib.sha256()
+    with open(os.path.join(ANALYZER_DIR, "feature_engine.py"), "rb") as f:
+        h.update(f.read())
+    h.update(f"hop_length={hop_length};librosa={librosa.__version__};numpy={np.__version__}".encode())
+    return h.hexdigest()[:12]
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(HASH_CHUNK)
+            if not data:
+                break
+            h.update(data)
+    return h.hexdigest()
+
+
+def cache_path(cache_dir, digest, version):
+    return os.path.join(cache_dir, f"{digest}_{version}.npy")
+
+
+def extract_file(filepath, cache_dir, version):
+    """
+    1 ファイル分の特徴量を計算してキャッシュに保存する（キャッシュがあれば計算しない）
+    戻り値: (キャッシュのパス, 計算したか)
+    """
+    path = cache_path(cache_dir, file_hash(filepath), version)
+    if os.path.exists(path):
+        return path, False
+    y, sr = librosa.load(filepath, sr=None)
+    features = feature_engine.extract_framewise_features(y, sr, hop_length)
+    # 書きかけのファイルをキャッシュと取り違えないように、別名で書いてから置き換える
+    tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+    np.save(tmp_path, features)
+    os.replace(tmp_path, path)
+    return path, True
+
+
+def list_audio(folder):
+    return sorted(file for file in os.listdir(folder) if file.endswith(".wav"))
+
+
+def process_audio_folder(folder="tmp_audio", cache_dir=DEFAULT_CACHE_DIR, workers=None):
+    """
+    folder の wav の特徴量を workers 個のプロセスで計算する（キャッシュ済みのファイルはスキップ）
+    戻り値: {ファイル名（拡張子なし）: (T, D) の特徴量を保存したキャッシュの .npy}
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    version = feature_version()
+    files = list_audio(folder)
+    workers = max(1, workers or os.cpu_count() or 1)
+    print(f"[features] {len(files)} files, {workers} workers, version {version}, cache {cache_dir}")
+
+    paths = {}
+    computed = failed = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(extract_file, os.path.join(folder, file), cache_dir, version): file
+                   for file in files}
+        for done, future in enumerate(as_completed(futures), 1):
+            file = futures[future]
+            try:
+                path, fresh = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"[features] 失敗: {file}: {type(e).__name__}: {e}")
+                continue
+            paths[file] = path
+            computed += fresh
+            elapsed = time.perf_counter() - start
+            eta = elapsed / done * (len(files) - done)
+            print(f"[features] {done}/{len(files)} {'計算' if fresh else 'キャッシュ'} {file}"
+                  f"  経過 {elapsed:.0f}s 残り {eta:.0f}s")
+
+    print(f"[features] 計算 {computed} / キャッシュ {len(paths) - computed} / 失敗 {failed}"
+          f"  ({time.perf_counter() - start:.1f}s)")
+    return {os.path.splitext(file)[0]: paths[file] for file in files if file in paths}
+
 
 if __name__ == "__main__":
-    data = process_audio_folder("tmp_audio")
-    with open("features.pkl", "wb") as f:
-        pickle.dump(data, f)
-    print("フレームごとの特徴量を features.pkl に保存しました。")
+    parser = argparse.ArgumentParser(description="tmp_audio の wav からフレームごとの特徴量を計算する")
+    parser.add_argument("folder", nargs="?", default="tmp_audio")
+    parser.add_argument("--workers", type=int, default=None, help="プロセス数（既定: CPU コア数）")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--store", default=feature_store.DEFAULT_ROOT)
+    args = parser.parse_args()
+
+    # ストアにはキャッシュのファイルをハードリンクする（特徴量を読み込み直さない）
+    sources = process_audio_folder(args.folder, args.cache_dir, args.workers)
+    feature_store.sync_frames(sources, args.store)
+    print(f"フレームごとの特徴量を {feature_store.store_path('frames', root=args.store)} に保存しました。")
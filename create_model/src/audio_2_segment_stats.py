@@ -1,48 +1,45 @@
-import pickle
+import os
+import sys
 import numpy as np
-from scipy.stats import skew, kurtosis
+import feature_store
+
+# 窓統計のエンジンはアプリ側（HarmonyAnalyzer/src/analyzer/window_stats.py）と共通
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "..", "HarmonyAnalyzer", "src", "analyzer"))
+from window_stats import window_moments
 
 def compute_segment_stats(feature_matrix, n_segments=5):
     n_features, n_frames = feature_matrix.shape
     seg_len = n_frames // n_segments
-    stats_list = []
     eps = 1e-10
 
-    for i in range(n_segments):
-        start = i * seg_len
-        end = (i + 1) * seg_len if i < n_segments - 1 else n_frames
-        segment = feature_matrix[:, start:end].astype(np.float64)
-
-        means = np.mean(segment, axis=1)
-        vars_ = np.var(segment, axis=1)
-
-        # 数値安定化のために小さい分散の行を除外せずに扱う
-        safe_segment = np.where(np.abs(segment - means[:, None]) < eps, means[:, None], segment)
+    # 最後のセグメントは端数も含める
+    starts = np.arange(n_segments) * seg_len
+    ends = np.append(starts[1:], n_frames)
 
-        skews = skew(safe_segment, axis=1, bias=False, nan_policy='omit')
-        kurts = kurtosis(safe_segment, axis=1, bias=False, nan_policy='omit')
+    # 累積和から全セグメントの統計量を一括計算（HarmonyAnalyzer の推論時と同じ実装）
+    means, vars_, skews, kurts = window_moments(feature_matrix.T.astype(np.float64), starts, ends)
 
-        # NaN や極端な値を除去
-        skews[np.isnan(skews)] = 0
-        kurts[np.isnan(kurts)] = 0
+    # NaN や極端な値を除去
+    skews[np.isnan(skews)] = 0
+    kurts[np.isnan(kurts)] = 0
 
-        # 分散が小さい場合も安全に0に置換
-        skews[vars_ < eps] = 0
-        kurts[vars_ < eps] = 0
+    # 分散が小さい場合も安全に0に置換
+    skews[vars_ < eps] = 0
+    kurts[vars_ < eps] = 0
 
-        stats_vec = np.concatenate([means, vars_, skews, kurts])
-        stats_list.append(stats_vec)
-
-    return np.vstack(stats_list)
+    return np.hstack([means, vars_, skews, kurts])
 
 if __name__ == "__main__":
-    with open("features.pkl", "rb") as f:
-        feature_dict = pickle.load(f)
-
-    segment_stats_dict = {}
-    for key, feature_matrix in feature_dict.items():
-        stats = compute_segment_stats(feature_matrix.T, n_segments=5)
-        segment_stats_dict[key] = stats
-
-    with open("segment_stats.pkl", "wb") as f:
-        pickle.dump(segment_stats_dict, f)
+    n_segments = 5
+    keys = feature_store.frame_keys()
+    if not keys:
+        raise ValueError("特徴量がありません。先に audio_1_feature_extract.py を実行してください。")
+
+    # 1 ファイルずつ読み込んで、セグメント統計量の行列に順に書き込む（メモリ使用量はファイル数によらない）
+    n_cols = 4 * feature_store.load_frames(keys[0]).shape[1]
+    with feature_store.SegmentStatsWriter(len(keys) * n_segments, n_cols) as writer:
+        for key in keys:
+            feature_matrix = feature_store.load_frames(key)
+            writer.append(key, compute_segment_stats(feature_matrix.T, n_segments=n_segments))
+    print(f"セグメント統計量 ({writer.n} 行) を {feature_store.DEFAULT_ROOT} に保存しました。")
@@ -1,39 +1,27 @@
-import pickle
 import numpy as np
 from sklearn.preprocessing import StandardScaler
 import umap
 import hdbscan
+import feature_store
+import cluster_model
 
-# 入力・出力ファイル
-input_file = "segment_stats.pkl"
-output_file = "segment_clusters.pkl"
+# 入力: feature_store のセグメント統計量（audio_2_segment_stats.py）
+# 出力: feature_store の各行のクラスタ番号
+#       cluster_model.joblib（標準化・UMAP・HDBSCAN と埋め込み。新しいセグメントの割り当てに使う）
 
-# データ読み込み
-with open(input_file, "rb") as f:
-    data = pickle.load(f)
-
-# (audio_name, seg_idx) をキーにした flat な特徴ベクトルを作成
-X = []
-keys = []
-for key, stats in data.items():
-    # stats.shape = (n_segments, n_features*4) ではなく
-    # すでに (5, feature_dim) になっているはず → flatten 1次元ベクトルに
-    if stats.ndim > 1:
-        for i, row in enumerate(stats):
-            X.append(row)
-            keys.append((key, i))
-    else:
-        X.append(stats)
-        keys.append(key)
-
-X = np.array(X)
+# データ読み込み（メモリマップ。各行が (audio_name, seg_idx) のセグメント）
+X, _, _ = feature_store.load_segment_stats()
 print(f"元の次元数: {X.shape[1]}")
 
 # -----------------------------
-# 標準化
+# 標準化（統計量の行列を少しずつ読んで平均・分散を求め、標準化した行列だけをメモリに作る）
 # -----------------------------
 scaler = StandardScaler()
-X_scaled = scaler.fit_transform(X)
+for r0, r1 in feature_store.iter_row_blocks(len(X)):
+    scaler.partial_fit(X[r0:r1])
+X_scaled = np.empty(X.shape)
+for r0, r1 in feature_store.iter_row_blocks(len(X)):
+    X_scaled[r0:r1] = scaler.transform(X[r0:r1])
 
 # -----------------------------
 # UMAP による次元削減
@@ -55,15 +43,14 @@ print(f"UMAP圧縮後の次元数: {X_umap.shape[1]}")
 clusterer = hdbscan.HDBSCAN(
     min_cluster_size=60,
     min_samples=10,
-    metric='euclidean'
+    metric='euclidean',
+    prediction_data=True  # cluster_model.assign（approximate_predict）用
 )
 cluster_labels = clusterer.fit_predict(X_umap)
 
-# 結果を辞書に保存
-cluster_dict = {keys[i]: cluster_labels[i] for i in range(len(keys))}
-
-with open(output_file, "wb") as f:
-    pickle.dump(cluster_dict, f)
+# 結果を行の順に保存
+feature_store.save_clusters(cluster_labels)
+cluster_model.save(scaler, umap_reducer, clusterer, X_umap)
 
 # -----------------------------
 # 結果確認
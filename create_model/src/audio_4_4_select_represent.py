@@ -1,120 +1,57 @@
-import pickle
 import os
-import librosa
-import soundfile as sf
 import numpy as np
-from sklearn.preprocessing import StandardScaler
-import umap
-import hdbscan
 from scipy.spatial.distance import cdist
+import feature_store
+import cluster_model
+from segment_export import export_segments
 
-# 入力ファイル
-stats_file = "segment_stats.pkl"
-clusters_file = "segment_clusters.pkl"
+# 入力: feature_store のセグメント・クラスタ番号と、audio_3_4 で保存した UMAP の埋め込み（cluster_model.joblib）
 audio_folder = "tmp_audio"
 
 # 出力フォルダ
 output_base = "cluster_representatives_audio"
-os.makedirs(output_base, exist_ok=True)
 
 n_segments = 5  # セグメント分割数
 top_k = 3       # 各クラスタから選ぶ代表音の数
 
-# -----------------------------
-# 特徴量読み込み
-# -----------------------------
-with open(stats_file, "rb") as f:
-    data = pickle.load(f)
-
-X = []
-keys = []
-for key, stats in data.items():
-    if stats.ndim > 1:
-        for i, row in enumerate(stats):
-            X.append(row)
-            keys.append((key, i))
-    else:
-        X.append(stats)
-        keys.append(key)
-
-X = np.array(X)
-
-# 標準化 + UMAP
-scaler = StandardScaler()
-X_scaled = scaler.fit_transform(X)
-
-umap_reducer = umap.UMAP(
-    n_components=15,
-    n_neighbors=50,
-    min_dist=0.1,
-    metric='euclidean',
-    random_state=42
-)
-X_umap = umap_reducer.fit_transform(X_scaled)
-
-# -----------------------------
-# クラスタ情報読み込み
-# -----------------------------
-with open(clusters_file, "rb") as f:
-    cluster_dict = pickle.load(f)
-
-cluster_labels = np.array([cluster_dict[k] for k in keys])
-
-# -----------------------------
-# フェード処理関数
-# -----------------------------
-def apply_fade(y, sr, fade_duration=0.1):
-    """
-    音声データにフェードイン・フェードアウトを適用する
-    """
-    fade_len = int(sr * fade_duration)
-    fade_len = min(fade_len, len(y)//2)  # 音が短すぎる場合の安全対策
-
-    fade_in = np.linspace(0.0, 1.0, fade_len)
-    fade_out = np.linspace(1.0, 0.0, fade_len)
-
-    y[:fade_len] *= fade_in
-    y[-fade_len:] *= fade_out
-    return y
-
-# -----------------------------
-# 各クラスタごとに代表音を選ぶ
-# -----------------------------
-for c in set(cluster_labels):
-    if c == -1:
-        continue  # ノイズはスキップ
-
-    idxs = np.where(cluster_labels == c)[0]
-    cluster_points = X_umap[idxs]
-
-    # 中心
-    center = cluster_points.mean(axis=0)
-
-    # 距離計算
-    dists = cdist(cluster_points, center[None, :]).flatten()
-    nearest_idxs = idxs[np.argsort(dists)[:top_k]]
-
-    # 保存フォルダ
-    cluster_dir = os.path.join(output_base, f"cluster_{c}")
-    os.makedirs(cluster_dir, exist_ok=True)
-
-    for idx in nearest_idxs:
-        audio_name, seg_idx = keys[idx]
-        file_path = os.path.join(audio_folder, audio_name + ".wav")
-        if not os.path.exists(file_path):
-            continue
-
-        y, sr = librosa.load(file_path, sr=None)
-        total_len = len(y)
-
-        start = int(total_len * seg_idx / n_segments)
-        end = int(total_len * (seg_idx + 1) / n_segments)
-        segment = y[start:end]
-
-        # === フェードイン・フェードアウト適用 ===
-        segment = apply_fade(segment, sr, fade_duration=0.1)
-
-        out_file = os.path.join(cluster_dir, f"{audio_name}_seg{seg_idx}.wav")
-        sf.write(out_file, segment, sr)
-
-print(f"✅ 各クラスタから {top_k} 個の代表音を '{output_base}' に保存しました（フェード処理済み）。")
+# 書き出しはプロセスプールで行うので、子プロセスで読み込まれたときに実行しないようにしておく
+if __name__ == "__main__":
+    os.makedirs(output_base, exist_ok=True)
+
+    # -----------------------------
+    # 埋め込み・クラスタ情報読み込み（行の順。UMAP は学習し直さない）
+    # -----------------------------
+    keys = feature_store.segment_keys()
+    X_umap = cluster_model.load()["embedding"]
+    cluster_labels = np.asarray(feature_store.load_clusters())
+    if len(X_umap) != len(keys):
+        raise ValueError("cluster_model.joblib が feature_store のセグメントと一致しません。audio_3_4 を実行し直してください。")
+
+    # -----------------------------
+    # 各クラスタごとに代表音を選ぶ
+    # -----------------------------
+    requests = []
+    for c in set(cluster_labels):
+        if c == -1:
+            continue  # ノイズはスキップ
+
+        idxs = np.where(cluster_labels == c)[0]
+        cluster_points = X_umap[idxs]
+
+        # 中心
+        center = cluster_points.mean(axis=0)
+
+        # 距離計算
+        dists = cdist(cluster_points, center[None, :]).flatten()
+        nearest_idxs = idxs[np.argsort(dists)[:top_k]]
+
+        # 保存フォルダ
+        cluster_dir = os.path.join(output_base, f"cluster_{c}")
+        for idx in nearest_idxs:
+            audio_name, seg_idx = keys[idx]
+            requests.append((audio_name, seg_idx, os.path.join(cluster_dir, f"{audio_name}_seg{seg_idx}.wav")))
+
+    # 音源ごとにまとめて必要な範囲だけ読み、フェードイン・フェードアウトを適用して保存（segment_export.py）
+    export_segments(requests, audio_folder, n_segments, fade_duration=0.1)
+
+    print(f"✅ 各クラスタから {top_k} 個の代表音を '{output_base}' に保存しました（フェード処理済み）。")
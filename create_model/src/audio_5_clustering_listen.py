@@ -1,38 +1,22 @@
-import librosa
-import soundfile as sf
-import pickle
 import os
-
-# ファイル読み込み
-with open("segment_clusters.pkl", "rb") as f:
-    cluster_dict = pickle.load(f)
+import feature_store
+from segment_export import export_segments
 
 audio_folder = "tmp_audio"
 output_base = "cluster_audio"
-os.makedirs(output_base, exist_ok=True)
-
 n_segments = 5  # 1つ目と同じセグメント数
 
-for (audio_name, seg_idx), cluster_label in cluster_dict.items():
-    file_path = os.path.join(audio_folder, audio_name + ".wav")
-    if not os.path.exists(file_path):
-        continue  # 音源がなければスキップ
+# 書き出しはプロセスプールで行うので、子プロセスで読み込まれたときに実行しないようにしておく
+if __name__ == "__main__":
+    # ファイル読み込み（feature_store の各行のセグメントとクラスタ番号）
+    cluster_dict = dict(zip(feature_store.segment_keys(), feature_store.load_clusters().tolist()))
+    os.makedirs(output_base, exist_ok=True)
 
-    y, sr = librosa.load(file_path, sr=None)
-    total_len = len(y)
-    
-    # セグメント開始・終了サンプル
-    start = int(total_len * seg_idx / n_segments)
-    end = int(total_len * (seg_idx + 1) / n_segments)
-    
-    segment = y[start:end]
-    
-    # クラスタ番号ごとのフォルダに保存
-    cluster_dir = os.path.join(output_base, f"cluster_{cluster_label}")
-    os.makedirs(cluster_dir, exist_ok=True)
-    
-    # 保存ファイル名
-    out_file = os.path.join(cluster_dir, f"{audio_name}_seg{seg_idx}.wav")
-    sf.write(out_file, segment, sr)
+    # クラスタ番号ごとのフォルダに保存（音源ごとにまとめて必要な範囲だけ読む。segment_export.py）
+    requests = [
+        (audio_name, seg_idx, os.path.join(output_base, f"cluster_{cluster_label}", f"{audio_name}_seg{seg_idx}.wav"))
+        for (audio_name, seg_idx), cluster_label in cluster_dict.items()
+    ]
+    export_segments(requests, audio_folder, n_segments)
 
-print(f"クラスタごとのセグメントを '{output_base}' フォルダに保存しました。")
+    print(f"クラスタごとのセグメントを '{output_base}' フォルダに保存しました。")
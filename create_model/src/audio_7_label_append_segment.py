@@ -1,46 +1,29 @@
 import pickle
 import pandas as pd
 import numpy as np
+import feature_store
 
 # --- ファイル読み込み ---
-SEGMENT_STATS_PKL = "segment_stats.pkl"
-SEGMENT_CLUSTERS_PKL = "segment_clusters.pkl"
+# セグメント統計量・クラスタ番号は feature_store（メモリマップ。行の順が揃っている）
 CLUSTER_SCORES_PKL = "cluster_scores.pkl"
 
-with open(SEGMENT_STATS_PKL, "rb") as f:
-    segment_stats = pickle.load(f)
-
-with open(SEGMENT_CLUSTERS_PKL, "rb") as f:
-    segment_clusters = pickle.load(f)
+segment_stats, _, _ = feature_store.load_segment_stats()
+segment_clusters = np.asarray(feature_store.load_clusters())
 
 with open(CLUSTER_SCORES_PKL, "rb") as f:
     cluster_scores = pickle.load(f)
 
 # --- 教師データ作成 ---
-rows = []
-
-for audio_name, stats_array in segment_stats.items():
-    n_segments = stats_array.shape[0]
-    for seg_idx in range(n_segments):
-        key = (audio_name, seg_idx)
-        # クラスタラベルを取得
-        cluster_label = segment_clusters.get(key, -1)
-        if cluster_label == -1:
-            continue  # ノイズはスキップ
-        # クラスタスコアを取得
-        scores = cluster_scores.get(cluster_label)
-        if scores is None:
-            continue
-        # 行としてまとめる
-        feature_vector = stats_array[seg_idx]  # shape=(feature_dim,)
-        row = np.concatenate([feature_vector, scores])
-        rows.append(row)
-
-if not rows:
-    raise ValueError("教師データが1件も作れませんでした。pklの内容を確認してください。")
+# ノイズ（-1）とスコアの無いクラスタを除いた行だけを読み込む
+rows_idx = np.flatnonzero([label != -1 and cluster_scores.get(label) is not None for label in segment_clusters])
+if len(rows_idx) == 0:
+    raise ValueError("教師データが1件も作れませんでした。feature_store と cluster_scores.pkl の内容を確認してください。")
+
+scores = np.array([cluster_scores[label] for label in segment_clusters[rows_idx]])
+rows = np.hstack([segment_stats[rows_idx], scores])
 
 # --- DataFrame化 ---
-feature_dim = segment_stats[list(segment_stats.keys())[0]].shape[1]
+feature_dim = segment_stats.shape[1]
 columns = [f"feature_{i}" for i in range(feature_dim)] + \
           ["brightness", "smoothness", "thickness", "clarity", "sharpness"]
 
@@ -0,0 +1,185 @@
+import os
+import sys
+import time
+import pickle
+import argparse
+import numpy as np
+import pandas as pd
+import joblib
+import librosa
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import mean_squared_error
+
+# 特徴量・窓統計量の計算はアプリ側（HarmonyAnalyzer/src/analyzer）と共通
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "..", "HarmonyAnalyzer", "src", "analyzer"))
+import feature_engine
+import feature_subset
+import window_stats
+
+# audio_8_randomforest.py のモデルを、検証 MSE がほぼ変わらない範囲で少ない列に絞って学習し直す
+#
+# 1. 全列（208 = 52 特徴量 × 平均・分散・歪度・尖度）で学習し、重要度の高い順に列を並べる
+# 2. 上位 k 列で学習したときの検証 MSE が「全列の MSE × (1 + tolerance)」以下になる最小の k を探す
+# 3. その列で学習したモデルに feature_columns_ として列を持たせて保存する
+#    analyze_audio.py はモデルが使う列に要る特徴量・統計量だけを計算する（feature_subset.py）
+#
+# 使い方: python3 audio_9_prune_features.py [--tolerance 0.02] [--output-dir pruned_models] [--audio a.wav ...]
+#         出力したモデルを HarmonyAnalyzer/src/analyzer にコピーし、tree_ensemble.py compile し直す
+
+target_cols = ["brightness", "smoothness", "thickness", "clarity", "sharpness"]
+N_ESTIMATORS = 200
+
+
+def fit(X_train, y_train, columns, n_estimators=N_ESTIMATORS):
+    rf = RandomForestRegressor(n_estimators=n_estimators, random_state=42, n_jobs=-1)
+    rf.fit(X_train[:, columns], y_train)
+    rf.feature_columns_ = np.asarray(columns, dtype=np.int64)
+    return rf
+
+
+def validation_mse(rf, X_test, y_test):
+    return mean_squared_error(y_test, rf.predict(X_test[:, rf.feature_columns_]))
+
+
+def prune_target(X_train, X_test, y_train, y_test, tolerance, search_estimators=N_ESTIMATORS):
+    """
+    戻り値: (全列の MSE, 絞ったモデル, 絞ったモデルの MSE)
+    列数 1, 2, 4, … と増やして最初に MSE が許容範囲に入った k と、その半分の間を二分探索する
+    （列数を減らすとかえって MSE が下がることもあるので、多い側からの二分探索はしない）
+    """
+    n = X_train.shape[1]
+    full = fit(X_train, y_train, np.arange(n))
+    full_mse = validation_mse(full, X_test, y_test)
+    order = np.argsort(-full.feature_importances_, kind="stable")
+    limit = full_mse * (1 + tolerance)
+
+    def try_k(k):
+        rf = fit(X_train, y_train, np.sort(order[:k]), search_estimators)
+        mse = validation_mse(rf, X_test, y_test)
+        print(f"  上位 {k:3d} 列: MSE {mse:.4f} ({'OK' if mse <= limit else 'NG'})")
+        return rf if mse <= limit else None
+
+    best, lo, hi = None, 0, n
+    k = 1
+    while k < n:
+        best = try_k(k)
+        if best is not None:
+            hi = k
+            break
+        lo, k = k, 2 * k
+    if best is None:
+        return full_mse, full, full_mse
+    # lo 列では足りず hi 列なら足りる
+    while hi - lo > 1:
+        k = (lo + hi) // 2
+        rf = try_k(k)
+        if rf is not None:
+            hi, best = k, rf
+        else:
+            lo = k
+
+    if search_estimators != N_ESTIMATORS:
+        best = fit(X_train, y_train, best.feature_columns_)
+    return full_mse, best, validation_mse(best, X_test, y_test)
+
+
+def extraction_times(y, sr, columns, repeat=3):
+    """全列と columns だけの「特徴量 → 窓統計量」の時間（秒, 最良値）と、同じ列の値が一致するか"""
+    window_frames = max(1, int(round(sr / feature_engine.hop_length)))
+    step_frames = max(1, int(round(sr / feature_engine.hop_length * 0.1)))
+
+    def full():
+        features = feature_engine.extract_framewise_features(y, sr)
+        return window_stats.compute_window_stats(features, window_frames, step_frames)[0]
+
+    def pruned():
+        features = feature_subset.extract_features(y, sr, columns)
+        return feature_subset.compute_window_stats(features, columns, window_frames, step_frames)[0]
+
+    times = {}
+    results = {}
+    for name, fn in (("full", full), ("pruned", pruned)):
+        fn()  # librosa のフィルタバンク作成を計測から外す
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            results[name] = fn()
+            best = min(best, time.perf_counter() - t0)
+        times[name] = best
+    identical = np.array_equal(results["full"][:, columns], results["pruned"], equal_nan=True)
+    return times["full"], times["pruned"], identical
+
+
+def synth_signal(duration=60.0, sr=48000, seed=0):
+    """計測用の 1 分の信号（倍音のある音 + 雑音）"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sr)) / sr
+    f0 = 220 * 2 ** (np.floor(t) % 12 / 12)
+    y = sum(0.3 / h * np.sin(2 * np.pi * h * f0 * t) for h in range(1, 6))
+    return (y + 0.01 * rng.standard_normal(len(t))).astype(np.float32), sr
+
+
+def time_report(columns, audio_paths):
+    inputs = [(os.path.basename(p), *librosa.load(p, sr=None)) for p in audio_paths] or \
+             [("synthetic", *synth_signal())]
+    print("\n=== 録音 1 分あたりの特徴量・窓統計量の計算時間 ===")
+    for name, y, sr in inputs:
+        minutes = len(y) / sr / 60
+        t_full, t_pruned, identical = extraction_times(y, sr, columns)
+        print(f"{name}: 全列 {t_full / minutes * 1000:.0f} ms/分 → 絞った列 {t_pruned / minutes * 1000:.0f} ms/分 "
+              f"(1 分あたり {(t_full - t_pruned) / minutes * 1000:.0f} ms 短縮, x{t_full / t_pruned:.2f}) "
+              f"値の一致={identical}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="検証 MSE を保ったまま少ない列でモデルを学習し直す")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="全列の MSE に対して許す悪化の割合")
+    parser.add_argument("--search-estimators", type=int, default=N_ESTIMATORS,
+                        help="探索中に学習する木の本数（最後は N_ESTIMATORS 本で学習し直す）")
+    parser.add_argument("--output-dir", default="pruned_models")
+    parser.add_argument("--audio", nargs="*", default=[], help="計算時間の計測に使う録音（省略時は合成音）")
+    args = parser.parse_args()
+
+    with open("training_data.pkl", "rb") as f:
+        data = pickle.load(f)
+    feature_cols = [c for c in data.columns if c.startswith("feature_")]
+    if len(feature_cols) != feature_subset.N_COLUMNS:
+        raise ValueError(f"特徴量の列数が {feature_subset.N_COLUMNS} ではありません: {len(feature_cols)}")
+    X = data[feature_cols].values
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    summary = []
+    used = []
+    for target in target_cols:
+        print(f"\n=== {target} ===")
+        y = data[target].values
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+
+        full_mse, rf, mse = prune_target(X_train, X_test, y_train, y_test, args.tolerance, args.search_estimators)
+        columns = rf.feature_columns_
+        used.append(columns)
+        print(f"全列 MSE: {full_mse:.4f} → {len(columns)} 列 MSE: {mse:.4f}")
+
+        df_columns = pd.DataFrame({
+            "column": columns,
+            "name": [feature_subset.column_name(c) for c in columns],
+            "importance": rf.feature_importances_,
+        }).sort_values(by="importance", ascending=False)
+        csv_filename = os.path.join(args.output_dir, f"feature_subset_{target}.csv")
+        df_columns.to_csv(csv_filename, index=False, encoding="utf-8-sig")
+
+        model_filename = os.path.join(args.output_dir, f"rf_model_{target}.pkl")
+        joblib.dump(rf, model_filename)
+        print(f"▶ モデルを {model_filename}、使う列を {csv_filename} に保存しました。")
+        summary.append({"target": target, "full_mse": full_mse, "pruned_mse": mse, "n_columns": len(columns)})
+
+    union = feature_subset.normalize(np.concatenate(used))
+    bases = feature_subset.base_features(union)
+    pd.DataFrame(summary).to_csv(os.path.join(args.output_dir, "pruning_summary.csv"), index=False,
+                                 encoding="utf-8-sig")
+    print(f"\n5 モデル合わせて {len(union)} / {feature_subset.N_COLUMNS} 列、"
+          f"特徴量 {len(bases)} / {feature_engine.N_FEATURES} 個: "
+          + ", ".join(feature_engine.FEATURE_NAMES[b] for b in bases))
+    time_report(union, args.audio)
@@ -0,0 +1,68 @@
+import os
+import sys
+import joblib
+import librosa
+import numpy as np
+import hdbscan
+
+# 特徴量の計算はアプリ側（HarmonyAnalyzer/src/analyzer/feature_engine.py）と共通
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "..", "HarmonyAnalyzer", "src", "analyzer"))
+import feature_engine
+from audio_2_segment_stats import compute_segment_stats
+
+# audio_3_4_scaler_umap_hdbscan.py で学習した 標準化・UMAP・HDBSCAN と学習データの埋め込みをまとめた 1 ファイル
+#
+#   scaler    : StandardScaler
+#   umap      : UMAP（transform で新しい点を埋め込める）
+#   clusterer : HDBSCAN（prediction_data=True。approximate_predict で新しい点をクラスタに割り当てる）
+#   embedding : 学習データ（feature_store の行の順）の UMAP 埋め込み (行数, 15)
+#
+# 新しい録音のセグメントを、学習し直さずに既存のクラスタへ割り当てる:
+#   python3 cluster_model.py assign <a.wav ...>
+
+CLUSTER_MODEL_FILE = "cluster_model.joblib"
+FORMAT_VERSION = 1
+N_SEGMENTS = 5
+
+
+def save(scaler, reducer, clusterer, embedding, path=CLUSTER_MODEL_FILE):
+    joblib.dump({"format_version": FORMAT_VERSION, "scaler": scaler, "umap": reducer,
+                 "clusterer": clusterer, "embedding": np.asarray(embedding)}, path)
+
+
+def load(path=CLUSTER_MODEL_FILE):
+    model = joblib.load(path)
+    if model.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"{path}: 未対応のフォーマットです (version={model.get('format_version')})")
+    return model
+
+
+def assign(segments, model=None):
+    """
+    segments: セグメント統計量 (n, 208)（audio_2_segment_stats.compute_segment_stats の行）
+    戻り値: クラスタ番号 (n,)（-1 はノイズ）, 所属の強さ 0〜1 (n,), UMAP 埋め込み (n, 15)
+    """
+    model = model or load()
+    X_scaled = model["scaler"].transform(np.atleast_2d(segments))
+    embedding = model["umap"].transform(X_scaled)
+    labels, strengths = hdbscan.approximate_predict(model["clusterer"], embedding)
+    return labels, strengths, embedding
+
+
+def segments_from_audio(path, n_segments=N_SEGMENTS):
+    """録音のセグメント統計量 (n_segments, 208)（学習時と同じ計算）"""
+    y, sr = librosa.load(path, sr=None)
+    features = feature_engine.extract_framewise_features(y, sr)
+    return compute_segment_stats(features.T, n_segments=n_segments)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "assign":
+        sys.stderr.write("usage: cluster_model.py assign <audio.wav ...>\n")
+        sys.exit(1)
+    model = load()
+    for path in sys.argv[2:]:
+        labels, strengths, _ = assign(segments_from_audio(path), model)
+        for seg_idx, (label, strength) in enumerate(zip(labels, strengths)):
+            print(f"{os.path.basename(path)} seg{seg_idx}: cluster {label} (strength {strength:.2f})")
@@ -0,0 +1,196 @@
+import os
+import sys
+import shutil
+import pickle
+import numpy as np
+
+# 学習データの特徴量ストア（features.pkl / segment_stats.pkl / segment_clusters.pkl の代わり）
+#
+#   feature_store/
+#     frames/<音声ファイル名>.npy   フレームごとの特徴量 (T, 52)   audio_1_feature_extract.py
+#     segment_stats.npy            セグメント統計量 (行数, 208)    audio_2_segment_stats.py
+#     segment_names.npy            各行の音声ファイル名 (行数,)
+#     segment_index.npy            各行のセグメント番号 (行数,)
+#     segment_clusters.npy         各行のクラスタ番号 (行数,)      audio_3_4_scaler_umap_hdbscan.py
+#
+# どれも np.load(mmap_mode="r") で開くので、開くのは件数によらず一定時間で、読んだ部分だけがメモリに載る
+# 書き込みは一時ファイルに書いてから置き換える（途中で落ちても前の内容が残る）
+#
+# 以前の pickle からの変換: python3 feature_store.py import [features.pkl] [segment_stats.pkl] [segment_clusters.pkl]
+
+DEFAULT_ROOT = "feature_store"
+SEGMENT_FILES = ("segment_stats.npy", "segment_names.npy", "segment_index.npy")
+CLUSTERS_FILE = "segment_clusters.npy"
+
+
+def store_path(*names, root=DEFAULT_ROOT):
+    return os.path.join(root, *names)
+
+
+def _tmp(path):
+    return f"{path}.{os.getpid()}.tmp.npy"
+
+
+def _save(path, array):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = _tmp(path)
+    np.save(tmp, array)
+    os.replace(tmp, path)
+
+
+# === フレームごとの特徴量 ===
+def frame_path(key, root=DEFAULT_ROOT):
+    return store_path("frames", f"{key}.npy", root=root)
+
+
+def frame_keys(root=DEFAULT_ROOT):
+    """特徴量のある音声ファイル名（拡張子なし、名前順）"""
+    folder = store_path("frames", root=root)
+    if not os.path.isdir(folder):
+        return []
+    return sorted(name[:-4] for name in os.listdir(folder) if name.endswith(".npy") and ".tmp." not in name)
+
+
+def load_frames(key, root=DEFAULT_ROOT):
+    """(T, 52) の特徴量（メモリマップ）"""
+    return np.load(frame_path(key, root), mmap_mode="r")
+
+
+def save_frames(key, features, root=DEFAULT_ROOT):
+    _save(frame_path(key, root), np.asarray(features))
+
+
+def sync_frames(sources, root=DEFAULT_ROOT):
+    """
+    sources: {音声ファイル名: 特徴量の .npy}（audio_1 のキャッシュ）
+    ストアの特徴量を sources と同じにする（ハードリンクできなければコピー。sources に無いものは消す）
+    """
+    folder = store_path("frames", root=root)
+    os.makedirs(folder, exist_ok=True)
+    for key, src in sources.items():
+        dst = frame_path(key, root)
+        if os.path.exists(dst) and os.path.samefile(src, dst):
+            continue
+        tmp = _tmp(dst)
+        try:
+            os.link(src, tmp)
+        except OSError:
+            shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+    for key in set(frame_keys(root)) - set(sources):
+        os.remove(frame_path(key, root))
+
+
+# === セグメント統計量 ===
+class SegmentStatsWriter:
+    """
+    セグメント統計量を 1 ファイル分ずつ書き込む（行数は最初に決める）
+    with 文を抜けると置き換える（例外のときは書きかけを消す）
+    """
+
+    def __init__(self, n_rows, n_cols, root=DEFAULT_ROOT):
+        self.root = root
+        self.paths = [store_path(name, root=root) for name in SEGMENT_FILES]
+        os.makedirs(root, exist_ok=True)
+        self.stats = np.lib.format.open_memmap(_tmp(self.paths[0]), mode="w+", dtype=np.float64,
+                                               shape=(n_rows, n_cols))
+        self.names = []
+        self.index = np.empty(n_rows, dtype=np.int32)
+        self.n = 0
+
+    def append(self, name, rows):
+        """name の音声のセグメントごとの統計量 rows (セグメント数, n_cols)"""
+        rows = np.atleast_2d(rows)
+        self.stats[self.n:self.n + len(rows)] = rows
+        self.names.extend([name] * len(rows))
+        self.index[self.n:self.n + len(rows)] = np.arange(len(rows))
+        self.n += len(rows)
+
+    def close(self):
+        if self.n != len(self.stats):
+            raise ValueError(f"書き込んだ行数 {self.n} が {len(self.stats)} と一致しません")
+        self.stats.flush()
+        del self.stats
+        _save(self.paths[1], np.asarray(self.names, dtype=str))
+        _save(self.paths[2], self.index)
+        os.replace(_tmp(self.paths[0]), self.paths[0])
+        # 行が変わったのでクラスタ番号は無効
+        clusters = store_path(CLUSTERS_FILE, root=self.root)
+        if os.path.exists(clusters):
+            os.remove(clusters)
+
+    def abort(self):
+        del self.stats
+        os.remove(_tmp(self.paths[0]))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def load_segment_stats(root=DEFAULT_ROOT):
+    """
+    戻り値: (統計量 (行数, 208), 音声ファイル名 (行数,), セグメント番号 (行数,))  いずれもメモリマップ
+    """
+    return tuple(np.load(store_path(name, root=root), mmap_mode="r") for name in SEGMENT_FILES)
+
+
+def segment_keys(root=DEFAULT_ROOT):
+    """各行の (音声ファイル名, セグメント番号)"""
+    _, names, index = load_segment_stats(root)
+    return list(zip(names.tolist(), index.tolist()))
+
+
+def iter_row_blocks(n_rows, block_rows=4096):
+    """行を block_rows ずつに区切った (r0, r1)"""
+    for r0 in range(0, n_rows, block_rows):
+        yield r0, min(r0 + block_rows, n_rows)
+
+
+# === クラスタ番号 ===
+def save_clusters(labels, root=DEFAULT_ROOT):
+    """各行のクラスタ番号（-1 はノイズ）"""
+    _save(store_path(CLUSTERS_FILE, root=root), np.asarray(labels, dtype=np.int32))
+
+
+def load_clusters(root=DEFAULT_ROOT):
+    return np.load(store_path(CLUSTERS_FILE, root=root), mmap_mode="r")
+
+
+# === 以前の pickle からの変換 ===
+def import_pickles(features_pkl=None, stats_pkl=None, clusters_pkl=None, root=DEFAULT_ROOT):
+    if features_pkl and os.path.exists(features_pkl):
+        with open(features_pkl, "rb") as f:
+            features = pickle.load(f)
+        for key, matrix in features.items():
+            save_frames(key, matrix, root)
+        print(f"[feature_store] {features_pkl}: {len(features)} files")
+        del features
+
+    if stats_pkl and os.path.exists(stats_pkl):
+        with open(stats_pkl, "rb") as f:
+            stats = pickle.load(f)
+        rows = {key: np.atleast_2d(v) for key, v in stats.items()}
+        n_cols = next(iter(rows.values())).shape[1]
+        with SegmentStatsWriter(sum(len(v) for v in rows.values()), n_cols, root) as writer:
+            for key, v in rows.items():
+                writer.append(key, v)
+        print(f"[feature_store] {stats_pkl}: {writer.n} rows")
+
+        if clusters_pkl and os.path.exists(clusters_pkl):
+            with open(clusters_pkl, "rb") as f:
+                clusters = pickle.load(f)
+            save_clusters([clusters.get(k, -1) for k in segment_keys(root)], root)
+            print(f"[feature_store] {clusters_pkl}: {len(clusters)} labels")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "import":
+        sys.stderr.write("usage: feature_store.py import [features.pkl] [segment_stats.pkl] [segment_clusters.pkl]\n")
+        sys.exit(1)
+    import_pickles(*(sys.argv[2:5] or ["features.pkl", "segment_stats.pkl", "segment_clusters.pkl"]))
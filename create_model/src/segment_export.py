@@ -0,0 +1,83 @@
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import soundfile as sf
+
+# クラスタ試聴用のセグメント書き出し（audio_5_clustering_listen.py / audio_4_4_select_represent.py）
+#
+# 書き出すセグメントを音声ファイルごとにまとめ、ファイルを 1 回だけ開いて必要な範囲だけを seek して読む
+# （以前は セグメントごとに librosa.load でファイル全体を読み直していた）
+# 読んだ値は librosa.load(path, sr=None) の同じ範囲と一致する（float32・チャンネルの平均でモノラル）
+# ファイルごとの処理はプロセスプールで並列に行う
+
+
+def segment_bounds(total_len, seg_idx, n_segments):
+    """セグメントの開始・終了サンプル（audio_2 のセグメント分割と同じ割り方）"""
+    return int(total_len * seg_idx / n_segments), int(total_len * (seg_idx + 1) / n_segments)
+
+
+def apply_fade(y, sr, fade_duration=0.1):
+    """音声データにフェードイン・フェードアウトを適用する（y をその場で書き換える）"""
+    fade_len = min(int(sr * fade_duration), len(y) // 2)  # 音が短すぎる場合の安全対策
+    if fade_len > 0:
+        y[:fade_len] *= np.linspace(0.0, 1.0, fade_len)
+        y[-fade_len:] *= np.linspace(1.0, 0.0, fade_len)
+    return y
+
+
+def read_range(f, start, end):
+    """開いている sf.SoundFile の [start, end) サンプルをモノラル float32 で読む"""
+    f.seek(start)
+    data = f.read(end - start, dtype="float32", always_2d=True)
+    return data[:, 0] if data.shape[1] == 1 else np.mean(data.T, axis=0)
+
+
+def export_file(file_path, segments, n_segments, fade_duration=None):
+    """
+    1 つの音声ファイルから segments: [(セグメント番号, 出力パス), ...] を書き出す
+    戻り値: 書き出したセグメント数
+    """
+    with sf.SoundFile(file_path) as f:
+        total_len, sr = f.frames, f.samplerate
+        for seg_idx, out_file in sorted(segments):
+            start, end = segment_bounds(total_len, seg_idx, n_segments)
+            segment = read_range(f, start, end)
+            if fade_duration:
+                apply_fade(segment, sr, fade_duration)
+            os.makedirs(os.path.dirname(out_file) or ".", exist_ok=True)
+            sf.write(out_file, segment, sr)
+    return len(segments)
+
+
+def export_segments(requests, audio_folder, n_segments=5, fade_duration=None, workers=None):
+    """
+    requests: [(音声ファイル名（拡張子なし）, セグメント番号, 出力パス), ...]
+    音源の無いファイルはスキップする
+    戻り値: (書き出したファイル数, 書き出したセグメント数)
+    """
+    groups = defaultdict(list)
+    for audio_name, seg_idx, out_file in requests:
+        groups[audio_name].append((int(seg_idx), out_file))
+    paths = {name: os.path.join(audio_folder, name + ".wav") for name in groups}
+    missing = [name for name, p in paths.items() if not os.path.exists(p)]
+    for name in missing:
+        del groups[name]
+
+    workers = max(1, workers or os.cpu_count() or 1)
+    n_files = n_segments_written = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(export_file, paths[name], segs, n_segments, fade_duration): name
+                   for name, segs in groups.items()}
+        for future in as_completed(futures):
+            try:
+                n_segments_written += future.result()
+                n_files += 1
+            except Exception as e:
+                print(f"[export] 失敗: {futures[future]}: {type(e).__name__}: {e}")
+    elapsed = time.perf_counter() - start
+    print(f"[export] {n_files} files / {n_segments_written} segments in {elapsed:.1f}s "
+          f"({n_files / max(elapsed, 1e-9):.1f} files/s, {workers} workers, 音源なし {len(missing)})")
+    return n_files, n_segments_written